@@ -0,0 +1,98 @@
+import os
+import threading
+from api.config import get_settings
+from api.repository import get_repository
+from api.worker import (
+    enqueue_task, plan_operations, load_bgm_samples, warm_up_encoder
+)
+
+settings = get_settings()
+
+
+def _plan_duration(videos) -> float:
+    """Duration used for the shared plan: the longest member (members clamp cuts to their own length)."""
+    durations = [float(v["duration"]) for v in videos if v.get("duration")]
+    if durations:
+        return max(durations)
+    for video in videos:
+        if os.path.exists(video["original_path"]):
+            from moviepy.editor import VideoFileClip
+            with VideoFileClip(video["original_path"]) as clip:
+                return clip.duration
+    return 0.0
+
+
+def run_batch(batch_id: str, task_ids, user_id: str, prompt: str, max_concurrency: int):
+    """
+    Renders all tasks of a batch as one unit: the prompt is planned once,
+    background music is decoded once and the encoder is warmed up once,
+    then members go through the fair-share scheduler, at most
+    `max_concurrency` of them queued or running at a time.
+    """
+    repo = get_repository()
+    try:
+        tasks = repo.find("tasks", {"batch_id": batch_id}, "id", embed={"videos": "duration, metadata, original_path"})
+        videos_by_task = {t["id"]: t["videos"] for t in tasks if t.get("videos")}
+        videos = list(videos_by_task.values())
+
+        print(f"Planning batch {batch_id} ({len(task_ids)} videos) with prompt: {prompt}")
+        operations = plan_operations(prompt, _plan_duration(videos))
+
+        shared = {}
+        if any(op.get("type") == "bg_music" for op in operations):
+            shared["bgm"] = load_bgm_samples()
+        warm_up_encoder()
+    except Exception as e:
+        print(f"Batch {batch_id} setup failed: {e}")
+        repo.update("tasks", {
+            "status": "failed",
+            "error_message": f"Batch setup failed: {e}"
+        }, {"batch_id": batch_id})
+        return
+
+    window = threading.BoundedSemaphore(max_concurrency)
+    for task_id in task_ids:
+        window.acquire()
+        enqueue_task(task_id, user_id, operations, shared, on_done=window.release, video=videos_by_task.get(task_id))
+    for _ in range(max_concurrency):
+        window.acquire()
+    print(f"Batch {batch_id} finished")
+
+
+def start_batch_thread(batch_id: str, task_ids, user_id: str, prompt: str, max_concurrency: int = None):
+    max_concurrency = max(1, min(max_concurrency or settings.BATCH_MAX_CONCURRENCY, len(task_ids)))
+    thread = threading.Thread(target=run_batch, args=(batch_id, task_ids, user_id, prompt, max_concurrency))
+    thread.daemon = True
+    thread.start()
+
+
+def summarize_batch(tasks):
+    """Aggregate status/progress of a batch's task rows."""
+    counts = {}
+    for t in tasks:
+        counts[t["status"]] = counts.get(t["status"], 0) + 1
+
+    total = len(tasks)
+    running = counts.get("pending", 0) + counts.get("processing", 0)
+    if running:
+        status = "pending" if counts.get("pending", 0) == total else "processing"
+    elif counts.get("awaiting_confirmation"):
+        # Previews are ready; the remaining members wait for the user
+        status = "awaiting_confirmation"
+    elif counts.get("failed", 0) == total:
+        status = "failed"
+    elif counts.get("cancelled", 0) == total:
+        status = "cancelled"
+    elif counts.get("failed"):
+        status = "completed_with_errors"
+    elif counts.get("cancelled"):
+        status = "partially_cancelled"
+    else:
+        status = "completed"
+
+    return {
+        "status": status,
+        "total": total,
+        "counts": counts,
+        "progress": (sum(float(t.get("progress") or 0) for t in tasks) / total) if total else 0.0,
+    }
@@ -0,0 +1,155 @@
+import time
+import threading
+from functools import lru_cache
+from proglog import ProgressBarLogger
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task's worker thread once the task has been cancelled."""
+
+
+class CancelToken:
+    """
+    Cancellation flag of one task. The worker calls check() between stages
+    and, through CancelLogger, on every frame moviepy writes. Subprocesses
+    registered with track() are killed as soon as the task is cancelled.
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.started_at = time.monotonic()
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        # Set when the task is stopped by the system (e.g. the memory watchdog) rather than by its user
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise TaskCancelled(f"Task {self.task_id} was cancelled")
+
+    def track(self, proc):
+        with self._lock:
+            self._processes.add(proc)
+        if self._event.is_set():
+            self._kill(proc)
+
+    def untrack(self, proc):
+        with self._lock:
+            self._processes.discard(proc)
+
+    def pids(self):
+        """Pids of the tracked subprocesses (the task's ffmpeg encoders)."""
+        with self._lock:
+            return [proc.pid for proc in self._processes]
+
+    def cancel(self, reason: str = None):
+        if reason and not self._event.is_set():
+            self.reason = reason
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for proc in processes:
+            self._kill(proc)
+
+    @staticmethod
+    def _kill(proc):
+        try:
+            if proc.poll() is None:
+                proc.kill()
+        except Exception as e:
+            print(f"Failed to kill process {proc.pid}: {e}")
+
+
+class CancelLogger(ProgressBarLogger):
+    """Silent moviepy logger that aborts a write as soon as its task is cancelled."""
+
+    def __init__(self, token: CancelToken):
+        super().__init__()
+        self.token = token
+
+    def __call__(self, **kw):
+        self.token.check()
+        super().__call__(**kw)
+
+
+class CancellationRegistry:
+    """
+    Tokens of running tasks plus counters of what cancelling saved: tasks
+    cancelled while queued or running, and the predicted render seconds that
+    were never spent (the whole estimate for queued tasks, the remainder for
+    running ones).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._cancelled = set()
+        self.cancelled_queued = 0
+        self.cancelled_running = 0
+        self.render_seconds_freed = 0.0
+
+    def token(self, task_id: str) -> CancelToken:
+        with self._lock:
+            token = self._tokens.get(task_id)
+            if token is None:
+                token = self._tokens[task_id] = CancelToken(task_id)
+                if task_id in self._cancelled:
+                    token.cancel()
+            return token
+
+    def release(self, task_id: str):
+        with self._lock:
+            self._tokens.pop(task_id, None)
+            self._cancelled.discard(task_id)
+
+    def cancel(self, task_id: str, queued_estimate: float = None, running_estimate: float = None):
+        """
+        Cancels `task_id`. `queued_estimate` is the predicted render time of a
+        task removed from the queue, `running_estimate` that of a running one.
+        """
+        with self._lock:
+            token = self._tokens.get(task_id)
+            if queued_estimate is not None:
+                self.cancelled_queued += 1
+                self.render_seconds_freed += queued_estimate
+            else:
+                # May be between leaving the queue and taking its token
+                self._cancelled.add(task_id)
+            if token is not None and queued_estimate is None:
+                self.cancelled_running += 1
+                if running_estimate is not None:
+                    self.render_seconds_freed += max(0.0, running_estimate - (time.monotonic() - token.started_at))
+        if token is not None:
+            token.cancel()
+
+    def pids(self, task_id: str):
+        """Pids of the subprocesses `task_id` runs (see CancelToken.track), [] if unknown."""
+        with self._lock:
+            token = self._tokens.get(task_id)
+        return token.pids() if token is not None else []
+
+    def abort(self, task_id: str, reason: str):
+        """Stops a running task as a failure with `reason` (not counted as a user cancellation)."""
+        with self._lock:
+            token = self._tokens.get(task_id)
+        if token is not None:
+            token.cancel(reason)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "running_tasks": len(self._tokens),
+                "cancelled_queued": self.cancelled_queued,
+                "cancelled_running": self.cancelled_running,
+                "render_seconds_freed": round(self.render_seconds_freed, 1),
+            }
+
+
+@lru_cache()
+def get_cancellations() -> CancellationRegistry:
+    return CancellationRegistry()
@@ -0,0 +1,121 @@
+import os
+import json
+import shutil
+import subprocess
+from api.encoder_profiles import ffmpeg_params
+
+PLAN_FILE = "plan.json"
+
+
+def source_fingerprint(path: str) -> dict:
+    """Identifies the input a checkpoint was rendered from; a replaced file invalidates it."""
+    st = os.stat(path)
+    return {"path": path, "size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+class RenderCheckpoint:
+    """
+    Scratch directory of one task's final render: plan.json (the resolved
+    operations, encoder settings and segment length) plus one file per
+    completed segment. Files only appear under their final name once fully
+    written, so whatever is on disk after a crash is usable.
+    """
+
+    def __init__(self, root: str, task_id: str):
+        self.dir = os.path.join(root, task_id)
+
+    def load_plan(self):
+        try:
+            with open(os.path.join(self.dir, PLAN_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_plan(self, plan: dict):
+        os.makedirs(self.dir, exist_ok=True)
+        path = os.path.join(self.dir, PLAN_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(plan, f)
+        os.replace(path + ".tmp", path)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def segment(self, index: int) -> str:
+        return self.path(f"segment_{index:05d}.mp4")
+
+    def completed_segments(self) -> int:
+        count = 0
+        while os.path.exists(self.segment(count)):
+            count += 1
+        return count
+
+    def clear(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def segment_bounds(duration: float, fps: float, segment_seconds: float):
+    """[(start, end)] covering `duration`, cut on frame boundaries so segments join without gaps."""
+    frames_per_segment = max(1, int(round(segment_seconds * fps)))
+    total_frames = int(duration * fps + 1e-6)
+    bounds = []
+    for first in range(0, total_frames, frames_per_segment):
+        last = min(first + frames_per_segment, total_frames)
+        bounds.append((first / fps, last / fps))
+    return bounds
+
+
+def render_segmented(final_clip, output_path: str, checkpoint: RenderCheckpoint, encoder: dict,
+                     segment_seconds: float, on_segment=None, logger=None):
+    """
+    Writes `final_clip` to `output_path` as independently encoded video
+    segments plus one audio track, skipping every segment already in
+    `checkpoint`, then joins them with a stream copy.
+    `on_segment(done, total)` is called after each segment; `logger` is
+    handed to moviepy (a CancelLogger stops the render mid-segment).
+    Returns (segment count, segments reused from the checkpoint).
+    """
+    fps = final_clip.fps or 24
+    bounds = segment_bounds(final_clip.duration, fps, segment_seconds)
+    params = ffmpeg_params(encoder, fps)
+    os.makedirs(checkpoint.dir, exist_ok=True)
+
+    done = checkpoint.completed_segments()
+    for index in range(done, len(bounds)):
+        start, end = bounds[index]
+        target = checkpoint.segment(index)
+        partial = checkpoint.path(f"partial_{index:05d}.mp4")
+        final_clip.subclip(start, end).write_videofile(
+            partial, fps=fps, codec="libx264", audio=False,
+            preset=encoder["preset"], threads=encoder["threads"], ffmpeg_params=params,
+            verbose=False, logger=logger
+        )
+        os.replace(partial, target)
+        if on_segment:
+            on_segment(index + 1, len(bounds))
+
+    # The audio track is cheap but encoded in one piece: AAC priming at
+    # segment joins would otherwise be audible
+    audio_path = None
+    if final_clip.audio:
+        audio_path = checkpoint.path("audio.m4a")
+        if not os.path.exists(audio_path):
+            partial = checkpoint.path("partial_audio.m4a")
+            final_clip.audio.write_audiofile(partial, codec="aac", verbose=False, logger=logger)
+            os.replace(partial, audio_path)
+
+    concat_list = checkpoint.path("segments.txt")
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for index in range(len(bounds)):
+            f.write(f"file '{os.path.abspath(checkpoint.segment(index))}'\n")
+
+    from moviepy.config import get_setting
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+           "-f", "concat", "-safe", "0", "-i", concat_list]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", output_path]
+    proc = subprocess.run(cmd, stderr=subprocess.PIPE, timeout=3600)
+    if proc.returncode != 0:
+        raise Exception(f"Joining segments failed: {proc.stderr.decode(errors='replace')[-500:]}")
+    return len(bounds), done
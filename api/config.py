@@ -12,12 +12,128 @@ class Settings(BaseSettings):
     DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "")
     DEEPSEEK_BASE_URL: str = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
-    
+    # Where videos/tasks/results live: "supabase" or "sqlite" (local file at SQLITE_PATH)
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "supabase")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(__file__), "local.db"))
+    # Gemini models in order of preference for scene analysis
+    GEMINI_MODELS: str = os.getenv("GEMINI_MODELS", "gemini-1.5-flash-latest,gemini-1.5-flash,gemini-pro")
+    # Start a hedged request on the next model once a call runs this many times
+    # longer than the model's usual latency (0 disables hedging)
+    GEMINI_HEDGE_FACTOR: float = float(os.getenv("GEMINI_HEDGE_FACTOR", "2.0"))
+
+    # Circuit breakers shared by all LLM calls
+    LLM_BREAKER_FAILURES: int = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+    LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+    LLM_BREAKER_MAX_COOLDOWN: float = float(os.getenv("LLM_BREAKER_MAX_COOLDOWN", "900"))
+
+    # Shared LLM clients: max concurrent upstream calls per provider
+    LLM_MAX_CONCURRENCY_DEEPSEEK: int = int(os.getenv("LLM_MAX_CONCURRENCY_DEEPSEEK", "8"))
+    LLM_MAX_CONCURRENCY_GEMINI: int = int(os.getenv("LLM_MAX_CONCURRENCY_GEMINI", "4"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+
+    # Edit task scheduling: concurrent render slots and how fast queued tasks age
+    # (cost units per second waited; 1 unit = one minute of predicted render time)
+    WORKER_SLOTS: int = int(os.getenv("WORKER_SLOTS", str(os.cpu_count() or 2)))
+    # Memory admission control: RAM (MB) the estimated peaks of running renders may add up to
+    # (0 = 60% of physical memory), process RSS at which the largest render is stopped (0 = 85%),
+    # and how far over its estimate a render running alone may go (0 disables)
+    MEMORY_BUDGET_MB: int = int(os.getenv("MEMORY_BUDGET_MB", "0"))
+    MEMORY_HARD_LIMIT_MB: int = int(os.getenv("MEMORY_HARD_LIMIT_MB", "0"))
+    MEMORY_TASK_LIMIT_FACTOR: float = float(os.getenv("MEMORY_TASK_LIMIT_FACTOR", "3"))
+    MEMORY_SAMPLE_INTERVAL: float = float(os.getenv("MEMORY_SAMPLE_INTERVAL", "0.5"))
+    # Load media/LLM libraries and warm the encoder in the background at startup instead of on the first task
+    WORKER_PREWARM: bool = os.getenv("WORKER_PREWARM", "true").lower() in ("1", "true", "yes")
+    SCHEDULER_AGING_RATE: float = float(os.getenv("SCHEDULER_AGING_RATE", "0.05"))
+    # "fair" (weighted fair queuing by plan) or "sjf" (shortest predicted job first, with aging)
+    SCHEDULER_POLICY: str = os.getenv("SCHEDULER_POLICY", "fair")
+    # Recorded per-task render timings the ETA model is trained on
+    TASK_TIMINGS_LOG: str = os.getenv("TASK_TIMINGS_LOG", os.path.join(os.path.dirname(__file__), "task_timings.jsonl"))
+
+    # Batch edits: member renders running at once, and max videos per batch
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "2"))
+    BATCH_MAX_VIDEOS: int = int(os.getenv("BATCH_MAX_VIDEOS", "100"))
+
+    # Two-phase rendering: low-res preview published before the final render
+    # (per task: parameters.preview, parameters.final_render = "auto" | "on_confirm")
+    PREVIEW_ENABLED: bool = os.getenv("PREVIEW_ENABLED", "true").lower() in ("1", "true", "yes")
+    PREVIEW_HEIGHT: int = int(os.getenv("PREVIEW_HEIGHT", "360"))
+    PREVIEW_FPS: int = int(os.getenv("PREVIEW_FPS", "15"))
+
+    # Default time budget for an edit task; overridable per task via parameters.deadline_seconds
+    TASK_DEADLINE_SECONDS: float = float(os.getenv("TASK_DEADLINE_SECONDS", "1800"))
+
+    # Encoder profile (fast|balanced|archive|auto) when a task doesn't pick one via
+    # parameters.encoder_profile; queued tasks per slot at which renders step down to a faster profile
+    ENCODER_PROFILE: str = os.getenv("ENCODER_PROFILE", "auto")
+    ENCODER_BACKLOG_PER_SLOT: float = float(os.getenv("ENCODER_BACKLOG_PER_SLOT", "2"))
+
+    # HLS (fMP4) packaging of final outputs into OUTPUT_DIR/hls/<task_id>/ (per task: parameters.hls)
+    HLS_ENABLED: bool = os.getenv("HLS_ENABLED", "false").lower() in ("1", "true", "yes")
+    HLS_SEGMENT_SECONDS: float = float(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+
+    # Checkpointed final renders: renders of at least RENDER_CHECKPOINT_MIN_SECONDS are encoded in
+    # RENDER_SEGMENT_SECONDS segments kept under RENDER_CHECKPOINT_DIR, so a restarted worker resumes them
+    RENDER_CHECKPOINTS: bool = os.getenv("RENDER_CHECKPOINTS", "true").lower() in ("1", "true", "yes")
+    RENDER_CHECKPOINT_DIR: str = os.getenv("RENDER_CHECKPOINT_DIR", os.path.join(os.path.dirname(__file__), "render_checkpoints"))
+    RENDER_SEGMENT_SECONDS: float = float(os.getenv("RENDER_SEGMENT_SECONDS", "30"))
+    RENDER_CHECKPOINT_MIN_SECONDS: float = float(os.getenv("RENDER_CHECKPOINT_MIN_SECONDS", "60"))
+    # Render auto_scene_cut results as a cut list: ffmpeg encodes each scene of the source, then a stream copy joins them
+    CUT_LIST_RENDER: bool = os.getenv("CUT_LIST_RENDER", "true").lower() in ("1", "true", "yes")
+    # Re-queue tasks left pending/processing by a previous process on startup
+    RESUME_TASKS_ON_STARTUP: bool = os.getenv("RESUME_TASKS_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+    # Disk lifecycle: per-task scratch (may be a tmpfs), TTLs (seconds) of stale files,
+    # free space floor below which new work is refused and HLS packages are evicted, per-plan quotas
+    SCRATCH_DIR: str = os.getenv("SCRATCH_DIR", os.path.join(os.path.dirname(__file__), "scratch"))
+    SCRATCH_TTL: float = float(os.getenv("SCRATCH_TTL", str(6 * 3600)))
+    CHECKPOINT_TTL: float = float(os.getenv("CHECKPOINT_TTL", str(48 * 3600)))
+    PREVIEW_TTL: float = float(os.getenv("PREVIEW_TTL", str(7 * 24 * 3600)))
+    # Final outputs (edited_*) are kept unless opted in: evicted once not served for OUTPUT_TTL
+    # seconds (0: never), and/or least recently served first below the free space floor
+    OUTPUT_TTL: float = float(os.getenv("OUTPUT_TTL", "0"))
+    OUTPUT_EVICT_ON_PRESSURE: bool = os.getenv("OUTPUT_EVICT_ON_PRESSURE", "false").lower() in ("1", "true", "yes")
+    DISK_MIN_FREE_MB: int = int(os.getenv("DISK_MIN_FREE_MB", "2048"))
+    STORAGE_QUOTA_FREE_MB: int = int(os.getenv("STORAGE_QUOTA_FREE_MB", "2048"))
+    STORAGE_QUOTA_PREMIUM_MB: int = int(os.getenv("STORAGE_QUOTA_PREMIUM_MB", "20480"))
+    STORAGE_QUOTA_ENTERPRISE_MB: int = int(os.getenv("STORAGE_QUOTA_ENTERPRISE_MB", "102400"))
+    STORAGE_SWEEP_INTERVAL: float = float(os.getenv("STORAGE_SWEEP_INTERVAL", "600"))
+
+    # Library index: manifest of UPLOAD_DIR diffed by /api/video/sync; with LIBRARY_WATCH, inotify
+    # events name the changed files so syncs don't rescan the directory (Linux only)
+    LIBRARY_MANIFEST: str = os.getenv("LIBRARY_MANIFEST", os.path.join(os.path.dirname(__file__), "library_manifest.json"))
+    LIBRARY_WATCH: bool = os.getenv("LIBRARY_WATCH", "true").lower() in ("1", "true", "yes")
+
+    # In-memory LRU for small media files (thumbnails, playlists) served from /uploads and /outputs
+    MEDIA_CACHE_BYTES: int = int(os.getenv("MEDIA_CACHE_BYTES", str(32 * 1024 * 1024)))
+    MEDIA_CACHE_MAX_FILE: int = int(os.getenv("MEDIA_CACHE_MAX_FILE", str(512 * 1024)))
+
+    # On-demand sampling profiler (per task: parameters.profile, or POST /api/video/task/{id}/profile);
+    # off unless enabled, samples every PROFILER_INTERVAL_MS, never longer than PROFILER_MAX_SECONDS
+    PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILER_INTERVAL_MS: float = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+    PROFILER_MAX_SECONDS: float = float(os.getenv("PROFILER_MAX_SECONDS", "600"))
+
     # Video Generation (1189.xin)
     VIDEO_GEN_API_KEY: str = os.getenv("VIDEO_GEN_API_KEY", "")
     VIDEO_GEN_HOST: str = os.getenv("VIDEO_GEN_HOST", "1189.xin")
     VIDEO_GEN_MODEL: str = os.getenv("VIDEO_GEN_MODEL", "grok-video-3")
-    
+    # Override the full base URL (e.g. http://127.0.0.1:9100 for a local mock)
+    VIDEO_GEN_BASE_URL: str = os.getenv("VIDEO_GEN_BASE_URL", "")
+    # Seconds a non-final status stays cached before we ask upstream again
+    VIDEO_GEN_STATUS_TTL: float = float(os.getenv("VIDEO_GEN_STATUS_TTL", "5"))
+    # Interval of the server-side status poller, 0 disables it
+    VIDEO_GEN_POLL_INTERVAL: float = float(os.getenv("VIDEO_GEN_POLL_INTERVAL", "0"))
+    VIDEO_GEN_STATUS_STORE: str = os.getenv("VIDEO_GEN_STATUS_STORE", os.path.join(os.path.dirname(__file__), "gen_status.json"))
+
+    # Ingest of finished generated videos into the library
+    VIDEO_GEN_AUTO_INGEST: bool = os.getenv("VIDEO_GEN_AUTO_INGEST", "true").lower() in ("1", "true", "yes")
+    # Interval at which jobs waiting for ingest are polled; the poller starts with the first one
+    INGEST_POLL_INTERVAL: float = float(os.getenv("INGEST_POLL_INTERVAL", "10"))
+    INGEST_STORE: str = os.getenv("INGEST_STORE", os.path.join(os.path.dirname(__file__), "ingest_jobs.json"))
+    INGEST_MAX_JOBS: int = int(os.getenv("INGEST_MAX_JOBS", "2"))
+    INGEST_PARALLEL_PARTS: int = int(os.getenv("INGEST_PARALLEL_PARTS", "4"))
+    INGEST_SEGMENT_SIZE: int = int(os.getenv("INGEST_SEGMENT_SIZE", str(8 * 1024 * 1024)))
+
     def __init__(self, **data):
         super().__init__(**data)
         # Fallback if env loaded placeholder
@@ -36,5 +152,5 @@ def get_settings():
     return Settings()
 
 # Ensure directories exist
-os.makedirs(Settings().UPLOAD_DIR, exist_ok=True)
-os.makedirs(Settings().OUTPUT_DIR, exist_ok=True)
+os.makedirs(get_settings().UPLOAD_DIR, exist_ok=True)
+os.makedirs(get_settings().OUTPUT_DIR, exist_ok=True)
@@ -0,0 +1,178 @@
+import os
+import json
+import threading
+from collections import deque
+from functools import lru_cache
+from api.config import get_settings
+
+settings = get_settings()
+
+REFERENCE_PIXELS = 1280 * 720
+
+# Prior weights (seconds) used until enough timings have been recorded:
+# fixed overhead, per second of 720p output, per input second, extra for
+# scene-cut compositing, Gemini round trip, background music mixing.
+# (numpy is imported where the model is used, not when the API imports this module)
+PRIOR_WEIGHTS = [8.0, 1.0, 0.05, 0.5, 45.0, 0.05]
+FEATURE_NAMES = ["overhead", "output_720p_seconds", "input_seconds", "scene_cut_720p_seconds", "ai_scene_cut", "bg_music_seconds"]
+
+
+def build_features(duration: float, width: int = None, height: int = None, operations=None, output_duration: float = None):
+    """Feature vector for a render of `duration` seconds at width x height with `operations`."""
+    duration = float(duration or 0)
+    scale = ((width or 1280) * (height or 720)) / REFERENCE_PIXELS
+    operations = operations or []
+    types = {op.get("type") for op in operations}
+
+    if output_duration is None:
+        # Rough output length from the plan itself
+        output_duration = duration
+        for op in operations:
+            if op.get("type") == "subclip":
+                start = float(op.get("start", 0) or 0)
+                end = float(op.get("end", output_duration) or output_duration)
+                output_duration = max(0.0, min(end, output_duration) - max(0.0, start))
+            elif op.get("type") == "speed":
+                factor = float(op.get("factor", 1.0) or 1.0)
+                if factor > 0:
+                    output_duration /= factor
+
+    ai_scene = any(op.get("type") == "auto_scene_cut" and op.get("method", "ai") == "ai" for op in operations)
+    return [
+        1.0,
+        output_duration * scale,
+        duration,
+        output_duration * scale if "auto_scene_cut" in types else 0.0,
+        1.0 if ai_scene else 0.0,
+        output_duration if "bg_music" in types else 0.0,
+    ]
+
+
+def features_from_video(video: dict, operations=None):
+    """Features from a `videos` row (duration column and probe metadata from register_video)."""
+    metadata = (video or {}).get("metadata") or {}
+    duration = (video or {}).get("duration") or metadata.get("duration") or 60.0
+    return build_features(duration, metadata.get("width"), metadata.get("height"), operations)
+
+
+class RenderCostModel:
+    """
+    Predicts render wall time from probed duration, resolution and planned
+    operations. A ridge regression pulled towards PRIOR_WEIGHTS, refit from
+    the recorded timings in TASK_TIMINGS_LOG every `refit_every` samples.
+    Tracks the error of the predictions shown to users (made at enqueue,
+    refined once the plan is known).
+    """
+
+    def __init__(self, log_path: str, ridge: float = 5.0, refit_every: int = 10, max_samples: int = 2000):
+        self.log_path = log_path
+        self.ridge = ridge
+        self.refit_every = refit_every
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=max_samples)
+        self._weights = list(PRIOR_WEIGHTS)
+        self._since_fit = 0
+        self._expected = {}  # task_id -> prediction made at enqueue
+        self._errors = deque(maxlen=500)
+        self._load()
+
+    def _load(self):
+        if not self.log_path or not os.path.exists(self.log_path):
+            return
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._samples.append((record["features"], record["seconds"]))
+            self._fit()
+        except Exception as e:
+            print(f"Failed to load task timings: {e}")
+
+    def _fit(self):
+        import numpy as np
+        if not self._samples:
+            return
+        X = np.array([s[0] for s in self._samples], dtype=float)
+        y = np.array([s[1] for s in self._samples], dtype=float)
+        # Ridge towards the prior: (X'X + λI) w = X'y + λ w0
+        A = X.T @ X + self.ridge * np.eye(X.shape[1])
+        b = X.T @ y + self.ridge * np.array(PRIOR_WEIGHTS)
+        self._weights = np.clip(np.linalg.solve(A, b), 0.0, None).tolist()
+        self._since_fit = 0
+
+    def predict(self, features) -> float:
+        with self._lock:
+            return max(1.0, sum(w * f for w, f in zip(self._weights, features)))
+
+    def unplanned_features(self, features):
+        """
+        `features` of a task whose plan isn't known yet (no operations), with
+        the plan-dependent ones set to their average share in the recorded
+        timings, so an unplanned task is predicted like the average task
+        rather than like a plain trim.
+        """
+        with self._lock:
+            samples = [s[0] for s in self._samples]
+        features = list(features)
+        if not samples:
+            return features
+
+        def share(i, j):
+            return sum(s[i] / s[j] for s in samples if s[j]) / len(samples)
+
+        features[3] = share(3, 1) * features[1]
+        features[4] = sum(s[4] for s in samples) / len(samples)
+        features[5] = share(5, 2) * features[2]
+        return features
+
+    def expect(self, task_id: str, features) -> float:
+        """Predicts and remembers the estimate so its error can be reported later."""
+        predicted = self.predict(features)
+        with self._lock:
+            self._expected[task_id] = predicted
+        return predicted
+
+    def discard(self, task_id: str):
+        """Drops the estimate of a task that will never report a timing (failed/deleted)."""
+        with self._lock:
+            self._expected.pop(task_id, None)
+
+    def expected(self, task_id: str):
+        with self._lock:
+            return self._expected.get(task_id)
+
+    def observe(self, task_id: str, features, seconds: float):
+        """Records an actual render time; returns the prediction error (or None)."""
+        error = None
+        with self._lock:
+            predicted = self._expected.pop(task_id, None)
+            if predicted is not None:
+                error = {"predicted_seconds": round(predicted, 2), "actual_seconds": round(seconds, 2),
+                         "relative_error": round(abs(predicted - seconds) / max(seconds, 1.0), 3)}
+                self._errors.append(error["relative_error"])
+            self._samples.append((list(features), seconds))
+            self._since_fit += 1
+            if self._since_fit >= self.refit_every:
+                self._fit()
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"task_id": task_id, "features": list(features), "seconds": seconds}) + "\n")
+            except Exception as e:
+                print(f"Failed to record task timing: {e}")
+        return error
+
+    def snapshot(self):
+        with self._lock:
+            errors = sorted(self._errors)
+            return {
+                "samples": len(self._samples),
+                "weights": dict(zip(FEATURE_NAMES, [round(float(w), 4) for w in self._weights])),
+                "mean_relative_error": round(sum(errors) / len(errors), 3) if errors else None,
+                "p90_relative_error": errors[int(0.9 * (len(errors) - 1))] if errors else None,
+            }
+
+
+@lru_cache()
+def get_cost_model() -> RenderCostModel:
+    return RenderCostModel(settings.TASK_TIMINGS_LOG)
@@ -0,0 +1,203 @@
+import os
+import bisect
+import subprocess
+from moviepy.config import get_setting
+from moviepy.video.VideoClip import VideoClip
+from moviepy.audio.AudioClip import concatenate_audioclips
+from api.encoder_profiles import ffmpeg_params
+
+# Every scene fades in from and out to black over this long
+FADE_SECONDS = 0.5
+# Shorter scenes are dropped
+MIN_SCENE_SECONDS = 0.5
+# Source skipped between two scenes beyond which ffmpeg seeks instead of decoding through
+SEEK_GAP_SECONDS = 10.0
+
+
+def snap_cuts(scenes, duration: float, fps: float):
+    """
+    Scenes [(start, end)] clamped to the clip, without the ones shorter than
+    MIN_SCENE_SECONDS, with both ends moved to the nearest frame boundary so
+    scenes encoded separately add up to the same duration as their audio.
+    """
+    last_frame = int(duration * fps + 1e-6)
+    cuts = []
+    for start, end in scenes:
+        start = max(0, min(float(start), duration))
+        end = max(0, min(float(end), duration))
+        if end - start < MIN_SCENE_SECONDS:
+            continue
+        first, last = int(round(start * fps)), min(int(round(end * fps)), last_frame)
+        if last > first:
+            cuts.append((first / fps, last / fps))
+    return cuts
+
+
+class CutListClip(VideoClip):
+    """
+    The scenes `cuts` of `source` back to back, each faded in and out over
+    `fade` seconds: the clip concatenate_videoclips(method="compose") made of
+    faded subclips, without compositing every frame onto a canvas. A frame
+    is found by bisecting the scene offsets (O(log scenes)) and frames outside
+    the fade windows are the source's, untouched. The audio is the scenes'
+    audio concatenated, unfaded as before.
+    """
+
+    def __init__(self, source, cuts, fade: float = FADE_SECONDS):
+        self.source = source
+        self.cuts = cuts
+        self.fade = fade
+        # Output time at which each scene starts, plus the total duration
+        self.offsets = [0.0]
+        for start, end in cuts:
+            self.offsets.append(self.offsets[-1] + end - start)
+        VideoClip.__init__(self, duration=self.offsets[-1])
+        # Kept in the instance dict: copies that keep the frames (set_audio, ...) share it, see cut_list_of
+        self.make_frame = self._frame
+        self.size = source.size
+        self.fps = source.fps
+        if source.audio is not None:
+            self.audio = concatenate_audioclips([source.audio.subclip(start, end) for start, end in cuts])
+
+    def _frame(self, t):
+        index = max(0, min(bisect.bisect_right(self.offsets, t) - 1, len(self.cuts) - 1))
+        start, end = self.cuts[index]
+        local = t - self.offsets[index]
+        frame = self.source.get_frame(start + local)
+        if local >= self.fade and end - start - local >= self.fade:
+            return frame
+        # Same arithmetic as vfx.fadein followed by vfx.fadeout
+        if local < self.fade:
+            frame = (local / self.fade) * frame
+        if end - start - local < self.fade:
+            frame = ((end - start - local) / self.fade) * frame
+        return frame.astype("uint8")
+
+
+def cut_list_of(clip, source):
+    """The CutListClip over `source` whose frames `clip` shows unchanged (its audio may differ), or None."""
+    cut = getattr(getattr(clip, "make_frame", None), "__self__", None)
+    if isinstance(cut, CutListClip) and cut.source is source and clip.duration == cut.duration:
+        return cut
+    return None
+
+
+def group_cuts(cuts, fps: float, max_seconds: float = None):
+    """
+    Splits `cuts` into runs ffmpeg can render in one pass over the source:
+    each run goes forward through the source, skips no more than
+    SEEK_GAP_SECONDS between scenes (seeking is cheaper than decoding more)
+    and, with `max_seconds`, is cut after max_seconds of output.
+    Returns [[(start, end)]].
+    """
+    groups = []
+    for start, end in cuts:
+        group = groups[-1] if groups else None
+        if (group is None or start < group[-1][1] - 0.5 / fps or start - group[-1][1] > SEEK_GAP_SECONDS
+                or (max_seconds and sum(e - s for s, e in group) >= max_seconds)):
+            groups.append([(start, end)])
+        else:
+            group.append((start, end))
+    return groups
+
+
+def group_filter(group, fps: float, fade: float) -> str:
+    """
+    Filter chain for one run of group_cuts(), timestamps relative to its
+    first scene: keeps the frames of its scenes, lays them back to back
+    and fades only inside each scene's fade windows (timeline `enable`).
+    """
+    origin = group[0][0]
+    half = 0.5 / fps
+    keep = "+".join(f"between(t,{s - origin - half:.6f},{e - origin - half:.6f})" for s, e in group)
+    # After fps the time base is 1/fps, so frame numbers are exact timestamps
+    chain = [f"fps={fps}", f"select='{keep}'", "setpts=N"]
+    offset = 0.0
+    for start, end in group:
+        length = end - start
+        window = f"gte(t,{offset - half:.6f})*lt(t,{offset + length - half:.6f})"
+        chain.append(f"fade=t=in:st={offset:.6f}:d={fade}:enable='{window}'")
+        chain.append(f"fade=t=out:st={offset + max(0.0, length - fade):.6f}:d={fade}:enable='{window}'")
+        offset += length
+    return ",".join(chain)
+
+
+def _run(cmd, cancel=None):
+    proc = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+    if cancel:
+        cancel.track(proc)
+    try:
+        _, stderr = proc.communicate(timeout=3600)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        if cancel:
+            cancel.untrack(proc)
+    if cancel:
+        cancel.check()
+    if proc.returncode != 0:
+        raise Exception(f"Cut list render failed: {stderr.decode(errors='replace')[-500:]}")
+
+
+def render_cut_list(final_clip, cut: CutListClip, output_path: str, encoder: dict, tmp_dir: str,
+                    checkpoint=None, segment_seconds: float = None, on_segment=None, cancel=None, logger=None):
+    """
+    Writes `final_clip`, whose frames are `cut` (see cut_list_of), to
+    `output_path` without moviepy decoding a frame. The scenes are rendered
+    by ffmpeg straight from the source file, one pass per run of
+    group_cuts(): it seeks to the run, decodes forward, keeps the scenes'
+    frames and fades only the transition windows. Runs are joined by a
+    stream copy, with the audio of `final_clip` encoded in one piece (as
+    render_segmented does). Cost is linear in the source span covered plus
+    one seek per run, however many scenes there are.
+
+    With a `checkpoint` (RenderCheckpoint) runs are cut after
+    `segment_seconds` and kept there for a resumed render to reuse.
+    `on_segment(done, total)` is called after each run; `cancel` (a
+    CancelToken) kills ffmpeg when cancelled. Returns the number of runs.
+    """
+    fps = final_clip.fps or 24
+    params = ffmpeg_params(encoder, fps)
+    ffmpeg = get_setting("FFMPEG_BINARY")
+    work_dir = checkpoint.dir if checkpoint else tmp_dir
+    os.makedirs(work_dir, exist_ok=True)
+
+    groups = group_cuts(cut.cuts, fps, segment_seconds if checkpoint else None)
+    parts = []
+    for index, group in enumerate(groups):
+        target = os.path.join(work_dir, f"cuts_{index:05d}.mp4")
+        parts.append(target)
+        if not os.path.exists(target):
+            partial = os.path.join(work_dir, f"partial_cuts_{index:05d}.mp4")
+            start, end = group[0][0], group[-1][1]
+            frames = sum(int(round((e - s) * fps)) for s, e in group)
+            cmd = [ffmpeg, "-y", "-loglevel", "error", "-ss", f"{start:.6f}", "-t", f"{end - start:.6f}",
+                   "-i", cut.source.filename, "-an", "-vf", group_filter(group, fps, cut.fade),
+                   "-r", f"{fps}", "-frames:v", str(frames), "-c:v", "libx264", "-preset", encoder["preset"],
+                   "-pix_fmt", "yuv420p"] + params
+            if encoder.get("threads"):
+                cmd += ["-threads", str(encoder["threads"])]
+            _run(cmd + [partial], cancel)
+            os.replace(partial, target)
+        if on_segment:
+            on_segment(index + 1, len(groups))
+
+    audio_path = None
+    if final_clip.audio:
+        audio_path = os.path.join(work_dir, "audio.m4a")
+        if not checkpoint or not os.path.exists(audio_path):
+            partial = os.path.join(work_dir, "partial_audio.m4a")
+            final_clip.audio.write_audiofile(partial, codec="aac", verbose=False, logger=logger)
+            os.replace(partial, audio_path)
+
+    concat_list = os.path.join(work_dir, "cuts.txt")
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for path in parts:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", concat_list]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    _run(cmd + ["-c", "copy", "-movflags", "+faststart", output_path], cancel)
+    return len(groups)
@@ -0,0 +1,61 @@
+import os
+
+# Fastest first. keyint is the keyframe interval in seconds of output.
+PROFILES = {
+    "fast": {"preset": "veryfast", "crf": 26, "keyint": 4},
+    "balanced": {"preset": "medium", "crf": 23, "keyint": 2},
+    "archive": {"preset": "slow", "crf": 18, "keyint": 2},
+}
+ORDER = ["fast", "balanced", "archive"]
+
+# Sources above this many pixel-seconds (about ten minutes of 1080p) default to
+# "fast" in auto mode; a balanced encode of them would hold a slot for too long.
+LARGE_SOURCE_PIXEL_SECONDS = 1920 * 1080 * 600
+
+
+def choose_profile(requested: str = None, width: int = None, height: int = None, duration: float = None,
+                   queued: int = 0, running: int = 0, slots: int = 1, backlog_per_slot: float = 2.0):
+    """
+    Picks the encoder settings for one render.
+
+    `requested` is a profile name or "auto"/None. Auto picks "balanced",
+    or "fast" for very large sources. Whatever was picked then steps down
+    one profile per `backlog_per_slot` queued tasks per slot, so a long
+    queue trades some compression for bounded latency.
+
+    Threads are the CPUs divided over the renders running now.
+    Returns a dict that is stored as the result's quality_metrics.encoder.
+    """
+    slots = max(1, slots)
+    reasons = []
+    if requested in PROFILES:
+        name = requested
+        reasons.append("requested")
+    else:
+        name = "balanced"
+        if (width or 0) * (height or 0) * (duration or 0) > LARGE_SOURCE_PIXEL_SECONDS:
+            name = "fast"
+            reasons.append("large source")
+
+    if backlog_per_slot > 0:
+        steps = int(queued / slots / backlog_per_slot)
+        if steps and name != "fast":
+            name = ORDER[max(0, ORDER.index(name) - steps)]
+            reasons.append(f"backlog {queued} queued / {slots} slots")
+
+    profile = PROFILES[name]
+    return {
+        "profile": name,
+        "requested": requested or "auto",
+        "preset": profile["preset"],
+        "crf": profile["crf"],
+        "keyint": profile["keyint"],
+        "threads": max(1, (os.cpu_count() or 1) // max(1, running)),
+        "reason": ", ".join(reasons) or "default",
+    }
+
+
+def ffmpeg_params(encoder: dict, fps: float):
+    """Extra ffmpeg output arguments (CRF and GOP) for a choose_profile() result."""
+    gop = max(1, int(round((fps or 24) * encoder["keyint"])))
+    return ["-crf", str(encoder["crf"]), "-g", str(gop)]
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from api.config import get_settings
+from api.metrics import external_call
+
+settings = get_settings()
+
+# Upstream status values after which a generation job never changes again
+FINAL_STATES = ("success", "completed", "failed")
+# The poller stops watching an id after this many failed refreshes in a row (at once on a 4xx)
+MAX_POLL_FAILURES = 5
+# Ids the poller keeps fresh at most; beyond that lookups are served on demand only
+MAX_WATCHED = 1000
+
+
+class UpstreamStatusError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def get_base_url() -> str:
+    if settings.VIDEO_GEN_BASE_URL:
+        return settings.VIDEO_GEN_BASE_URL.rstrip("/")
+    return f"https://{settings.VIDEO_GEN_HOST}"
+
+
+def build_headers() -> dict:
+    # Ensure API key is pure ASCII
+    api_key = settings.VIDEO_GEN_API_KEY.strip()
+    try:
+        api_key.encode('ascii')
+    except UnicodeEncodeError:
+        api_key = ''.join([i for i in api_key if ord(i) < 128])
+
+    return {
+        'Accept': 'application/json',
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+
+
+def is_final(data) -> bool:
+    return isinstance(data, dict) and data.get("status") in FINAL_STATES
+
+
+class GenStatusCache:
+    """
+    Status lookups for video generation jobs.
+    Identical in-flight upstream queries are coalesced onto one request,
+    non-final statuses are cached for `ttl` seconds and final statuses are
+    moved into a permanent store (persisted to `store_path`).
+    """
+
+    def __init__(self, ttl: float, store_path: str = None, max_workers: int = 8):
+        self.ttl = ttl
+        self.store_path = store_path
+        self._lock = threading.Lock()
+        self._cache = {}      # task_id -> (fetched_at, data)
+        self._final = {}      # task_id -> data
+        self._inflight = {}   # task_id -> Future
+        self._watched = set() # non-final ids the poller keeps fresh
+        self._failures = {}   # task_id -> refreshes failed in a row
+        import requests
+        self._session = requests.Session()
+        # Explicitly disable proxies to avoid local proxy errors
+        self._session.trust_env = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gen-status")
+        self._poller = None
+        self._poll_interval = 0.0
+        self._watch_lookups = False
+        self._stop = threading.Event()
+        self._listeners = []
+        self.stats = {"upstream_calls": 0, "cache_hits": 0, "coalesced": 0}
+        self._load_store()
+
+    def _load_store(self):
+        if not self.store_path or not os.path.exists(self.store_path):
+            return
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                self._final = json.load(f)
+        except Exception as e:
+            print(f"Failed to load generation status store: {e}")
+
+    def _save_store(self):
+        if not self.store_path:
+            return
+        try:
+            tmp_path = f"{self.store_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._final, f, ensure_ascii=False)
+            os.replace(tmp_path, self.store_path)
+        except Exception as e:
+            print(f"Failed to save generation status store: {e}")
+
+    def _fetch_upstream(self, task_id: str):
+        url = f"{get_base_url()}/v1/video/query"
+        with self._lock:
+            self.stats["upstream_calls"] += 1
+        with external_call("video_gen", "query"):
+            response = self._session.get(url, params={"id": task_id}, headers=build_headers(), timeout=30)
+        if response.status_code != 200:
+            print(f"Status API Error ({response.status_code})")
+            raise UpstreamStatusError(response.status_code, f"External API Error: {response.text}")
+        return response.json()
+
+    def _watch_locked(self, task_id: str):
+        if task_id not in self._final and len(self._watched) < MAX_WATCHED:
+            self._watched.add(task_id)
+
+    def _refresh(self, task_id: str):
+        try:
+            try:
+                data = self._fetch_upstream(task_id)
+            except Exception as e:
+                client_error = isinstance(e, UpstreamStatusError) and 400 <= e.status_code < 500
+                with self._lock:
+                    failures = self._failures.get(task_id, 0) + 1
+                    if client_error or failures >= MAX_POLL_FAILURES:
+                        # Unknown id or an upstream that keeps failing: stop polling it
+                        self._watched.discard(task_id)
+                        self._failures.pop(task_id, None)
+                    else:
+                        self._failures[task_id] = failures
+                raise
+            became_final = False
+            with self._lock:
+                self._failures.pop(task_id, None)
+                if is_final(data):
+                    became_final = task_id not in self._final
+                    self._final[task_id] = data
+                    self._cache.pop(task_id, None)
+                    self._watched.discard(task_id)
+                    self._save_store()
+                else:
+                    self._cache[task_id] = (time.monotonic(), data)
+            if became_final:
+                self._notify(task_id, data)
+            return data
+        finally:
+            with self._lock:
+                self._inflight.pop(task_id, None)
+
+    def _notify(self, task_id: str, data):
+        for listener in list(self._listeners):
+            try:
+                listener(task_id, data)
+            except Exception as e:
+                print(f"Status listener failed for {task_id}: {e}")
+
+    def stats_snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def add_listener(self, listener):
+        """Registers `listener(task_id, data)`, called once when a job reaches a final status."""
+        self._listeners.append(listener)
+
+    def watch(self, task_id: str):
+        """Asks the poller to keep refreshing `task_id` until it is final."""
+        with self._lock:
+            self._watch_locked(task_id)
+
+    def peek_final(self, task_id: str):
+        with self._lock:
+            return self._final.get(task_id)
+
+    def _lookup(self, task_id: str, max_age: float):
+        """Returns (data, future); exactly one of them is set. Caller must hold no lock."""
+        with self._lock:
+            if task_id in self._final:
+                self.stats["cache_hits"] += 1
+                return self._final[task_id], None
+
+            cached = self._cache.get(task_id)
+            if cached and time.monotonic() - cached[0] < max_age:
+                self.stats["cache_hits"] += 1
+                return cached[1], None
+
+            if self._watch_lookups:
+                self._watch_locked(task_id)
+
+            future = self._inflight.get(task_id)
+            if future is not None:
+                self.stats["coalesced"] += 1
+            else:
+                future = self._executor.submit(self._refresh, task_id)
+                self._inflight[task_id] = future
+            return None, future
+
+    def _max_age(self) -> float:
+        if not self._watch_lookups:
+            return self.ttl
+        # The poller keeps watched ids fresh, tolerate one missed tick
+        return max(self.ttl, 2 * self._poll_interval)
+
+    def get(self, task_id: str):
+        """Blocking lookup of a single job status."""
+        data, future = self._lookup(task_id, self._max_age())
+        if future is not None:
+            data = future.result()
+        return data
+
+    def get_many(self, task_ids):
+        """
+        Blocking lookup of many job statuses. Upstream queries for ids that
+        miss the cache run concurrently. Returns {task_id: {"status", ...}}.
+        """
+        results = {}
+        pending = {}
+        max_age = self._max_age()
+        for task_id in dict.fromkeys(task_ids):
+            data, future = self._lookup(task_id, max_age)
+            if future is None:
+                results[task_id] = {"status": "success", "data": data}
+            else:
+                pending[task_id] = future
+
+        for task_id, future in pending.items():
+            try:
+                results[task_id] = {"status": "success", "data": future.result()}
+            except UpstreamStatusError as e:
+                results[task_id] = {"status": "failed", "error": e.detail, "code": e.status_code}
+            except Exception as e:
+                results[task_id] = {"status": "failed", "error": str(e), "code": 500}
+        return results
+
+    def start_poller(self, interval: float, watch_lookups: bool = True):
+        """
+        Keeps statuses of watched jobs fresh. With `watch_lookups` every id
+        clients look up is watched too, so they are served from cache;
+        without, only ids passed to watch() are (auto-ingest), and lookups
+        keep the plain TTL.
+        """
+        def loop():
+            while not self._stop.wait(interval):
+                with self._lock:
+                    ids = [i for i in self._watched if i not in self._inflight]
+                for task_id in ids:
+                    with self._lock:
+                        if task_id in self._inflight:
+                            continue
+                        self._inflight[task_id] = self._executor.submit(self._refresh, task_id)
+
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._stop.clear()
+            self._poll_interval = interval
+            self._watch_lookups = watch_lookups
+            self._poller = threading.Thread(target=loop, name="gen-status-poller", daemon=True)
+            self._poller.start()
+
+    def stop_poller(self):
+        with self._lock:
+            self._stop.set()
+            self._poller = None
+            self._watch_lookups = False
+
+
+@lru_cache()
+def get_status_cache() -> GenStatusCache:
+    return GenStatusCache(settings.VIDEO_GEN_STATUS_TTL, settings.VIDEO_GEN_STATUS_STORE)
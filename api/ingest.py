@@ -0,0 +1,298 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from urllib.parse import urlparse
+from api.config import get_settings
+from api.gen_status import get_status_cache
+from api.library import register_video
+from api.metrics import external_call, BYTES_WRITTEN
+
+settings = get_settings()
+
+READ_CHUNK = 1024 * 1024
+
+
+def _new_session():
+    import requests
+    session = requests.Session()
+    # Explicitly disable proxies to avoid local proxy errors
+    session.trust_env = False
+    return session
+
+
+def _probe_remote(session, url: str):
+    """Returns (size, accepts_ranges, content_type). size is None if unknown."""
+    response = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=30)
+    try:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if response.status_code == 206:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            return (int(total) if total.isdigit() else None), True, content_type
+        length = response.headers.get("Content-Length")
+        return (int(length) if length and length.isdigit() else None), False, content_type
+    finally:
+        response.close()
+
+
+def _load_state(state_path: str, url: str, size):
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("url") == url and state.get("size") == size:
+                return state
+        except Exception as e:
+            print(f"Ignoring unreadable download state {state_path}: {e}")
+    return {"url": url, "size": size, "done": []}
+
+
+def _save_state(state_path: str, state: dict):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def _download_segment(session, url: str, part_path: str, start: int, end: int):
+    headers = {"Range": f"bytes={start}-{end}"}
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code != 206:
+            raise Exception(f"Range request failed ({response.status_code}) for bytes {start}-{end}")
+        written = 0
+        with open(part_path, "r+b") as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=READ_CHUNK):
+                f.write(chunk)
+                written += len(chunk)
+    # A short body must not be recorded as done: the gap would be hashed and kept as zeros
+    if written != end - start + 1:
+        raise Exception(f"Range request for bytes {start}-{end} returned {written} bytes")
+
+
+def _hash_range(hasher, path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(READ_CHUNK, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+
+
+def download_file(url: str, dest_path: str, parts: int = None, segment_size: int = None):
+    """
+    Downloads `url` to `dest_path` and returns (sha256, size).
+
+    When the server supports ranges the file is fetched as fixed-size segments
+    by `parts` parallel workers straight into a preallocated `.part` file.
+    Completed segments are recorded in a `.part.json` sidecar, so an
+    interrupted download resumes where it stopped. The hash is computed in
+    order as the contiguous prefix grows; memory use is a few chunks per worker.
+    """
+    parts = parts or settings.INGEST_PARALLEL_PARTS
+    segment_size = segment_size or settings.INGEST_SEGMENT_SIZE
+    part_path = f"{dest_path}.part"
+    state_path = f"{dest_path}.part.json"
+    session = _new_session()
+
+    size, ranged, _ = _probe_remote(session, url)
+    hasher = hashlib.sha256()
+
+    if not ranged or not size:
+        # Sequential stream, hash while writing
+        written = 0
+        with session.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=READ_CHUNK):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    written += len(chunk)
+        if size and written != size:
+            raise Exception(f"Download of {url} returned {written} of {size} bytes")
+        os.replace(part_path, dest_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return hasher.hexdigest(), written
+
+    state = _load_state(state_path, url, size)
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+        state["done"] = []
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+
+    segments = [(i, start, min(start + segment_size, size) - 1)
+                for i, start in enumerate(range(0, size, segment_size))]
+    done = set(state["done"])
+    next_hash = 0
+
+    def advance_hash():
+        nonlocal next_hash
+        while next_hash < len(segments) and next_hash in done:
+            _, start, end = segments[next_hash]
+            _hash_range(hasher, part_path, start, end)
+            next_hash += 1
+
+    advance_hash()
+    todo = [s for s in segments if s[0] not in done]
+    if todo:
+        print(f"Downloading {url}: {len(todo)}/{len(segments)} segments with {parts} workers")
+        with ThreadPoolExecutor(max_workers=parts, thread_name_prefix="ingest-dl") as executor:
+            futures = {executor.submit(_download_segment, session, url, part_path, start, end): index
+                       for index, start, end in todo}
+            for future in as_completed(futures):
+                future.result()
+                done.add(futures[future])
+                state["done"] = sorted(done)
+                _save_state(state_path, state)
+                advance_hash()
+
+    os.replace(part_path, dest_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return hasher.hexdigest(), size
+
+
+def _guess_extension(url: str, content_type: str = "") -> str:
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    if ext in (".mp4", ".mov", ".webm", ".mkv"):
+        return ext
+    return mimetypes.guess_extension((content_type or "").split(";")[0].strip()) or ".mp4"
+
+
+class IngestManager:
+    """
+    Copies finished video generation outputs into the library.
+    Tracked jobs are persisted in INGEST_STORE so that a restart picks up
+    unfinished ingests (and their partial downloads) again.
+    """
+
+    def __init__(self, store_path: str, max_jobs: int):
+        self.store_path = store_path
+        self._lock = threading.Lock()
+        self._jobs = {}        # generation id -> {"user_id", "prompt", "status", ...}
+        self._running = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="ingest")
+        self._load()
+        get_status_cache().add_listener(self.on_status_final)
+
+    def _load(self):
+        if not self.store_path or not os.path.exists(self.store_path):
+            return
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                self._jobs = json.load(f)
+        except Exception as e:
+            print(f"Failed to load ingest store: {e}")
+
+    def _save(self):
+        if not self.store_path:
+            return
+        try:
+            tmp_path = f"{self.store_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._jobs, f, ensure_ascii=False)
+            os.replace(tmp_path, self.store_path)
+        except Exception as e:
+            print(f"Failed to save ingest store: {e}")
+
+    def start(self):
+        """Resumes ingests left unfinished by a previous run."""
+        with self._lock:
+            pending = [gid for gid, job in self._jobs.items() if job["status"] in ("waiting", "downloading")]
+        for generation_id in pending:
+            self._resume(generation_id)
+
+    def _resume(self, generation_id: str):
+        cache = get_status_cache()
+        data = cache.peek_final(generation_id)
+        if data is not None:
+            self.on_status_final(generation_id, data)
+        else:
+            cache.watch(generation_id)
+            # Nobody may be polling for this job; no-op when the poller already runs
+            cache.start_poller(settings.INGEST_POLL_INTERVAL, watch_lookups=False)
+
+    def track(self, generation_id: str, user_id: str, prompt: str = ""):
+        with self._lock:
+            job = self._jobs.get(generation_id)
+            if job and job["status"] != "failed":
+                return dict(job)
+            # New job, or a retry of a failed one
+            self._jobs[generation_id] = {"user_id": user_id, "prompt": prompt, "status": "waiting"}
+            self._save()
+            job = dict(self._jobs[generation_id])
+        self._resume(generation_id)
+        return job
+
+    def get(self, generation_id: str):
+        with self._lock:
+            job = self._jobs.get(generation_id)
+            return dict(job) if job else None
+
+    def on_status_final(self, generation_id: str, data):
+        with self._lock:
+            job = self._jobs.get(generation_id)
+            if not job or job["status"] not in ("waiting", "downloading") or generation_id in self._running:
+                return
+            if data.get("status") == "failed" or not data.get("video_url"):
+                job["status"] = "failed"
+                job["error"] = data.get("error") or "Generation finished without a video URL"
+                self._save()
+                return
+            self._running.add(generation_id)
+        self._executor.submit(self._ingest, generation_id, data["video_url"])
+
+    def _ingest(self, generation_id: str, video_url: str):
+        try:
+            with self._lock:
+                job = self._jobs[generation_id]
+                job["status"] = "downloading"
+                # Keep the id stable across restarts so the partial download is reused
+                job.setdefault("video_id", str(uuid.uuid4()))
+                job.setdefault("filename", f"{job['video_id']}{_guess_extension(video_url)}")
+                self._save()
+                video_id, filename, user_id = job["video_id"], job["filename"], job["user_id"]
+
+            file_path = os.path.join(settings.UPLOAD_DIR, filename)
+            with external_call("video_gen", "download"):
+                sha256, size = download_file(video_url, file_path)
+            BYTES_WRITTEN.inc(size, kind="ingest")
+            print(f"Ingested generation {generation_id} ({size} bytes, sha256 {sha256[:12]})")
+
+            register_video(video_id, file_path, f"generated_{filename}", user_id, metadata={
+                "source": "video_gen",
+                "generation_id": generation_id,
+                "source_url": video_url,
+                "sha256": sha256,
+                "prompt": job.get("prompt", ""),
+            })
+
+            with self._lock:
+                job["status"] = "completed"
+                job["sha256"] = sha256
+                self._save()
+        except Exception as e:
+            print(f"Ingest failed for generation {generation_id}: {e}")
+            with self._lock:
+                job = self._jobs[generation_id]
+                job["status"] = "failed"
+                job["error"] = str(e)
+                self._save()
+        finally:
+            with self._lock:
+                self._running.discard(generation_id)
+
+
+@lru_cache()
+def get_ingest_manager() -> IngestManager:
+    return IngestManager(settings.INGEST_STORE, settings.INGEST_MAX_JOBS)
@@ -0,0 +1,66 @@
+import os
+from typing import Optional
+from api.repository import get_repository
+
+
+def generate_thumbnail(video_path: str, output_path: str):
+    from moviepy.editor import VideoFileClip
+    try:
+        with VideoFileClip(video_path) as clip:
+            # Capture frame at 1s or middle if shorter
+            time_point = min(1.0, clip.duration / 2) if clip.duration else 0
+            clip.save_frame(output_path, t=time_point)
+        return True
+    except Exception as e:
+        print(f"Failed to generate thumbnail for {video_path}: {e}")
+        return False
+
+
+def probe_video(video_path: str, thumbnail_path: Optional[str] = None):
+    """
+    Opens the video once to read its basic properties and, if requested,
+    write the thumbnail. Returns a dict (empty if the file can't be decoded).
+    """
+    from moviepy.editor import VideoFileClip
+    try:
+        with VideoFileClip(video_path) as clip:
+            info = {
+                "duration": clip.duration,
+                "fps": clip.fps,
+                "width": clip.w,
+                "height": clip.h,
+                "has_audio": clip.audio is not None,
+            }
+            if thumbnail_path:
+                time_point = min(1.0, clip.duration / 2) if clip.duration else 0
+                clip.save_frame(thumbnail_path, t=time_point)
+        return info
+    except Exception as e:
+        print(f"Failed to probe {video_path}: {e}")
+        return {}
+
+
+def register_video(file_id: str, file_path: str, filename: str, user_id: str, metadata: Optional[dict] = None):
+    """
+    Probes a video already stored in UPLOAD_DIR, writes its thumbnail next to it
+    and creates the `videos` row. Shared by uploads and generated-video ingest.
+    """
+    file_ext = os.path.splitext(file_path)[1]
+    thumbnail_path = os.path.join(os.path.dirname(file_path), f"{file_id}.jpg")
+    info = probe_video(file_path, thumbnail_path)
+
+    video_data = {
+        "id": file_id,
+        "user_id": user_id,
+        "filename": filename,
+        "original_path": file_path,
+        "format": file_ext.lstrip('.'),
+        "file_size": os.path.getsize(file_path),
+    }
+    if info.get("duration"):
+        video_data["duration"] = int(info["duration"])
+    if info or metadata:
+        video_data["metadata"] = {**info, **(metadata or {})}
+
+    get_repository().insert("videos", video_data)
+    return video_data
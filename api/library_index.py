@@ -0,0 +1,356 @@
+import os
+import json
+import errno
+import select
+import struct
+import hashlib
+import threading
+from functools import lru_cache
+from api.config import get_settings
+from api.repository import get_repository, CHUNK
+from api.library import generate_thumbnail
+
+settings = get_settings()
+
+# Bytes hashed from each end of a file; enough to tell a replaced video from a touched one
+HASH_SAMPLE = 1024 * 1024
+# Written next to the final file while it is still arriving (uploads, ingest)
+PARTIAL_SUFFIXES = (".part", ".part.json", ".tmp")
+
+# <sys/inotify.h>
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+def file_hash(path: str, size: int) -> str:
+    """sha1 of the size and the first and last HASH_SAMPLE bytes."""
+    hasher = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        hasher.update(f.read(HASH_SAMPLE))
+        if size > 2 * HASH_SAMPLE:
+            f.seek(size - HASH_SAMPLE)
+            hasher.update(f.read(HASH_SAMPLE))
+    return hasher.hexdigest()
+
+
+class DirectoryWatcher:
+    """
+    inotify watch on one directory (no recursion, the library is flat).
+    Collects the names of files written, moved or deleted; take() hands them
+    over. After a queue overflow take() returns None: the caller rescans.
+    """
+
+    def __init__(self, path: str):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_ATTRIB
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        self._lock = threading.Lock()
+        self._names = set()
+        self._overflow = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], 1.0)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        continue
+                    raise
+                offset = 0
+                with self._lock:
+                    while offset + _EVENT.size <= len(data):
+                        _, mask, _, length = _EVENT.unpack_from(data, offset)
+                        name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                        offset += _EVENT.size + length
+                        if mask & IN_Q_OVERFLOW:
+                            self._overflow = True
+                        elif name:
+                            self._names.add(os.fsdecode(name))
+        finally:
+            os.close(self._fd)
+
+    def alive(self) -> bool:
+        """False once the thread has exited (stopped, or died on an error): its events are lost."""
+        return self._thread.is_alive()
+
+    def take(self):
+        with self._lock:
+            if self._overflow:
+                self._overflow = False
+                self._names = set()
+                return None
+            names, self._names = self._names, set()
+            return names
+
+    def stop(self):
+        self._stop.set()
+
+
+class LibraryIndex:
+    """
+    Incremental sync of UPLOAD_DIR (<video id>.<ext> plus <video id>.jpg
+    thumbnails) with the `videos` table.
+
+    The manifest ({name: {size, mtime, hash}}, LIBRARY_MANIFEST) is the
+    directory as of the last sync; sync() diffs the directory against it and
+    only touches the DB for what changed: rows of deleted videos go in one
+    bulk delete, replaced videos get their file_size updated in bulk and new
+    or replaced videos (or deleted thumbnails) get a thumbnail.
+
+    sync(user_id) only deletes that user's rows. Rows of removed files are
+    kept in an orphan list (<manifest>.orphans) until their owner syncs, so
+    no deletion is lost once the manifest has moved on.
+
+    With a DirectoryWatcher the diff only stats the files named by inotify
+    events, so a sync costs O(changes); without one (or after an event queue
+    overflow, or once per process since events before startup are unknown)
+    the directory is listed, which is O(files) stats but still no DB reads.
+    A watcher found dead at sync time is restarted after a listing.
+    The first sync without a manifest compares every row once.
+    """
+
+    def __init__(self, root: str, manifest_path: str):
+        self.root = root
+        self.manifest_path = manifest_path
+        self.journal_path = f"{manifest_path}.journal"
+        self.orphans_path = f"{manifest_path}.orphans"
+        self._journaled = 0
+        self._changes = {}
+        self.manifest = self._load()
+        # video id -> file name, for the manifest's videos
+        self._videos = {os.path.splitext(n)[0]: n for n in self.manifest or {} if not n.endswith(".jpg")}
+        self.orphans = self._load_orphans()
+        self.watcher = None
+        self._rescan = True
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            # Changes since the last compaction, one {"name", "entry"} per line (entry null: removed)
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            change = json.loads(line)
+                        except ValueError:
+                            break  # torn last line of a crashed append
+                        if change["entry"] is None:
+                            manifest.pop(change["name"], None)
+                        else:
+                            manifest[change["name"]] = change["entry"]
+                        self._journaled += 1
+            return manifest
+        except Exception as e:
+            print(f"Ignoring unreadable library manifest {self.manifest_path}: {e}")
+            return None
+
+    def _load_orphans(self):
+        """Ids of videos whose file is gone but whose row wasn't deleted yet."""
+        if self.manifest is None or not os.path.exists(self.orphans_path):
+            return set()
+        try:
+            with open(self.orphans_path, "r", encoding="utf-8") as f:
+                return set(json.load(f))
+        except Exception as e:
+            print(f"Ignoring unreadable library orphans {self.orphans_path}: {e}")
+            return set()
+
+    def _save_orphans(self):
+        tmp_path = f"{self.orphans_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(self.orphans), f)
+        os.replace(tmp_path, self.orphans_path)
+
+    def _save(self, changes: dict):
+        """Appends `changes` ({name: entry or None}) to the journal; rewrites the manifest once the journal outgrows it."""
+        self._journaled += len(changes)
+        if self._journaled > max(1000, len(self.manifest)) or not os.path.exists(self.manifest_path):
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journaled = 0
+            return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps({"name": n, "entry": e}) + "\n" for n, e in changes.items()))
+
+    def watch(self):
+        """Starts the inotify watcher; False where inotify isn't available (the diff then lists the directory)."""
+        if self.watcher:
+            return True
+        try:
+            self.watcher = DirectoryWatcher(self.root)
+            # Whatever changed before the watch started is only found by a listing
+            self._rescan = True
+            return True
+        except Exception as e:
+            print(f"Library watcher unavailable, syncs will rescan {self.root}: {e}")
+            return False
+
+    def stop(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _candidates(self, manifest: dict):
+        """Names that may have changed since the manifest was written, and whether that's all of them."""
+        names = self.watcher.take() if self.watcher else None
+        if names is None or self._rescan:
+            self._rescan = False
+            listed = {entry.name for entry in os.scandir(self.root) if entry.is_file()}
+            return listed | set(manifest), True
+        return names, False
+
+    def diff(self, manifest: dict):
+        """Changes against `manifest`: {name: entry} added, modified and touched (same content), [names] removed."""
+        names, full = self._candidates(manifest)
+        added, modified, touched, removed = {}, {}, {}, []
+        for name in names:
+            if name.endswith(PARTIAL_SUFFIXES):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                if name in manifest:
+                    removed.append(name)
+                continue
+            previous = manifest.get(name)
+            if previous and previous["size"] == st.st_size and previous["mtime"] == st.st_mtime:
+                continue
+            entry = {"size": st.st_size, "mtime": st.st_mtime, "hash": file_hash(path, st.st_size)}
+            if previous is None:
+                added[name] = entry
+            elif previous["hash"] != entry["hash"]:
+                modified[name] = entry
+            else:
+                touched[name] = entry
+        return added, modified, touched, removed, full
+
+    def _set(self, name: str, entry: dict = None):
+        """Adds/replaces (or with no entry, drops) a manifest entry, keeping the video id lookup in step."""
+        video_id, ext = os.path.splitext(name)
+        self._changes[name] = entry
+        if entry is None:
+            self.manifest.pop(name, None)
+            if ext != ".jpg" and self._videos.get(video_id) == name:
+                del self._videos[video_id]
+        else:
+            self.manifest[name] = entry
+            if ext != ".jpg":
+                self._videos[video_id] = name
+
+    def _thumbnail(self, video_id: str) -> bool:
+        name = self._videos[video_id]
+        thumbnail = f"{video_id}.jpg"
+        path = os.path.join(self.root, thumbnail)
+        if not generate_thumbnail(os.path.join(self.root, name), path):
+            return False
+        st = os.stat(path)
+        self._set(thumbnail, {"size": st.st_size, "mtime": st.st_mtime, "hash": file_hash(path, st.st_size)})
+        return True
+
+    def sync(self, user_id: str = None):
+        """
+        Reconciles the directory with the DB; returns counts of what changed.
+        With `user_id`, rows of other users' missing files are left to their owner.
+        """
+        with self._lock:
+            repo = get_repository()
+            bootstrap = self.manifest is None
+            if bootstrap:
+                self.manifest, self._videos = {}, {}
+            if self.watcher and not self.watcher.alive():
+                # Events since it died are lost: restarting it also schedules a full listing
+                print(f"Library watcher on {self.root} died, restarting it")
+                self.watcher = None
+                self.watch()
+            self._changes = {}
+            added, modified, touched, removed, full = self.diff(self.manifest)
+            for name, entry in {**added, **modified, **touched}.items():
+                self._set(name, entry)
+            for name in removed:
+                self._set(name)
+
+            orphans = set(self.orphans)
+            if bootstrap:
+                # No manifest yet: every row is checked against the listing once
+                # (a row whose file lives outside UPLOAD_DIR stays while that file exists)
+                orphans.update(v["id"] for v in repo.find_all("videos", columns="id, original_path")
+                               if v["id"] not in self._videos and not os.path.exists(v.get("original_path") or ""))
+            else:
+                orphans.update(os.path.splitext(n)[0] for n in removed if not n.endswith(".jpg"))
+            ids = sorted(orphans - set(self._videos))
+            rows = {}
+            for start in range(0, len(ids), CHUNK):
+                for v in repo.find("videos", {"id": ("in", ids[start:start + CHUNK])}, "id, user_id, original_path"):
+                    rows[v["id"]] = v
+            missing = []
+            for video_id in ids:
+                video = rows.get(video_id)
+                if video and user_id is not None and video.get("user_id") != user_id:
+                    continue
+                orphans.discard(video_id)
+                if video and not os.path.exists(video.get("original_path") or ""):
+                    missing.append(video_id)
+            orphans -= set(self._videos)
+            for video_id in missing:
+                print(f"File missing for video {video_id}, deleting record.")
+            repo.delete_many("videos", missing)
+            if orphans != self.orphans:
+                self.orphans = orphans
+                self._save_orphans()
+
+            repo.update_many("videos", {os.path.splitext(n)[0]: {"file_size": e["size"]}
+                                        for n, e in modified.items() if not n.endswith(".jpg")})
+
+            # Thumbnails of replaced videos, and of videos without one (new, or the thumbnail went away)
+            replaced = {os.path.splitext(n)[0] for n in modified if not n.endswith(".jpg")}
+            candidates = self._videos if bootstrap else {os.path.splitext(n)[0] for n in list(added) + list(modified) + removed}
+            thumbnails = 0
+            for video_id in sorted(candidates):
+                if video_id in self._videos and (video_id in replaced or f"{video_id}.jpg" not in self.manifest):
+                    thumbnails += self._thumbnail(video_id)
+
+            if self._changes:
+                self._save(self._changes)
+            return {"added": len(added), "modified": len(modified), "removed": len(removed),
+                    "deleted_records": len(missing), "thumbnails": thumbnails, "full_scan": full}
+
+    def snapshot(self):
+        with self._lock:
+            return {"files": len(self.manifest or {}), "watching": bool(self.watcher and self.watcher.alive()),
+                    "orphans": len(self.orphans)}
+
+
+@lru_cache()
+def get_library_index() -> LibraryIndex:
+    return LibraryIndex(settings.UPLOAD_DIR, settings.LIBRARY_MANIFEST)
@@ -0,0 +1,196 @@
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+import httpx
+from api.config import get_settings
+from api.metrics import external_call
+
+settings = get_settings()
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class _CallStats:
+    def __init__(self, window: int = 200):
+        self.calls = 0
+        self.errors = 0
+        self.deduplicated = 0
+        self.total_seconds = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self):
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            if not ordered:
+                return None
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "deduplicated": self.deduplicated,
+            "avg_seconds": (self.total_seconds / self.calls) if self.calls else None,
+            "p50_seconds": pct(0.5),
+            "p95_seconds": pct(0.95),
+        }
+
+
+class LLMClientManager:
+    """
+    Long-lived LLM clients shared by all worker threads.
+
+    - One OpenAI-compatible client per provider on a pooled keep-alive
+      httpx.Client (HTTP/2 when `h2` is installed).
+    - google.generativeai is configured once per process.
+    - Identical concurrent requests are collapsed onto one upstream call.
+    - A semaphore per provider caps concurrent upstream calls.
+    - Latency/error counters per provider and model (see `metrics`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._http_clients = {}
+        self._semaphores = {}
+        self._inflight = {}
+        self._stats = {}
+        self._genai_configured = False
+
+    def _limit_for(self, provider: str) -> int:
+        limits = {
+            "deepseek": settings.LLM_MAX_CONCURRENCY_DEEPSEEK,
+            "gemini": settings.LLM_MAX_CONCURRENCY_GEMINI,
+        }
+        return limits.get(provider, 4)
+
+    def _semaphore(self, provider: str):
+        with self._lock:
+            if provider not in self._semaphores:
+                self._semaphores[provider] = threading.BoundedSemaphore(self._limit_for(provider))
+            return self._semaphores[provider]
+
+    def _stat(self, provider: str, model: str) -> _CallStats:
+        key = f"{provider}/{model}"
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = _CallStats()
+            return self._stats[key]
+
+    def openai_client(self, provider: str = "deepseek"):
+        from openai import OpenAI
+        with self._lock:
+            client = self._clients.get(provider)
+            if client is not None:
+                return client
+
+            if provider == "deepseek":
+                api_key, base_url = settings.DEEPSEEK_API_KEY, settings.DEEPSEEK_BASE_URL
+            elif provider == "openai":
+                api_key, base_url = settings.OPENAI_API_KEY, None
+            else:
+                raise ValueError(f"Unknown LLM provider: {provider}")
+
+            limit = self._limit_for(provider)
+            http_client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit, keepalive_expiry=120),
+                timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10.0),
+            )
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            self._http_clients[provider] = http_client
+            self._clients[provider] = client
+            return client
+
+    def ensure_genai(self):
+        """Configures google.generativeai once; returns the module."""
+        import google.generativeai as genai
+        with self._lock:
+            if not self._genai_configured:
+                genai.configure(api_key=settings.GOOGLE_API_KEY)
+                self._genai_configured = True
+        return genai
+
+    def call(self, provider: str, model: str, fn, dedup_key: str = None):
+        """
+        Runs `fn()` under the provider's concurrency limit and records its
+        latency. Calls with the same `dedup_key` that overlap in time share
+        the result of the first one.
+        """
+        stats = self._stat(provider, model)
+        leader = True
+        if dedup_key is not None:
+            with self._lock:
+                future = self._inflight.get(dedup_key)
+                if future is None:
+                    future = Future()
+                    self._inflight[dedup_key] = future
+                else:
+                    leader = False
+                    stats.deduplicated += 1
+            if not leader:
+                return future.result()
+
+        try:
+            with self._semaphore(provider):
+                started = time.monotonic()
+                try:
+                    with external_call(provider, model):
+                        result = fn()
+                except Exception:
+                    with self._lock:
+                        stats.calls += 1
+                        stats.errors += 1
+                    raise
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    stats.calls += 1
+                    stats.total_seconds += elapsed
+                    stats.latencies.append(elapsed)
+        except Exception as e:
+            if dedup_key is not None:
+                future.set_exception(e)
+                with self._lock:
+                    self._inflight.pop(dedup_key, None)
+            raise
+
+        if dedup_key is not None:
+            future.set_result(result)
+            with self._lock:
+                self._inflight.pop(dedup_key, None)
+        return result
+
+    def chat_completion(self, provider: str, model: str, messages, **kwargs):
+        """Deduplicated chat completion through the provider's pooled client."""
+        client = self.openai_client(provider)
+        payload = json.dumps({"model": model, "messages": messages, **kwargs}, sort_keys=True, default=str)
+        dedup_key = f"{provider}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+        return self.call(
+            provider, model,
+            lambda: client.chat.completions.create(model=model, messages=messages, **kwargs),
+            dedup_key=dedup_key,
+        )
+
+    def metrics(self):
+        with self._lock:
+            return {key: stats.snapshot() for key, stats in self._stats.items()}
+
+    def close(self):
+        with self._lock:
+            for http_client in self._http_clients.values():
+                http_client.close()
+            self._http_clients.clear()
+            self._clients.clear()
+
+
+@lru_cache()
+def get_llm_manager() -> LLMClientManager:
+    return LLMClientManager()
@@ -1,9 +1,23 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from api.routers import video, tasks
+from api.routers import video, tasks, media
+from api.middleware import CORSHeadersMiddleware, MetricsMiddleware
 from api.config import get_settings
+from api.gen_status import get_status_cache
+from api.ingest import get_ingest_manager
+from api.model_health import get_model_registry
+from api.llm_clients import get_llm_manager
+from api.worker import resume_interrupted_tasks, prewarm
+from api.storage import get_storage_manager
+from api.library_index import get_library_index
+from api.scheduler import get_scheduler
+from api.cancellation import get_cancellations
+from api.routers.media import get_media_cache
+from api.metrics import REGISTRY
+from api.profiler import get_profilers
 import os
+import threading
 
 app = FastAPI(title="AI Video Editor API", version="1.0.0")
 
@@ -18,21 +32,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Custom middleware to ensure CORS headers are present on all responses (especially static files)
-@app.middleware("http")
-async def add_cors_header(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "*"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    # Fix for ORB (Opaque Response Blocking)
-    response.headers["Cross-Origin-Resource-Policy"] = "cross-origin" 
-    return response
-
-# Mount static files for uploads
-# This allows accessing uploaded videos via http://localhost:8000/uploads/filename
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
-app.mount("/outputs", StaticFiles(directory=settings.OUTPUT_DIR), name="outputs")
+# Ensure CORS headers are present on all responses (especially media files)
+app.add_middleware(CORSHeadersMiddleware)
+# Latency per route template, exported on /metrics
+app.add_middleware(MetricsMiddleware)
+
+# State owned by other components, read when /metrics is scraped
+REGISTRY.gauge("edit_queue_depth", "Edit tasks waiting for a worker slot",
+               callback=lambda: {(): get_scheduler().depth()[0]})
+REGISTRY.gauge("edit_active_encodes", "Edit tasks currently rendering",
+               callback=lambda: {(): get_scheduler().depth()[1]})
+REGISTRY.gauge("video_gen_status_requests", "Generation status lookups by how they were answered", ["result"],
+               callback=lambda: {(k,): v for k, v in get_status_cache().stats_snapshot().items()})
+REGISTRY.gauge("media_cache_requests", "Small media file cache lookups", ["result"],
+               callback=lambda: {("hit",): get_media_cache().snapshot()["hits"],
+                                 ("miss",): get_media_cache().snapshot()["misses"]})
+REGISTRY.gauge("edit_tasks_cancelled", "Tasks cancelled since startup", ["state"],
+               callback=lambda: {("queued",): get_cancellations().snapshot()["cancelled_queued"],
+                                 ("running",): get_cancellations().snapshot()["cancelled_running"]})
+REGISTRY.gauge("storage_evicted", "Files and directories evicted by the storage janitor", ["kind"],
+               callback=lambda: {(k,): v for k, v in get_storage_manager().evictions()[0].items()})
+REGISTRY.gauge("storage_freed_bytes", "Bytes freed by the storage janitor",
+               callback=lambda: {(): get_storage_manager().evictions()[1]})
+
+@app.on_event("startup")
+async def start_background_services():
+    # Optional server-side poller so status clients never hit the generation host directly.
+    # Without it, auto-ingest starts one for its own jobs when it has any (see IngestManager._resume).
+    if settings.VIDEO_GEN_POLL_INTERVAL > 0:
+        get_status_cache().start_poller(settings.VIDEO_GEN_POLL_INTERVAL)
+    if settings.VIDEO_GEN_AUTO_INGEST:
+        get_ingest_manager().start()
+    # Tasks queued or rendering when the last process died; checkpointed renders resume mid-way
+    if settings.RESUME_TASKS_ON_STARTUP:
+        threading.Thread(target=resume_interrupted_tasks, daemon=True).start()
+    get_storage_manager().start()
+    # media and LLM modules are imported lazily; load them before the first task needs them
+    if settings.WORKER_PREWARM:
+        threading.Thread(target=prewarm, name="worker-prewarm", daemon=True).start()
+    # inotify on UPLOAD_DIR so /api/video/sync only looks at changed files
+    if settings.LIBRARY_WATCH:
+        get_library_index().watch()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    get_status_cache().stop_poller()
+    get_storage_manager().stop()
+    get_library_index().stop()
+    get_llm_manager().close()
 
 @app.get("/")
 async def root():
@@ -42,9 +89,34 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/health/models")
+async def model_health():
+    # Circuit state and latency EWMA of every LLM model used so far
+    return {"status": "ok", "models": get_model_registry().snapshot(), "calls": get_llm_manager().metrics()}
+
+@app.get("/health/storage")
+def storage_health():
+    # Disk usage per managed directory, free space, evictions and quotas
+    return {"status": "ok", **get_storage_manager().snapshot()}
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus scrape endpoint: stage, external call and request latencies plus queue/cache state
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profile")
+def profile_process(seconds: float = 10):
+    # Samples every thread of this API process for `seconds` (blocks meanwhile); per task see /api/video/task/{id}/profile
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (PROFILER_ENABLED)")
+    summary = get_profilers().profile_process(seconds)
+    return {"status": "ok", **summary, "profile_url": f"http://localhost:8000/outputs/profiles/{summary['path']}"}
+
 # Include routers
 app.include_router(video.router)
 app.include_router(tasks.router)
+# Uploaded and rendered media (Range, ETag, long-lived caching); replaces the StaticFiles mounts
+app.include_router(media.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,226 @@
+import os
+import stat
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+import anyio
+from starlette.responses import Response
+
+CHUNK_SIZE = 1024 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+# Types the stdlib doesn't know (or guesses differently per platform)
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".webm": "video/webm",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".jpg": "image/jpeg",
+}
+
+
+def media_type(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return MEDIA_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def cache_control(path: str) -> str:
+    """
+    Final renditions (edited_*) and HLS segments are written once per task.
+    Anything else can be rewritten under the same name (playlists, previews,
+    profiles, library files and their thumbnails) and is revalidated with its ETag.
+    """
+    name = os.path.basename(path)
+    in_hls = os.path.basename(os.path.dirname(os.path.dirname(path))) == "hls"
+    if name.startswith("edited_") or (in_hls and not name.endswith(".m3u8")):
+        return IMMUTABLE
+    return REVALIDATE
+
+
+def make_etag(st: os.stat_result) -> str:
+    raw = f"{st.st_ino}-{st.st_size}-{st.st_mtime_ns}".encode()
+    return '"' + hashlib.md5(raw).hexdigest() + '"'
+
+
+def resolve(directory: str, relative: str):
+    """Absolute path of `relative` inside `directory`, or None if it escapes it or isn't a file."""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, relative))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st) if stat.S_ISREG(st.st_mode) else None
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) inclusive for a single `bytes=` range, None for no/ignored
+    range, or "invalid" when it can't be satisfied. Multi-range requests are
+    served as the full file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+class SmallFileCache:
+    """
+    LRU of small, hot files (thumbnails, playlists, init segments) kept in
+    memory and keyed by path + ETag, so a rewritten file is never served stale.
+    """
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, etag: str, size: int):
+        if size > self.max_file_bytes or self.max_bytes <= 0:
+            return None
+        key = (path, etag)
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes and self._items:
+                    _, evicted = self._items.popitem(last=False)
+                    self._bytes -= len(evicted)
+        return data
+
+    def snapshot(self):
+        with self._lock:
+            return {"files": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+def _read_at(f, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
+
+
+class MediaResponse(Response):
+    """
+    File response with Range/206 support. The body goes out through the ASGI
+    zero-copy extension (sendfile) when the server offers it; uvicorn
+    doesn't, so it is usually read in CHUNK_SIZE blocks in the thread pool,
+    as StaticFiles does: a cold file never blocks the event loop.
+    """
+
+    def __init__(self, path: str, st: os.stat_result, start: int, end: int, status_code: int,
+                 headers: dict, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.size = st.st_size
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1 if self.size else 0
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        f = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(),
+                            "offset": self.start, "count": count, "more_body": False})
+                return
+            position = self.start
+            stop = self.end + 1
+            while position < stop:
+                chunk = await anyio.to_thread.run_sync(_read_at, f, position, min(CHUNK_SIZE, stop - position))
+                # A file truncated since its stat ends the body early rather than looping
+                position = position + len(chunk) if chunk else stop
+                await send({"type": "http.response.body", "body": chunk, "more_body": position < stop})
+        finally:
+            await anyio.to_thread.run_sync(f.close)
+
+
+def _not_modified(request_headers, etag: str, st: os.stat_result) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve_file(path: str, st: os.stat_result, request_headers, method: str = "GET", cache: SmallFileCache = None):
+    """
+    Response for a resolved file: 304 on matching validators, 206 for a
+    satisfiable Range (honouring If-Range), 416 for an unsatisfiable one,
+    else 200. Small files come from `cache` when given.
+    """
+    etag = make_etag(st)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "cache-control": cache_control(path),
+        "accept-ranges": "bytes",
+        "content-type": media_type(path),
+    }
+    if _not_modified(request_headers, etag, st):
+        return Response(status_code=304, headers={k: headers[k] for k in ("etag", "last-modified", "cache-control")})
+
+    size = st.st_size
+    byte_range = parse_range(request_headers.get("range"), size)
+    if_range = request_headers.get("if-range")
+    if byte_range is not None and if_range and if_range != etag and if_range != headers["last-modified"]:
+        byte_range = None
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes"})
+
+    head_only = method.upper() == "HEAD"
+    if byte_range is None and cache is not None and not head_only:
+        data = cache.get(path, etag, size)
+        if data is not None:
+            return Response(content=data, status_code=200, headers=headers)
+
+    start, end = byte_range or (0, size - 1)
+    headers["content-length"] = str(max(0, end - start + 1))
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return MediaResponse(path, st, start, end, status_code, headers, send_body=not head_only)
@@ -0,0 +1,284 @@
+import os
+import glob
+import time
+import threading
+from collections import deque
+from functools import lru_cache
+from api.config import get_settings
+
+settings = get_settings()
+
+MB = 1024 * 1024
+AUDIO_RATE = 44100
+
+# Prior peak memory of one render (bytes of RSS above the process at task start,
+# ffmpeg children included): fixed overhead, RGB frames buffered by the reader,
+# fx chain and libx264 lookahead, extra frames held by scene cuts (fade windows,
+# the source reader seeking between scenes), frames per extra rendition encoder,
+# decoded audio (float64 stereo) for background music.
+PRIOR_OVERHEAD = 80 * MB
+FRAMES_BUFFERED = 30
+FRAMES_COMPOSE = 20
+FRAMES_PER_RENDITION = 15
+# Calibration: ratio of measured to prior peak at this quantile of recent samples
+CALIBRATION_QUANTILE = 0.9
+CALIBRATION_MIN_SAMPLES = 5
+
+
+def _statm_rss(pid) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def pids_rss(pids) -> int:
+    """Summed RSS of `pids`; processes that exited meanwhile count 0."""
+    total = 0
+    for pid in pids:
+        try:
+            total += _statm_rss(pid)
+        except (OSError, ValueError):
+            pass
+    return total
+
+
+def process_rss() -> int:
+    """RSS of this process plus its direct children (the ffmpeg readers/writers); 0 where /proc is unavailable."""
+    try:
+        total = _statm_rss("self")
+    except (OSError, ValueError):
+        return 0
+    for path in glob.glob("/proc/self/task/*/children"):
+        try:
+            with open(path) as f:
+                pids = f.read().split()
+        except OSError:
+            continue
+        total += pids_rss(pids)
+    return total
+
+
+def physical_memory() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError):
+        return 0
+
+
+def memory_budget() -> int:
+    """Bytes renders may reserve together (MEMORY_BUDGET_MB, or 60% of physical memory)."""
+    if settings.MEMORY_BUDGET_MB > 0:
+        return settings.MEMORY_BUDGET_MB * MB
+    return int(physical_memory() * 0.6)
+
+
+def memory_hard_limit() -> int:
+    """Process RSS at which the watchdog starts stopping renders (MEMORY_HARD_LIMIT_MB, or 85% of physical memory)."""
+    if settings.MEMORY_HARD_LIMIT_MB > 0:
+        return settings.MEMORY_HARD_LIMIT_MB * MB
+    return int(physical_memory() * 0.85)
+
+
+def memory_features(duration: float, width: int = None, height: int = None, operations=None, renditions: int = 0):
+    """Inputs of the memory estimate: (frame bytes, composited?, extra renditions, decoded background music bytes)."""
+    frame = (width or 1280) * (height or 720) * 3
+    operations = operations or []
+    types = {op.get("type") for op in operations}
+    # Unknown plan (planned after admission): assume a scene cut
+    compose = not operations or "auto_scene_cut" in types
+    audio = float(duration or 0) * AUDIO_RATE * 2 * 8 if "bg_music" in types else 0.0
+    return [frame, 1.0 if compose else 0.0, max(0, renditions - 1), audio]
+
+
+def memory_features_from_video(video: dict, operations=None):
+    """Memory features from a `videos` row, like cost_model.features_from_video."""
+    metadata = (video or {}).get("metadata") or {}
+    duration = (video or {}).get("duration") or metadata.get("duration") or 60.0
+    return memory_features(duration, metadata.get("width"), metadata.get("height"), operations)
+
+
+def prior_peak(features) -> float:
+    frame, compose, renditions, audio = features
+    frames = FRAMES_BUFFERED + FRAMES_COMPOSE * compose + FRAMES_PER_RENDITION * renditions
+    return PRIOR_OVERHEAD + frame * frames + audio
+
+
+class MemoryModel:
+    """
+    Predicts a render's peak memory: prior_peak() scaled by a calibration
+    factor, the CALIBRATION_QUANTILE of measured/prior ratios of recent
+    renders that ran alone (only then is the process' RSS theirs). Samples
+    come from results.quality_metrics.memory, read once on first use, and
+    from renders finishing in this process.
+    """
+
+    def __init__(self, max_samples: int = 200):
+        self._lock = threading.Lock()
+        # Held while the stored samples load, so estimates and observations don't wait on the query
+        self._load_lock = threading.Lock()
+        self._ratios = deque(maxlen=max_samples)
+        self._loaded = False
+
+    def _load(self):
+        with self._load_lock:
+            if self._loaded:
+                return
+            ratios = []
+            try:
+                from api.repository import get_repository
+                rows = get_repository().find("results", {"quality": "final"}, "quality_metrics",
+                                             order="created_at", desc=True, limit=self._ratios.maxlen)
+            except Exception as e:
+                print(f"Failed to load memory samples: {e}")
+                rows = []
+            for row in reversed(rows):
+                memory = (row.get("quality_metrics") or {}).get("memory") or {}
+                if memory.get("exclusive") and memory.get("prior_mb") and memory.get("peak_mb"):
+                    ratios.append(memory["peak_mb"] / memory["prior_mb"])
+            with self._lock:
+                # Stored samples are older than anything observed while they loaded
+                self._ratios = deque(ratios + list(self._ratios), maxlen=self._ratios.maxlen)
+                self._loaded = True
+
+    def factor(self) -> float:
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            if len(self._ratios) < CALIBRATION_MIN_SAMPLES:
+                return 1.0
+            ordered = sorted(self._ratios)
+            return min(4.0, max(0.5, ordered[int(CALIBRATION_QUANTILE * (len(ordered) - 1))]))
+
+    def estimate(self, features) -> int:
+        return int(prior_peak(features) * self.factor())
+
+    def observe(self, features, peak: int):
+        with self._lock:
+            self._ratios.append(peak / prior_peak(features))
+
+    def snapshot(self):
+        factor = self.factor()
+        with self._lock:
+            return {"samples": len(self._ratios), "factor": round(factor, 3)}
+
+
+class _Usage:
+    __slots__ = ("estimate", "start", "peak", "exclusive")
+
+    def __init__(self, estimate: int, start: int, exclusive: bool):
+        self.estimate = estimate
+        self.start = start
+        self.peak = start
+        self.exclusive = exclusive
+
+
+class MemoryWatchdog:
+    """
+    Samples the process' RSS (ffmpeg children included) every
+    MEMORY_SAMPLE_INTERVAL seconds while renders run, and keeps each
+    render's peak. Renders share the process, so the watchdog can only
+    act on what it can attribute:
+    - above the hard limit (memory_hard_limit()) it stops the render likely
+      using the most memory, before the kernel's OOM killer takes the whole
+      API down. The process' RSS can't be split between renders, so each is
+      ranked by its estimate, or by the measured RSS of its own ffmpeg
+      processes (tracked through its cancel token) when that is larger;
+    - a render running alone is stopped once it exceeds its estimate by
+      MEMORY_TASK_LIMIT_FACTOR.
+    Stopping goes through the task's cancel token with a reason, which the
+    worker reports as a failure.
+    """
+
+    def __init__(self, interval: float, hard_limit: int, task_limit_factor: float):
+        self.interval = interval
+        self.hard_limit = hard_limit
+        self.task_limit_factor = task_limit_factor
+        self.stopped = 0
+        self._lock = threading.Lock()
+        self._tasks = {}  # task_id -> _Usage
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self, task_id: str, estimate: int):
+        rss = process_rss()
+        with self._lock:
+            for usage in self._tasks.values():
+                usage.exclusive = False
+            self._tasks[task_id] = _Usage(estimate, rss, not self._tasks)
+            if self.interval > 0 and rss and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="memory-watchdog", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def update_estimate(self, task_id: str, estimate: int):
+        with self._lock:
+            usage = self._tasks.get(task_id)
+            if usage:
+                usage.estimate = estimate
+
+    def end(self, task_id: str):
+        """Stops tracking `task_id`; returns {"estimated_mb", "peak_mb", "exclusive"} or None."""
+        self.sample()
+        with self._lock:
+            usage = self._tasks.pop(task_id, None)
+        if usage is None or not usage.start:
+            return None
+        return {"estimated_mb": round(usage.estimate / MB, 1), "peak_mb": round((usage.peak - usage.start) / MB, 1),
+                "process_peak_mb": round(usage.peak / MB, 1), "exclusive": usage.exclusive}
+
+    def sample(self):
+        rss = process_rss()
+        if not rss:
+            return
+        from api.cancellation import get_cancellations
+        over = []
+        with self._lock:
+            for task_id, usage in self._tasks.items():
+                usage.peak = max(usage.peak, rss)
+                used = rss - usage.start
+                if usage.exclusive and self.task_limit_factor > 0 and used > usage.estimate * self.task_limit_factor:
+                    over.append((task_id, f"Memory limit exceeded: {used // MB} MB used, "
+                                          f"{usage.estimate // MB} MB estimated"))
+            estimates = {task_id: usage.estimate for task_id, usage in self._tasks.items()}
+        if not over and self.hard_limit and rss > self.hard_limit and estimates:
+            # /proc reads outside the lock
+            attributed = {task_id: max(estimate, pids_rss(get_cancellations().pids(task_id)))
+                          for task_id, estimate in estimates.items()}
+            task_id = max(attributed, key=attributed.get)
+            over.append((task_id, f"Memory limit exceeded: process at {rss // MB} MB "
+                                  f"(limit {self.hard_limit // MB} MB)"))
+        with self._lock:
+            over = [(task_id, reason) for task_id, reason in over if self._tasks.pop(task_id, None)]
+            self.stopped += len(over)
+        for task_id, reason in over:
+            print(f"Stopping task {task_id}: {reason}")
+            get_cancellations().abort(task_id, reason)
+
+    def _run(self):
+        while True:
+            # Cleared first, so a begin() racing with the idle check still wakes us
+            self._wake.clear()
+            with self._lock:
+                idle = not self._tasks
+            if idle:
+                self._wake.wait()
+                continue
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Memory sample failed: {e}")
+            time.sleep(self.interval)
+
+    def snapshot(self):
+        with self._lock:
+            return {"tracked_tasks": len(self._tasks), "stopped_tasks": self.stopped,
+                    "hard_limit_mb": self.hard_limit // MB}
+
+
+@lru_cache()
+def get_memory_model() -> MemoryModel:
+    return MemoryModel()
+
+
+@lru_cache()
+def get_memory_watchdog() -> MemoryWatchdog:
+    return MemoryWatchdog(settings.MEMORY_SAMPLE_INTERVAL, memory_hard_limit(), settings.MEMORY_TASK_LIMIT_FACTOR)
@@ -0,0 +1,229 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Latency buckets (seconds): API calls at the low end, renders at the high end
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A value set directly, or read from `callback()` -> {label tuple: value} at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback is not None:
+            try:
+                items = sorted(self.callback().items())
+            except Exception as e:
+                print(f"Metric {self.name} callback failed: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("edit_stage_seconds", "Time spent per stage of an edit task", ["stage"])
+EXTERNAL_SECONDS = REGISTRY.histogram("external_call_seconds", "Latency of calls to external services", ["service", "operation"])
+EXTERNAL_ERRORS = REGISTRY.counter("external_call_errors_total", "Failed calls to external services", ["service", "operation"])
+HTTP_SECONDS = REGISTRY.histogram("http_request_seconds", "API request latency", ["method", "route", "status"])
+TASKS = REGISTRY.counter("edit_tasks_total", "Edit tasks finished, by outcome", ["outcome"])
+BYTES_READ = REGISTRY.counter("media_bytes_read_total", "Bytes of source media read by renders", ["kind"])
+BYTES_WRITTEN = REGISTRY.counter("media_bytes_written_total", "Bytes of media written", ["kind"])
+
+
+class TaskTrace:
+    """Spans of one edit task; their totals per stage are stored with the result."""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.spans = []
+
+    def stages(self):
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = round(totals.get(stage, 0.0) + seconds, 3)
+        return totals
+
+
+_current = threading.local()
+
+
+def current_trace():
+    return getattr(_current, "trace", None)
+
+
+def begin_trace(task_id: str) -> TaskTrace:
+    """Makes spans recorded in this thread part of `task_id`'s trace until end_trace()."""
+    _current.trace = TaskTrace(task_id)
+    return _current.trace
+
+
+def end_trace():
+    _current.trace = None
+
+
+@contextmanager
+def span(stage: str):
+    """Times a stage of the current task into edit_stage_seconds and the task's trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append((stage, elapsed))
+
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """Times a call to an external service; failures are counted separately."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        EXTERNAL_SECONDS.observe(elapsed, service=service, operation=operation)
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append((service, elapsed))
+
+
+def instrument_httpx(client, service: str):
+    """Times every request of an httpx client (e.g. Supabase's PostgREST session)."""
+
+    def on_request(request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    def on_response(response):
+        started = response.request.extensions.get("metrics_started")
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        table = response.request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        operation = f"{response.request.method} {table}"
+        EXTERNAL_SECONDS.observe(elapsed, service=service, operation=operation)
+        if response.status_code >= 400:
+            EXTERNAL_ERRORS.inc(service=service, operation=operation)
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append((service, elapsed))
+
+    hooks = client.event_hooks
+    hooks.setdefault("request", []).append(on_request)
+    hooks.setdefault("response", []).append(on_response)
+    client.event_hooks = hooks
@@ -0,0 +1,67 @@
+import time
+from api.metrics import HTTP_SECONDS
+
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"*"),
+    (b"access-control-allow-headers", b"*"),
+    # Fix for ORB (Opaque Response Blocking)
+    (b"cross-origin-resource-policy", b"cross-origin"),
+]
+
+
+class CORSHeadersMiddleware:
+    """
+    Puts the CORS headers on every response, static media included.
+    Plain ASGI: only the response start message is touched, body chunks pass
+    straight through (an @app.middleware("http") function would re-stream them).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                names = {name for name, _ in CORS_HEADERS}
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() not in names]
+                message = {**message, "headers": headers + CORS_HEADERS}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every API request into http_request_seconds,
+    labelled by route template (not the raw path, so ids don't explode the
+    label set). Plain ASGI for the same reason as CORSHeadersMiddleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.observe(time.perf_counter() - started, method=scope["method"],
+                                 route=getattr(route, "path", "unmatched"), status=status[0])
@@ -0,0 +1,249 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from api.config import get_settings
+
+settings = get_settings()
+
+
+class ModelsUnavailableError(Exception):
+    pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half_open once `cooldown` has passed; one probe call is let through.
+    A failed probe reopens the circuit with a doubled cooldown (capped at
+    `max_cooldown`), a successful one closes it.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float, max_cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self, now: float) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.probing = False
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(now)
+        elif self.failures >= self.failure_threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self.probing = False
+
+
+class ModelHealthRegistry:
+    """
+    Process-wide health memory for LLM models: a circuit breaker plus a
+    latency EWMA per model. Shared by all tasks so a failing model is
+    skipped immediately instead of being rediscovered by every task.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0,
+                 max_cooldown: float = 900.0, ewma_alpha: float = 0.3):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _entry(self, model: str):
+        entry = self._models.get(model)
+        if entry is None:
+            entry = {
+                "breaker": CircuitBreaker(self.failure_threshold, self.cooldown, self.max_cooldown),
+                "latency_ewma": None,
+                "successes": 0,
+                "failures": 0,
+            }
+            self._models[model] = entry
+        return entry
+
+    def acquire(self, model: str) -> bool:
+        """True if a call to `model` may be made now."""
+        with self._lock:
+            return self._entry(model)["breaker"].allow(time.monotonic())
+
+    def ordered(self, models):
+        """
+        Models whose circuit isn't open, fastest EWMA first. Models without
+        latency history keep their configured order after the measured ones.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for index, model in enumerate(models):
+                breaker = self._entry(model)["breaker"]
+                if breaker.state == "open" and now - breaker.opened_at < breaker.cooldown:
+                    continue
+                latency = self._models[model]["latency_ewma"]
+                candidates.append((latency if latency is not None else float("inf"), index, model))
+        return [model for _, _, model in sorted(candidates)]
+
+    def latency(self, model: str):
+        with self._lock:
+            entry = self._models.get(model)
+            return entry["latency_ewma"] if entry else None
+
+    def record_success(self, model: str, latency: float):
+        with self._lock:
+            entry = self._entry(model)
+            entry["breaker"].record_success()
+            entry["successes"] += 1
+            if entry["latency_ewma"] is None:
+                entry["latency_ewma"] = latency
+            else:
+                entry["latency_ewma"] = self.ewma_alpha * latency + (1 - self.ewma_alpha) * entry["latency_ewma"]
+
+    def record_failure(self, model: str):
+        with self._lock:
+            entry = self._entry(model)
+            entry["breaker"].record_failure(time.monotonic())
+            entry["failures"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                model: {
+                    "state": entry["breaker"].state,
+                    "consecutive_failures": entry["breaker"].failures,
+                    "latency_ewma": entry["latency_ewma"],
+                    "successes": entry["successes"],
+                    "failures": entry["failures"],
+                }
+                for model, entry in self._models.items()
+            }
+
+
+def remaining(deadline) -> float:
+    if deadline is None:
+        return float("inf")
+    return deadline - time.monotonic()
+
+
+def call_with_fallback(registry: ModelHealthRegistry, models, call, deadline=None,
+                       attempts_per_model: int = 2, hedge_factor: float = 0.0,
+                       min_hedge_delay: float = 5.0, max_timeout: float = 600.0):
+    """
+    Runs `call(model, timeout)` against `models` in health order and returns
+    (model, result) for the first success.
+
+    - Models with an open circuit are skipped without a call.
+    - Every call gets the time left until `deadline` as its timeout.
+    - With `hedge_factor` > 0, if the running call takes longer than
+      hedge_factor x its model's latency EWMA, the next model is started in
+      parallel and whichever succeeds first wins. The slower call is left
+      to finish in the background; its outcome still updates the registry.
+    """
+    plan = [m for _ in range(attempts_per_model) for m in registry.ordered(models)]
+    if not plan:
+        raise ModelsUnavailableError(f"All models have open circuits: {', '.join(models)}")
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="llm-hedge")
+    pending = {}
+    last_error = None
+
+    def run(model, timeout):
+        started = time.monotonic()
+        try:
+            result = call(model, timeout)
+        except Exception:
+            registry.record_failure(model)
+            raise
+        registry.record_success(model, time.monotonic() - started)
+        return result
+
+    def launch_next():
+        while plan:
+            model = plan.pop(0)
+            timeout = min(max_timeout, remaining(deadline))
+            if timeout <= 0:
+                return False
+            if model in pending.values() or not registry.acquire(model):
+                continue
+            print(f"Trying model: {model}")
+            pending[executor.submit(run, model, timeout)] = model
+            return True
+        return False
+
+    try:
+        launch_next()
+        while pending:
+            left = remaining(deadline)
+            if left <= 0:
+                raise DeadlineExceededError("Task deadline reached while waiting for model response")
+
+            wait_for = left
+            can_hedge = hedge_factor > 0 and len(pending) == 1 and plan
+            if can_hedge:
+                ewma = registry.latency(next(iter(pending.values())))
+                if ewma is not None:
+                    wait_for = min(left, max(min_hedge_delay, hedge_factor * ewma))
+
+            done, _ = wait(list(pending), timeout=None if wait_for == float("inf") else wait_for,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                if can_hedge:
+                    print(f"Model {next(iter(pending.values()))} is slow, hedging with another model")
+                    launch_next()
+                continue
+
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                    print(f"Success with {model}")
+                    return model, result
+                except Exception as e:
+                    print(f"Model {model} failed: {e}")
+                    last_error = e
+            if not pending:
+                launch_next()
+
+        if last_error is not None:
+            raise last_error
+        raise ModelsUnavailableError("No model could be called before the deadline")
+    finally:
+        executor.shutdown(wait=False)
+
+
+@lru_cache()
+def get_model_registry() -> ModelHealthRegistry:
+    return ModelHealthRegistry(
+        failure_threshold=settings.LLM_BREAKER_FAILURES,
+        cooldown=settings.LLM_BREAKER_COOLDOWN,
+        max_cooldown=settings.LLM_BREAKER_MAX_COOLDOWN,
+    )
@@ -0,0 +1,59 @@
+import os
+import shutil
+import subprocess
+
+MASTER_PLAYLIST = "master.m3u8"
+
+
+def _probe_bitrate(path: str, duration: float) -> int:
+    """Average bits per second of a file, for BANDWIDTH in the master playlist."""
+    return int(os.path.getsize(path) * 8 / max(duration or 1.0, 0.1))
+
+
+def segment_hls(input_path: str, out_dir: str, name: str, segment_seconds: float):
+    """
+    Remuxes one MP4 (no re-encode) into fMP4 HLS: `<name>.m3u8`, `<name>_init.mp4`
+    and `<name>_00000.m4s`... Segments are cut on keyframes, so their length
+    follows the encoder's keyframe interval.
+    """
+    from moviepy.config import get_setting
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-i", input_path,
+        "-map", "0", "-c", "copy",
+        "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", f"{name}_init.mp4",
+        "-hls_segment_filename", os.path.join(out_dir, f"{name}_%05d.m4s"),
+        os.path.join(out_dir, f"{name}.m3u8"),
+    ]
+    proc = subprocess.run(cmd, stderr=subprocess.PIPE, timeout=600)
+    if proc.returncode != 0:
+        raise Exception(f"HLS packaging failed: {proc.stderr.decode(errors='replace')[-500:]}")
+    return f"{name}.m3u8"
+
+
+def package_hls(variants, out_dir: str, duration: float, segment_seconds: float = 4.0):
+    """
+    Packages rendered outputs for adaptive streaming.
+
+    `variants` is [{"name", "path", "width", "height"}] (one per rendition,
+    or just the single output). Writes every variant's playlist and segments
+    plus a master playlist into `out_dir`; returns the master playlist's path.
+    Segment names never change for a task, so they can be cached forever.
+    """
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for variant in variants:
+        playlist = segment_hls(variant["path"], out_dir, variant["name"], segment_seconds)
+        bandwidth = _probe_bitrate(variant["path"], duration)
+        info = f"BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={bandwidth}"
+        if variant.get("width") and variant.get("height"):
+            info += f",RESOLUTION={variant['width']}x{variant['height']}"
+        lines += [f"#EXT-X-STREAM-INF:{info}", playlist]
+
+    master_path = os.path.join(out_dir, MASTER_PLAYLIST)
+    with open(master_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return master_path
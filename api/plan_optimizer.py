@@ -0,0 +1,210 @@
+import math
+
+# What apply_operations() does with each operation type; anything else is ignored there
+KNOWN_TYPES = ("subclip", "speed", "audio", "bg_music", "auto_scene_cut")
+# Numeric fields and the default apply_operations() uses when one is missing
+NUMBERS = {
+    "subclip": {"start": 0.0, "end": None},
+    "speed": {"factor": 1.0},
+    "audio": {"volume": 1.0},
+    "bg_music": {"volume": 0.3, "offset": 0.0},
+}
+
+
+class InvalidPlanError(Exception):
+    pass
+
+
+def _number(op: dict, field: str, default):
+    value = op.get(field, default)
+    if value is None and default is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise InvalidPlanError(f"Invalid edit plan: {op.get('type')} {field} {value!r} is not a number")
+    if not math.isfinite(value):
+        raise InvalidPlanError(f"Invalid edit plan: {op.get('type')} {field} {value!r} is not finite")
+    return value
+
+
+def validate_plan(operations):
+    """
+    Checks the shape of a plan (a list of operation dicts with numeric
+    fields where apply_operations() expects them) and drops operations of
+    unknown types, which apply_operations() would skip. Raises InvalidPlanError.
+    """
+    if not isinstance(operations, list):
+        raise InvalidPlanError(f"Invalid edit plan: expected a list of operations, got {type(operations).__name__}")
+    valid = []
+    for op in operations:
+        if not isinstance(op, dict):
+            raise InvalidPlanError(f"Invalid edit plan: operation {op!r} is not an object")
+        if op.get("type") not in KNOWN_TYPES:
+            print(f"Ignoring unknown operation {op.get('type')!r}")
+            continue
+        for field, default in NUMBERS.get(op["type"], {}).items():
+            _number(op, field, default)
+        valid.append(op)
+    return valid
+
+
+def _exact_scale(factor: float) -> bool:
+    """
+    Whether scaling times by `factor` is exact in floating point (a power of
+    two). Speed changes resample the audio to the nearest source sample, and
+    factors like 1.5 put many times exactly on a tie, where the last bit of
+    the time decides: a trim rewritten behind such a speed change (moved or
+    folded, so its start is summed differently) or two such factors fused
+    would change the audio.
+    """
+    return math.frexp(factor)[0] == 0.5
+
+
+def _audio_adjustment(op: dict) -> bool:
+    """An `audio` operation that only changes the volume (or does nothing)."""
+    return op["type"] == "audio" and op.get("action", "keep") not in ("extract", "remove")
+
+
+def _audio_removed(operations) -> bool:
+    """Whether the clip has no audio after `operations` (removed, and no music added since)."""
+    for op in reversed(operations):
+        if op["type"] == "bg_music":
+            return False
+        if op["type"] == "audio" and op.get("action") == "remove":
+            return True
+    return False
+
+
+def _trim_bounds(op: dict, length: float):
+    """(start, end) of a subclip on a clip of `length` seconds, clamped as apply_operations() does."""
+    start = max(0.0, min(_number(op, "start", 0.0), length))
+    end = _number(op, "end", None)
+    end = max(0.0, min(length if end is None else end, length))
+    return start, end
+
+
+def plan_duration(operations, duration: float):
+    """
+    Length of the clip after `operations`, computed like apply_operations()
+    and moviepy do; None once it depends on detected scenes.
+    """
+    length = float(duration) if duration else None
+    for op in operations:
+        if length is None or op["type"] == "auto_scene_cut":
+            return None
+        if op["type"] == "subclip":
+            start, end = _trim_bounds(op, length)
+            if start < end:
+                length = end - start
+        elif op["type"] == "speed":
+            factor = _number(op, "factor", 1.0)
+            if factor > 0 and factor != 1.0:
+                length = 1.0 * length / factor
+    return length
+
+
+def _add(out, op: dict, duration: float):
+    """`out` (an optimized plan) followed by `op`, rewritten; see optimize_plan."""
+    kind = op["type"]
+    length = plan_duration(out, duration)
+
+    if kind == "subclip":
+        if length is None:
+            return out + [op]
+        start, end = _trim_bounds(op, length)
+        if start >= end or (start == 0 and end == length):
+            return out
+        best = out + [{"type": "subclip", "start": start, "end": end}]
+        if any(o["type"] == "speed" and not _exact_scale(_number(o, "factor", 1.0)) for o in out):
+            return best
+        # Walk the trim back through the operations it commutes with, as far as the length stays exact
+        head, tail = list(out), []
+        while head:
+            previous = head.pop()
+            if previous["type"] == "subclip":
+                start, end = previous["start"] + start, previous["start"] + end
+            elif previous["type"] == "speed":
+                factor = _number(previous, "factor", 1.0)
+                start, end = start * factor, end * factor
+                tail.insert(0, previous)
+            elif previous["type"] == "bg_music":
+                tail.insert(0, {**previous, "offset": _number(previous, "offset", 0.0) + start})
+            elif previous["type"] == "audio":
+                tail.insert(0, previous)
+            else:
+                break
+            moved = head + [{"type": "subclip", "start": start, "end": end}] + tail
+            if plan_duration(moved, duration) != plan_duration(best, duration):
+                break
+            best = moved
+        return best
+
+    if kind == "speed":
+        factor = _number(op, "factor", 1.0)
+        if factor <= 0 or factor == 1.0:
+            return out
+        if length is not None and out and out[-1]["type"] == "speed":
+            previous = _number(out[-1], "factor", 1.0)
+            if _exact_scale(factor) or _exact_scale(previous):
+                factor *= previous
+                return out[:-1] if factor == 1.0 else out[:-1] + [{**op, "factor": factor}]
+        return out + [op]
+
+    if kind == "audio":
+        action = op.get("action", "keep")
+        if action == "remove":
+            if _audio_removed(out):
+                return out
+            # Whatever was done to the audio so far is dropped with it
+            out = [o for o in out if not (_audio_adjustment(o) or o["type"] == "bg_music")]
+            return out if _audio_removed(out) else out + [op]
+        if action != "extract" and (_number(op, "volume", 1.0) == 1.0 or _audio_removed(out)):
+            return out
+    return out + [op]
+
+
+def optimize_plan(operations, duration: float):
+    """
+    Validates a plan (see validate_plan) for a source of `duration` seconds
+    and rewrites it into one that renders the same output with less work:
+    - no-ops go: speed 1.0 (or <= 0), volume 1.0, trims keeping everything
+      or nothing, volume changes and background music before the audio is
+      removed, volume changes of a clip without audio;
+    - consecutive speed factors multiply into one;
+    - trims move as early as they can: before volume changes, before speed
+      changes (scaled by the factor) and before background music (which
+      then starts at the trimmed-away offset, as it did), folding into the
+      trims they meet.
+    Trims are only moved or folded behind speed changes that scale exactly,
+    and speed factors only fused when one of them does (see _exact_scale).
+    Any rewrite is only kept if the clip comes out exactly as long as before;
+    otherwise the operation is appended as it was. Nothing crosses
+    auto_scene_cut: scenes are detected on the source, and the length after
+    it is unknown until they are. Returns a new list; operations kept
+    unchanged are the same dicts.
+    """
+    out, seen = [], []
+    for op in validate_plan(operations):
+        seen.append(op)
+        rewritten = _add(out, op, duration)
+        expected = plan_duration(seen, duration)
+        out = rewritten if expected is None or plan_duration(rewritten, duration) == expected else out + [op]
+    return out
+
+
+def plan_cost(operations, duration: float) -> float:
+    """
+    Rough work of a plan in media seconds: the length of the clip each
+    operation is applied to plus the length of the output. The length after
+    auto_scene_cut is taken as unchanged.
+    """
+    length = float(duration or 0)
+    cost = 0.0
+    for op in operations:
+        if op.get("type") not in KNOWN_TYPES:
+            continue
+        cost += length
+        if op["type"] != "auto_scene_cut":
+            length = plan_duration([op], length) or length
+    return cost + length
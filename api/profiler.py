@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import threading
+from functools import lru_cache
+from api.config import get_settings
+
+settings = get_settings()
+
+_labels = {}
+
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename.replace("\\", "/")
+        if "site-packages/" in path:
+            path = path.rsplit("site-packages/", 1)[1]
+        elif "/lib/python" in path:
+            path = path.rsplit("/lib/", 1)[1]
+        elif "/api/" in path:
+            path = "api/" + path.rsplit("/api/", 1)[1]
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread reads the Python stacks of
+    `thread_ids` (every thread but its own when None) every `interval`
+    seconds and counts identical stacks. Nothing is hooked into the profiled
+    code, so the cost is one stack walk per sample, reported as `overhead`
+    (share of wall time spent sampling). Time inside ffmpeg subprocesses
+    shows up as the Python frame waiting on the pipe.
+
+    The result is written to `output_path` in collapsed-stack format
+    ("root;caller;callee count" per line), readable by flamegraph.pl,
+    speedscope or inferno. Stops after `duration` seconds or on stop().
+    """
+
+    def __init__(self, output_path: str, thread_ids=None, interval: float = 0.01, duration: float = None):
+        self.output_path = output_path
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval
+        self.duration = duration
+        self.stacks = {}
+        self.samples = 0
+        self.summary = None
+        self._busy = 0.0
+        self._save = True
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, save: bool = True):
+        """Stops sampling; returns the summary (None when not saved)."""
+        self._save = save
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        return self.summary
+
+    def wait(self):
+        self._thread.join()
+        return self.summary
+
+    def _sample(self, own_id: int):
+        names = {t.ident: t.name for t in threading.enumerate()} if self.thread_ids is None or len(self.thread_ids) > 1 else None
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if names is not None:
+                stack.append(names.get(thread_id, str(thread_id)))
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + self.duration if self.duration else None
+        while not self._stop.wait(self.interval):
+            tick = time.perf_counter()
+            self._sample(own_id)
+            self._busy += time.perf_counter() - tick
+            if deadline and tick >= deadline:
+                break
+        elapsed = time.perf_counter() - started
+        if not self._save:
+            return
+
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        with open(self.output_path + ".tmp", "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        os.replace(self.output_path + ".tmp", self.output_path)
+        self.summary = {
+            "path": os.path.basename(self.output_path),
+            "samples": self.samples,
+            "seconds": round(elapsed, 2),
+            "interval_ms": round(self.interval * 1000, 2),
+            "overhead": round(self._busy / elapsed, 4) if elapsed else 0.0,
+        }
+        print(f"Profile written to {self.output_path} ({self.samples} samples, {self.summary['overhead']:.2%} overhead)")
+
+
+class ProfilerRegistry:
+    """
+    Knows which thread runs which task, so a profiler can be attached to a
+    task that is already rendering. Profiles go to
+    OUTPUT_DIR/profile_<task_id>.folded, next to the task's result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads = {}    # task_id -> thread ident
+        self._active = {}     # task_id -> SamplingProfiler
+
+    @staticmethod
+    def task_profile_path(task_id: str) -> str:
+        return os.path.join(settings.OUTPUT_DIR, f"profile_{task_id}.folded")
+
+    def register(self, task_id: str):
+        """Called by the worker thread about to run `task_id`."""
+        with self._lock:
+            self._threads[task_id] = threading.get_ident()
+
+    def start_task(self, task_id: str, duration: float = None):
+        """Starts profiling a running task; returns False when it doesn't run in this process."""
+        duration = min(duration or settings.PROFILER_MAX_SECONDS, settings.PROFILER_MAX_SECONDS)
+        with self._lock:
+            thread_id = self._threads.get(task_id)
+            if thread_id is None:
+                return False
+            if task_id in self._active:
+                return True
+            self._active[task_id] = SamplingProfiler(
+                self.task_profile_path(task_id), [thread_id],
+                interval=settings.PROFILER_INTERVAL_MS / 1000, duration=duration
+            ).start()
+        return True
+
+    def finish(self, task_id: str, save: bool = True):
+        """Stops the task's profiler, if any, and returns its summary."""
+        with self._lock:
+            profiler = self._active.pop(task_id, None)
+        return profiler.stop(save) if profiler else None
+
+    def unregister(self, task_id: str, save: bool = True):
+        summary = self.finish(task_id, save)
+        with self._lock:
+            self._threads.pop(task_id, None)
+        return summary
+
+    def profile_process(self, seconds: float):
+        """Samples every thread of the API process for `seconds`; blocks until the profile is written."""
+        seconds = min(seconds, settings.PROFILER_MAX_SECONDS)
+        path = os.path.join(settings.OUTPUT_DIR, "profiles", f"process_{time.strftime('%Y%m%d_%H%M%S')}.folded")
+        return SamplingProfiler(path, interval=settings.PROFILER_INTERVAL_MS / 1000, duration=seconds).start().wait()
+
+    def snapshot(self):
+        with self._lock:
+            return {"tasks": len(self._threads), "profiling": sorted(self._active)}
+
+
+@lru_cache()
+def get_profilers() -> ProfilerRegistry:
+    return ProfilerRegistry()
@@ -0,0 +1,148 @@
+import os
+import subprocess
+from api.encoder_profiles import PROFILES
+from api.cancellation import CancelLogger
+
+# name -> (output height, x264 CRF)
+LADDER = {
+    "1080p": (1080, 21),
+    "720p": (720, 23),
+    "480p": (480, 25),
+    "mobile": (360, 28),
+}
+DEFAULT_LADDER = ["1080p", "720p", "mobile"]
+
+
+def rendition_names(spec):
+    """
+    Rendition names requested by `spec`: True (default ladder), a name or
+    comma-separated names ("720p,mobile"), or a list of names; nothing for
+    None/False/"". Raises ValueError on anything else or unknown names.
+    """
+    if not spec:
+        return []
+    if spec is True:
+        return list(DEFAULT_LADDER)
+    if isinstance(spec, str):
+        spec = [n.strip() for n in spec.split(",") if n.strip()]
+    if not isinstance(spec, (list, tuple)) or not all(isinstance(n, str) for n in spec):
+        raise ValueError(f"renditions must be true, a rendition name or a list of names, got {spec!r}")
+    unknown = [n for n in spec if n not in LADDER]
+    if unknown:
+        raise ValueError(f"Unknown renditions {unknown}, expected some of {list(LADDER)}")
+    return list(dict.fromkeys(spec))
+
+
+def parse_ladder(spec, source_height: int):
+    """
+    `spec` as accepted by rendition_names().
+    Renditions taller than the source are dropped (no upscaling); if that
+    leaves nothing, the source height is used. Returns [(name, height, crf)], tallest first.
+    """
+    names = rendition_names(spec)
+    ladder = [(n, LADDER[n][0], LADDER[n][1]) for n in dict.fromkeys(names)]
+    fitting = [r for r in ladder if r[1] <= source_height]
+    if not fitting:
+        fitting = [(ladder[0][0] if ladder else "source", source_height, 23)]
+    return sorted(fitting, key=lambda r: -r[1])
+
+
+def write_renditions(final_clip, outputs, audio_path: str = None, preset: str = "medium", threads: int = None,
+                     gop: int = None, cancel=None):
+    """
+    Renders `final_clip` once and encodes it into every rendition in one
+    ffmpeg process: frames are generated a single time by moviepy, piped to
+    ffmpeg, split with `split` and scaled/encoded per output in parallel.
+
+    `outputs` is [(path, height, crf)]. `audio_path` is an already rendered
+    audio track muxed (copied) into every output. `gop` is the keyframe interval in frames.
+    `cancel` (a CancelToken) is checked every frame and kills ffmpeg when cancelled.
+    """
+    fps = final_clip.fps or 24
+    width, height = final_clip.size
+    count = len(outputs)
+
+    from moviepy.config import get_setting
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{width}x{height}",
+        "-pix_fmt", "rgb24", "-r", f"{fps:.02f}", "-i", "-",
+    ]
+    if audio_path:
+        cmd += ["-i", audio_path]
+
+    graph = [f"[0:v]split={count}" + "".join(f"[s{i}]" for i in range(count))]
+    for i, (_, out_height, _) in enumerate(outputs):
+        graph.append(f"[s{i}]scale=-2:{out_height}[v{i}]")
+    cmd += ["-filter_complex", ";".join(graph)]
+
+    for i, (path, _, crf) in enumerate(outputs):
+        cmd += ["-map", f"[v{i}]"]
+        if audio_path:
+            cmd += ["-map", "1:a", "-c:a", "copy"]
+        cmd += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"]
+        if gop:
+            cmd += ["-g", str(gop)]
+        if threads:
+            cmd += ["-threads", str(threads)]
+        cmd += ["-movflags", "+faststart", path]
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    if cancel:
+        cancel.track(proc)
+    try:
+        for frame in final_clip.iter_frames(fps=fps, dtype="uint8"):
+            if cancel:
+                cancel.check()
+            proc.stdin.write(frame.tobytes())
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        stderr = proc.stderr.read()
+        proc.wait()
+        if cancel:
+            cancel.untrack(proc)
+    if cancel:
+        cancel.check()
+    if proc.returncode != 0:
+        raise Exception(f"Rendition encode failed: {stderr.decode(errors='replace')[-500:]}")
+
+
+def render_ladder(final_clip, output_dir: str, base_name: str, spec, tmp_dir: str = None, encoder: dict = None,
+                  cancel=None):
+    """
+    Writes the rendition ladder for `final_clip`. The tallest rendition is
+    `<base_name>.mp4`, the others `<base_name>_<name>.mp4`.
+    `encoder` (see encoder_profiles.choose_profile) sets preset, threads and
+    keyframe interval, and shifts every rung's CRF relative to "balanced".
+    `cancel` is a CancelToken that aborts the encode.
+    Returns [{"name", "height", "path", "filename"}], tallest first.
+    """
+    ladder = parse_ladder(spec, final_clip.h)
+    encoder = encoder or {}
+    crf_offset = encoder["crf"] - PROFILES["balanced"]["crf"] if "crf" in encoder else 0
+    renditions = []
+    for index, (name, out_height, crf) in enumerate(ladder):
+        crf = min(51, max(0, crf + crf_offset))
+        filename = f"{base_name}.mp4" if index == 0 else f"{base_name}_{name}.mp4"
+        renditions.append({"name": name, "height": out_height, "crf": crf,
+                           "path": os.path.join(output_dir, filename), "filename": filename})
+
+    audio_path = None
+    if final_clip.audio:
+        audio_path = os.path.join(tmp_dir or output_dir, f"{base_name}_audio.m4a")
+        final_clip.audio.write_audiofile(audio_path, codec="aac", verbose=False,
+                                         logger=CancelLogger(cancel) if cancel else None)
+    try:
+        gop = int(round((final_clip.fps or 24) * encoder["keyint"])) if "keyint" in encoder else None
+        write_renditions(final_clip, [(r["path"], r["height"], r["crf"]) for r in renditions], audio_path,
+                         preset=encoder.get("preset", "medium"), threads=encoder.get("threads"), gop=gop,
+                         cancel=cancel)
+    finally:
+        if audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+    return renditions
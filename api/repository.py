@@ -0,0 +1,355 @@
+import os
+import re
+import json
+import asyncio
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from functools import lru_cache
+from api.config import get_settings
+
+settings = get_settings()
+
+TABLES = ("videos", "tasks", "results", "users")
+# Columns the SQLite backend indexes (everything else is still filterable, just scanned)
+INDEXED = {
+    "videos": ("user_id",),
+    "tasks": ("user_id", "video_id", "batch_id", "status"),
+    "results": ("task_id", "output_path"),
+    "users": (),
+}
+# Ids per request for bulk filters, so PostgREST URLs stay short
+CHUNK = 100
+# Rows per page of find_all; PostgREST caps a response at 1000 rows
+PAGE = 1000
+
+_IDENT = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def now_iso() -> str:
+    """Timestamp for *_at columns; understood by Postgres and sortable as text in SQLite."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _chunks(values, size=CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _condition(value):
+    """Filter values are plain (equality) or ("neq" | "in", operand)."""
+    if isinstance(value, tuple):
+        return value
+    return ("eq", value)
+
+
+def _columns(columns: str):
+    return [c.strip() for c in (columns or "*").split(",") if c.strip()]
+
+
+class Repository(ABC):
+    """
+    Row storage of the API: videos, tasks, results and users.
+
+    Rows are plain dicts. `filters` map columns to a value (equality) or to
+    ("neq", value) / ("in", [values]); "<table>.<column>" filters on an
+    embedded row and drops rows without a match (an inner join); only
+    find() takes those. `embed` maps referenced tables to the columns to
+    include, resolved through the row's "<table minus s>_id" column
+    (tasks.video_id -> videos).
+
+    Writes take many rows at once (insert a list, update_many, delete_many).
+    Every method has an `a`-prefixed coroutine variant for async endpoints.
+    """
+
+    def get(self, table: str, row_id: str, columns: str = "*", embed: dict = None):
+        rows = self.find(table, {"id": row_id}, columns, embed, limit=1)
+        return rows[0] if rows else None
+
+    @abstractmethod
+    def find(self, table: str, filters: dict = None, columns: str = "*", embed: dict = None,
+             order: str = None, desc: bool = False, limit: int = None, offset: int = 0):
+        """Matching rows; `offset` skips that many of them (used with `limit` and an `order`)."""
+
+    def find_all(self, table: str, filters: dict = None, columns: str = "*", embed: dict = None, page: int = PAGE):
+        """Every matching row, read `page` rows at a time in id order."""
+        rows, offset = [], 0
+        while True:
+            batch = self.find(table, filters, columns, embed, order="id", limit=page, offset=offset)
+            rows += batch
+            if len(batch) < page:
+                return rows
+            offset += page
+
+    @abstractmethod
+    def insert(self, table: str, rows):
+        """Inserts one row or a list of rows in one call; returns the rows."""
+
+    @abstractmethod
+    def update(self, table: str, values: dict, filters: dict):
+        """Sets `values` on every row matching `filters`; returns the updated rows."""
+
+    @abstractmethod
+    def delete(self, table: str, filters: dict):
+        pass
+
+    def update_many(self, table: str, updates: dict):
+        """{row id: values}. Rows getting identical values share one call."""
+        groups = {}
+        for row_id, values in updates.items():
+            key = json.dumps(values, sort_keys=True, default=str)
+            groups.setdefault(key, (values, []))[1].append(row_id)
+        for values, ids in groups.values():
+            for chunk in _chunks(ids):
+                self.update(table, values, {"id": ("in", chunk)})
+
+    def delete_many(self, table: str, ids, column: str = "id"):
+        for chunk in _chunks(ids):
+            self.delete(table, {column: ("in", chunk)})
+
+    async def aget(self, *args, **kwargs):
+        return await asyncio.to_thread(self.get, *args, **kwargs)
+
+    async def afind(self, *args, **kwargs):
+        return await asyncio.to_thread(self.find, *args, **kwargs)
+
+    async def afind_all(self, *args, **kwargs):
+        return await asyncio.to_thread(self.find_all, *args, **kwargs)
+
+    async def ainsert(self, *args, **kwargs):
+        return await asyncio.to_thread(self.insert, *args, **kwargs)
+
+    async def aupdate(self, *args, **kwargs):
+        return await asyncio.to_thread(self.update, *args, **kwargs)
+
+    async def adelete(self, *args, **kwargs):
+        return await asyncio.to_thread(self.delete, *args, **kwargs)
+
+    async def aupdate_many(self, *args, **kwargs):
+        return await asyncio.to_thread(self.update_many, *args, **kwargs)
+
+    async def adelete_many(self, *args, **kwargs):
+        return await asyncio.to_thread(self.delete_many, *args, **kwargs)
+
+
+class SupabaseRepository(Repository):
+    """PostgREST through the calling thread's pooled supabase client; bulk writes are one request per chunk."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is not None:
+            return self._client
+        from api.supabase_client import get_supabase
+        return get_supabase()
+
+    def _select(self, columns: str, embed: dict, filters: dict):
+        parts = [columns or "*"]
+        for name, cols in (embed or {}).items():
+            inner = any(key.startswith(f"{name}.") for key in filters)
+            parts.append(f"{name}{'!inner' if inner else ''}({cols or '*'})")
+        return ", ".join(parts)
+
+    def _filter(self, query, filters: dict, embedded: bool = False):
+        for column, value in (filters or {}).items():
+            if "." in column and not embedded:
+                raise ValueError(f"Filter on embedded column {column} is only supported by find()")
+            op, operand = _condition(value)
+            if op == "in":
+                query = query.in_(column, list(operand))
+            elif operand is None and op == "eq":
+                query = query.is_(column, "null")
+            else:
+                query = getattr(query, op)(column, operand)
+        return query
+
+    def find(self, table, filters=None, columns="*", embed=None, order=None, desc=False, limit=None, offset=0):
+        filters = filters or {}
+        query = self._filter(self.client.table(table).select(self._select(columns, embed, filters)), filters,
+                             embedded=True)
+        if order:
+            query = query.order(order, desc=desc)
+        if limit:
+            query = query.range(offset, offset + limit - 1) if offset else query.limit(limit)
+        return query.execute().data or []
+
+    def insert(self, table, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        if not rows:
+            return []
+        return self.client.table(table).insert(rows).execute().data
+
+    def update(self, table, values, filters):
+        return self._filter(self.client.table(table).update(values), filters).execute().data
+
+    def delete(self, table, filters):
+        self._filter(self.client.table(table).delete(), filters).execute()
+
+
+class SQLiteRepository(Repository):
+    """
+    Single-file local backend (tests, single-node deployments). Each table
+    keeps the row as JSON next to its id, with expression indexes on the
+    columns in INDEXED. One connection per thread, reused for every call;
+    WAL mode lets readers run while a render thread writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        with conn:
+            for table in TABLES:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                for column in INDEXED[table]:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} "
+                                 f"ON {table} (json_extract(data, '$.{column}'))")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _check(table: str, column: str = None):
+        if table not in TABLES:
+            raise ValueError(f"Unknown table {table}")
+        if column is not None and not _IDENT.match(column):
+            raise ValueError(f"Invalid column {column}")
+
+    def _where(self, table: str, filters: dict, embedded: bool = False):
+        """
+        SQL WHERE for `filters`. "<table>.<column>" filters are skipped with
+        `embedded` (find() applies them after the join) and refused otherwise.
+        """
+        clauses, params = [], []
+        for column, value in (filters or {}).items():
+            if "." in column:
+                if not embedded:
+                    raise ValueError(f"Filter on embedded column {column} is only supported by find()")
+                continue
+            self._check(table, column)
+            op, operand = _condition(value)
+            expr = "id" if column == "id" else f"json_extract(data, '$.{column}')"
+            if op == "in":
+                operand = list(operand)
+                if not operand:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{expr} IN ({','.join('?' * len(operand))})")
+                params += operand
+            elif operand is None:
+                clauses.append(f"{expr} IS {'NOT ' if op == 'neq' else ''}NULL")
+            elif op == "neq":
+                clauses.append(f"({expr} IS NULL OR {expr} != ?)")
+                params.append(operand)
+            else:
+                clauses.append(f"{expr} = ?")
+                params.append(operand)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _rows(self, table: str, filters: dict, suffix: str = "", embedded: bool = False):
+        where, params = self._where(table, filters, embedded)
+        cursor = self._conn().execute(f"SELECT data FROM {table}{where}{suffix}", params)
+        return [json.loads(data) for (data,) in cursor]
+
+    @staticmethod
+    def _project(row: dict, columns: str):
+        names = _columns(columns)
+        if "*" in names:
+            return row
+        return {name: row.get(name) for name in names}
+
+    def find(self, table, filters=None, columns="*", embed=None, order=None, desc=False, limit=None, offset=0):
+        self._check(table)
+        filters = filters or {}
+        suffix = ""
+        if order:
+            self._check(table, order)
+            suffix += f" ORDER BY json_extract(data, '$.{order}') {'DESC' if desc else 'ASC'}"
+        joined = any("." in key for key in filters)
+        if limit and not joined:
+            suffix += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        rows = self._rows(table, filters, suffix, embedded=True)
+
+        for name, cols in (embed or {}).items():
+            self._check(name)
+            key = f"{name[:-1]}_id"
+            linked = {r["id"]: r for r in self._rows(name, {"id": ("in", {row.get(key) for row in rows if row.get(key)})})}
+            for row in rows:
+                target = linked.get(row.get(key))
+                row[name] = self._project(target, cols or "*") if target else None
+            conditions = {k.split(".", 1)[1]: v for k, v in filters.items() if k.startswith(f"{name}.")}
+            if conditions:
+                rows = [row for row in rows if row[name] and all(self._matches(row[name].get(c), v) for c, v in conditions.items())]
+        if limit and joined:
+            rows = rows[offset:offset + limit]
+        keep = _columns(columns) + list(embed or {})
+        return rows if "*" in keep else [{k: row.get(k) for k in keep} for row in rows]
+
+    @staticmethod
+    def _matches(value, condition):
+        op, operand = _condition(condition)
+        if op == "in":
+            return value in operand
+        if op == "neq":
+            return value != operand
+        return value == operand
+
+    def insert(self, table, rows):
+        self._check(table)
+        rows = rows if isinstance(rows, list) else [rows]
+        stamped = []
+        for row in rows:
+            row = {"id": str(uuid.uuid4()), "created_at": now_iso(), **row}
+            stamped.append(row)
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(f"INSERT INTO {table} (id, data) VALUES (?, ?)",
+                                 [(row["id"], json.dumps(row, default=str)) for row in stamped])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return stamped
+
+    def update(self, table, values, filters):
+        self._check(table)
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [{**row, **values} for row in self._rows(table, filters)]
+                conn.executemany(f"UPDATE {table} SET data = ? WHERE id = ?",
+                                 [(json.dumps(row, default=str), row["id"]) for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def delete(self, table, filters):
+        self._check(table)
+        where, params = self._where(table, filters)
+        with self._write_lock:
+            self._conn().execute(f"DELETE FROM {table}{where}", params)
+
+
+@lru_cache()
+def get_repository() -> Repository:
+    if settings.DB_BACKEND == "sqlite":
+        return SQLiteRepository(settings.SQLITE_PATH)
+    return SupabaseRepository()
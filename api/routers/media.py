@@ -0,0 +1,39 @@
+from functools import lru_cache
+from fastapi import APIRouter, HTTPException, Request
+from api.config import get_settings
+from api.media import SmallFileCache, resolve, serve_file
+from api.storage import get_storage_manager
+
+router = APIRouter(tags=["media"])
+settings = get_settings()
+
+
+@lru_cache()
+def get_media_cache() -> SmallFileCache:
+    return SmallFileCache(settings.MEDIA_CACHE_BYTES, settings.MEDIA_CACHE_MAX_FILE)
+
+
+def _serve(directory: str, file_path: str, request: Request):
+    resolved = resolve(directory, file_path)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    path, st = resolved
+    return serve_file(path, st, request.headers, request.method, get_media_cache())
+
+
+# Same URLs as the former StaticFiles mounts, so stored links keep working.
+# Plain def: the stat, small-file cache reads and HLS touch run in the thread pool, not on the event loop
+@router.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def serve_upload(file_path: str, request: Request):
+    return _serve(settings.UPLOAD_DIR, file_path, request)
+
+
+@router.api_route("/outputs/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def serve_output(file_path: str, request: Request):
+    parts = file_path.split("/")
+    if len(parts) > 2 and parts[0] == "hls":
+        # Recently watched packages are the last to be evicted
+        get_storage_manager().touch_hls(parts[1])
+    elif len(parts) == 1:
+        get_storage_manager().touch_output(parts[0])
+    return _serve(settings.OUTPUT_DIR, file_path, request)
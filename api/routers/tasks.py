@@ -2,10 +2,18 @@ import uuid
 import os
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from api.config import get_settings
-from api.supabase_client import get_supabase
-from api.worker import start_processing_thread
+from api.repository import get_repository
+from api.worker import enqueue_task, cancel_task, remove_task_outputs
+from api.cancellation import get_cancellations
+from api.storage import get_storage_manager, QuotaExceededError, InsufficientStorageError
+from api.scheduler import get_user_plan, get_scheduler
+from api.cost_model import get_cost_model
+from api.batch import start_batch_thread, summarize_batch
+from api.profiler import get_profilers
+from api.memory import get_memory_model, get_memory_watchdog
+from api.renditions import rendition_names
 
 router = APIRouter(prefix="/api/video", tags=["tasks"])
 settings = get_settings()
@@ -16,11 +24,31 @@ class EditRequest(BaseModel):
     prompt: str
     parameters: Optional[Dict[str, Any]] = {}
 
+def check_storage(user_id: str):
+    """Refuses new renders for users over their plan quota, or while the node is short of disk."""
+    storage = get_storage_manager()
+    try:
+        storage.ensure_capacity()
+        storage.check_quota(user_id, get_user_plan(user_id))
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InsufficientStorageError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+def check_parameters(parameters):
+    """Rejects render parameters that would only fail once the task runs."""
+    try:
+        rendition_names((parameters or {}).get("renditions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/edit")
 def create_edit_task(request: EditRequest):
+    check_parameters(request.parameters)
+    check_storage(request.user_id)
     try:
         task_id = str(uuid.uuid4())
-        supabase = get_supabase()
+        repo = get_repository()
         
         # Create task record
         task_data = {
@@ -33,10 +61,16 @@ def create_edit_task(request: EditRequest):
             "progress": 0.0
         }
         
-        data, count = supabase.table("tasks").insert(task_data).execute()
+        repo.insert("tasks", task_data)
         
-        # Trigger background processing worker
-        start_processing_thread(task_id)
+        # Queue for background processing (fair share by users.plan);
+        # the probed duration/resolution drive the task's ETA
+        video = None
+        try:
+            video = repo.get("videos", request.video_id, "duration, metadata")
+        except Exception as e:
+            print(f"Error fetching video {request.video_id} for ETA: {e}")
+        enqueue_task(task_id, request.user_id, video=video)
 
         return {
             "status": "success",
@@ -57,40 +91,152 @@ def create_edit_task(request: EditRequest):
             
         raise HTTPException(status_code=500, detail=str(e))
 
+class BatchEditRequest(BaseModel):
+    video_ids: List[str]
+    user_id: str
+    prompt: str
+    parameters: Optional[Dict[str, Any]] = {}
+    max_concurrency: Optional[int] = None
+
+@router.post("/edit/batch")
+def create_batch_edit_task(request: BatchEditRequest):
+    """
+    Apply one prompt to many videos. The prompt is planned once and the
+    member renders are scheduled together; poll /batch/{batch_id} for progress.
+    """
+    video_ids = list(dict.fromkeys(request.video_ids))
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="video_ids must not be empty")
+    if len(video_ids) > settings.BATCH_MAX_VIDEOS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_VIDEOS} videos per batch")
+    check_parameters(request.parameters)
+    check_storage(request.user_id)
+
+    try:
+        batch_id = str(uuid.uuid4())
+        repo = get_repository()
+
+        tasks_data = [{
+            "id": str(uuid.uuid4()),
+            "user_id": request.user_id,
+            "video_id": video_id,
+            "batch_id": batch_id,
+            "prompt": request.prompt,
+            "parameters": request.parameters,
+            "status": "pending",
+            "progress": 0.0
+        } for video_id in video_ids]
+
+        # One bulk insert for all member tasks
+        repo.insert("tasks", tasks_data)
+
+        task_ids = [t["id"] for t in tasks_data]
+        start_batch_thread(batch_id, task_ids, request.user_id, request.prompt, request.max_concurrency)
+
+        return {
+            "status": "success",
+            "batch_id": batch_id,
+            "task_ids": task_ids,
+            "message": "Batch edit created successfully"
+        }
+
+    except Exception as e:
+        error_msg = f"Error in create_batch_edit_task: {str(e)}"
+        print(error_msg)
+        import traceback
+        traceback.print_exc()
+
+        with open("api_error.log", "a") as f:
+            f.write(f"[{uuid.uuid4()}] {error_msg}\n")
+            traceback.print_exc(file=f)
+
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/batch/{batch_id}")
+def get_batch_status(batch_id: str):
+    try:
+        repo = get_repository()
+        tasks = repo.find("tasks", {"batch_id": batch_id}, "id, video_id, status, progress, error_message")
+        if not tasks:
+            raise HTTPException(status_code=404, detail="Batch not found")
+
+        return {
+            "batch_id": batch_id,
+            **summarize_batch(tasks),
+            "tasks": tasks
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Get batch status error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/task/{task_id}")
 def get_task_status(task_id: str):
     try:
-        supabase = get_supabase()
-        response = supabase.table("tasks").select("*").eq("id", task_id).single().execute()
+        repo = get_repository()
+        task = repo.get("tasks", task_id)
         
-        if not response.data:
+        if not task:
             raise HTTPException(status_code=404, detail="Task not found")
             
-        task = response.data
         
         result_url = None
-        if task["status"] == "completed":
+        preview_url = None
+        playlist_url = None
+        renditions = {}
+        if task["status"] in ("processing", "awaiting_confirmation", "completed"):
             try:
-                # Fetch result record to get the output path
-                # Handle potential errors if multiple results or none
-                result_res = supabase.table("results").select("*").eq("task_id", task_id).execute()
-                if result_res.data and len(result_res.data) > 0:
-                    # Take the latest one if multiple
-                    result_data = result_res.data[0]
-                    result_url = f"http://localhost:8000/outputs/{result_data['output_path']}"
-                    format_type = result_data.get('format', 'mp4')
+                # Fetch result records: the preview is published before the task completes
+                for result_data in repo.find("results", {"task_id": task_id}):
+                    url = f"http://localhost:8000/outputs/{result_data['output_path']}"
+                    rendition = (result_data.get("quality_metrics") or {}).get("rendition")
+                    if result_data.get("quality") == "preview":
+                        preview_url = url
+                    elif task["status"] != "completed":
+                        continue
+                    elif result_data["output_path"].startswith(f"edited_{task_id}."):
+                        # Primary output (the tallest rendition when a ladder was requested)
+                        result_url = url
+                        format_type = result_data.get('format', 'mp4')
+                        hls = (result_data.get("quality_metrics") or {}).get("hls")
+                        # The package may have been evicted to free disk space
+                        if hls and os.path.exists(os.path.join(settings.OUTPUT_DIR, hls)):
+                            playlist_url = f"http://localhost:8000/outputs/{hls}"
+                        if rendition:
+                            renditions[rendition] = url
+                    elif rendition:
+                        renditions[rendition] = url
             except Exception as res_err:
                 print(f"Error fetching result for task {task_id}: {res_err}")
 
+        # Written when the render ends (parameters.profile or POST /task/{id}/profile)
+        profile_url = None
+        if os.path.exists(get_profilers().task_profile_path(task_id)):
+            profile_url = f"http://localhost:8000/outputs/profile_{task_id}.folded"
+
+        queue_info = None
+        if task["status"] in ("pending", "processing"):
+            queue_info = get_scheduler().queue_info(task_id)
+
         return {
             "task_id": task["id"],
             "status": task["status"],
             "progress": task["progress"],
             "result_url": result_url,
+            "preview_url": preview_url,
+            "renditions": renditions or None,
+            "playlist_url": playlist_url,
+            "profile_url": profile_url,
             "format": format_type if 'format_type' in locals() else None,
-            "error_message": task.get("error_message")
+            "error_message": task.get("error_message"),
+            "queue_position": queue_info["queue_position"] if queue_info else None,
+            "queue_wait_seconds": queue_info["queue_wait_seconds"] if queue_info else None,
+            "eta_seconds": queue_info["eta_seconds"] if queue_info else None
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Get task status error: {str(e)}"
         print(error_msg)
@@ -100,14 +246,88 @@ def get_task_status(task_id: str):
             traceback.print_exc(file=f)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/task/{task_id}/confirm")
+def confirm_task(task_id: str):
+    """
+    Start the full-quality render of a task whose preview was accepted
+    (tasks created with parameters.final_render = "on_confirm").
+    """
+    try:
+        repo = get_repository()
+        task = repo.get("tasks", task_id, embed={"videos": "duration, metadata"})
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task["status"] != "awaiting_confirmation":
+            raise HTTPException(status_code=409, detail=f"Task is {task['status']}, not awaiting confirmation")
+
+        plan = (task.get("parameters") or {}).get("plan") or []
+        # Only if still awaiting: a cancellation since the read wins
+        if not repo.update("tasks", {"status": "pending"}, {"id": task_id, "status": "awaiting_confirmation"}):
+            raise HTTPException(status_code=409, detail="Task is no longer awaiting confirmation")
+        enqueue_task(task_id, task["user_id"], operations=plan, video=task.get("videos"), skip_preview=True)
+
+        return {"status": "success", "task_id": task_id, "message": "Final render queued"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Confirm task error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/task/{task_id}/cancel")
+def cancel_edit_task(task_id: str):
+    """
+    Cancel a pending, processing or awaiting-confirmation task. A running
+    render stops at its next check; partial outputs are cleaned up by the
+    worker. Anything already written for a task not running (its preview) is removed here.
+    """
+    try:
+        repo = get_repository()
+        task = repo.get("tasks", task_id, "status")
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task["status"] not in ("pending", "processing", "awaiting_confirmation"):
+            raise HTTPException(status_code=409, detail=f"Task is already {task['status']}")
+
+        repo.update("tasks", {"status": "cancelled"}, {"id": task_id})
+        state = cancel_task(task_id)
+        if state != "running":
+            remove_task_outputs(task_id)
+
+        return {"status": "success", "task_id": task_id, "was": state or task["status"], "message": "Task cancelled"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Cancel task error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/task/{task_id}/profile")
+def profile_task(task_id: str, seconds: float = 60):
+    """
+    Attach the sampling profiler to a task rendering on this worker for up to
+    `seconds`. The collapsed-stack profile is written next to the result when
+    the time is up or the task ends; see profile_url in the task status.
+    """
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (PROFILER_ENABLED)")
+    if not get_profilers().start_task(task_id, seconds):
+        raise HTTPException(status_code=409, detail="Task is not running on this worker")
+    return {"status": "success", "task_id": task_id, "seconds": min(seconds, settings.PROFILER_MAX_SECONDS),
+            "profile_url": f"http://localhost:8000/outputs/profile_{task_id}.folded"}
+
+@router.get("/queue")
+def get_queue_status():
+    """Scheduler load, recent queue wait (p95) per plan, ETA prediction error, cancellations and memory."""
+    return {**get_scheduler().snapshot(), "eta_model": get_cost_model().snapshot(),
+            "cancellation": get_cancellations().snapshot(),
+            "memory": {**get_memory_watchdog().snapshot(), "model": get_memory_model().snapshot()}}
+
 @router.get("/tasks")
 def list_user_tasks(user_id: str):
     try:
-        supabase = get_supabase()
+        repo = get_repository()
         
         # 1. Fetch tasks only
-        response = supabase.table("tasks").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        tasks_data = response.data
+        tasks_data = repo.find("tasks", {"user_id": user_id}, order="created_at", desc=True)
         
         if not tasks_data:
             return []
@@ -120,21 +340,24 @@ def list_user_tasks(user_id: str):
         videos_map = {}
         if video_ids:
             try:
-                # Supabase 'in' filter expects a list
-                # Note: supabase-py syntax might be .in_("id", video_ids)
-                vid_res = supabase.table("videos").select("id, filename").in_("id", video_ids).execute()
-                for v in vid_res.data:
+                for v in repo.find("videos", {"id": ("in", video_ids)}, "id, filename"):
                     videos_map[v["id"]] = v["filename"]
             except Exception as e:
                 print(f"Error fetching videos: {e}")
 
         # 4. Fetch related results (if any)
         results_map = {}
+        preview_map = {}
         if task_ids:
             try:
-                res_res = supabase.table("results").select("task_id, output_path, format").in_("task_id", task_ids).execute()
-                for r in res_res.data:
-                    # Assuming one result per task, or take the last one
+                for r in repo.find("results", {"task_id": ("in", task_ids)}, "task_id, output_path, format, quality"):
+                    # The final render wins over the preview
+                    if r.get("quality") == "preview":
+                        preview_map[r["task_id"]] = r["output_path"]
+                        continue
+                    if not r["output_path"].startswith(f"edited_{r['task_id']}."):
+                        # Secondary rendition, the primary output is listed instead
+                        continue
                     results_map[r["task_id"]] = {
                         "path": r["output_path"],
                         "format": r.get("format", "mp4") # Default to mp4 if missing
@@ -162,6 +385,7 @@ def list_user_tasks(user_id: str):
                 "created_at": t["created_at"],
                 "prompt": t.get("prompt", ""),
                 "result_url": result_url,
+                "preview_url": f"http://localhost:8000/outputs/{preview_map[t['id']]}" if t["id"] in preview_map else None,
                 "original_filename": original_filename,
                 "format": format_type
             })
@@ -181,22 +405,31 @@ def list_user_tasks(user_id: str):
 @router.delete("/task/{task_id}")
 def delete_task(task_id: str):
     try:
-        supabase = get_supabase()
+        repo = get_repository()
+
+        # Stop a queued or running render first, or it would write results for a deleted task
+        cancel_task(task_id)
         
         # 1. Get result file path to delete locally
-        res = supabase.table("results").select("output_path").eq("task_id", task_id).execute()
-        if res.data:
-            for r in res.data:
-                file_path = os.path.join(settings.OUTPUT_DIR, r['output_path'])
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"Deleted result file: {file_path}")
+        task = repo.get("tasks", task_id, "user_id")
+        rows = repo.find("results", {"task_id": task_id}, "output_path, file_size, quality")
+        for r in rows:
+            file_path = os.path.join(settings.OUTPUT_DIR, r['output_path'])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                print(f"Deleted result file: {file_path}")
+        if task:
+            # The quota check would count them until its cache expires (previews were never charged)
+            charged = sum(r.get("file_size") or 0 for r in rows if r.get("quality") != "preview")
+            get_storage_manager().add_usage(task["user_id"], -charged)
+        # Outputs without a results row: preview written before its row, profile, HLS package, checkpoint
+        remove_task_outputs(task_id)
         
         # 2. Delete task (cascade should handle results, but let's be safe or rely on DB)
         # Assuming CASCADE DELETE is configured in DB for task->results. 
         # If not, we should delete result first.
-        supabase.table("results").delete().eq("task_id", task_id).execute()
-        supabase.table("tasks").delete().eq("id", task_id).execute()
+        repo.delete("results", {"task_id": task_id})
+        repo.delete("tasks", {"id": task_id})
         
         return {"status": "success", "message": "Task deleted"}
     except Exception as e:
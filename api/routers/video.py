@@ -5,9 +5,14 @@ from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from typing import Optional, List
 from pydantic import BaseModel
 from api.config import get_settings
-from api.supabase_client import get_supabase
-from moviepy.editor import VideoFileClip
-import requests
+from api.repository import get_repository
+from api.gen_status import get_status_cache, get_base_url, UpstreamStatusError
+from api.library import register_video
+from api.library_index import get_library_index
+from api.ingest import get_ingest_manager
+from api.storage import get_storage_manager, QuotaExceededError, InsufficientStorageError
+from api.scheduler import get_user_plan
+from api.metrics import external_call, BYTES_WRITTEN
 import json
 import sys
 import time
@@ -21,6 +26,14 @@ class VideoGenRequest(BaseModel):
     url_list: Optional[List[str]] = None
     aspect_ratio: str = "3:2"
     size: str = "720P"
+    # When set, finished videos are ingested into this user's library
+    user_id: Optional[str] = None
+
+def _track_ingest(request: VideoGenRequest, data):
+    if not request.user_id or not settings.VIDEO_GEN_AUTO_INGEST:
+        return
+    if isinstance(data, dict) and data.get("id"):
+        get_ingest_manager().track(data["id"], request.user_id, request.prompt)
 
 @router.post("/generate")
 async def generate_video(request: VideoGenRequest):
@@ -30,8 +43,9 @@ async def generate_video(request: VideoGenRequest):
     """
     if not settings.VIDEO_GEN_API_KEY:
         raise HTTPException(status_code=500, detail="Video generation API key not configured")
+    import requests
 
-    url = f"https://{settings.VIDEO_GEN_HOST}/v1/video/create"
+    url = f"{get_base_url()}/v1/video/create"
     
     # Ensure API key is pure ASCII
     api_key = settings.VIDEO_GEN_API_KEY.strip()
@@ -82,10 +96,12 @@ async def generate_video(request: VideoGenRequest):
                     time.sleep(2)
                 
                 # Explicitly disable proxies to avoid local proxy errors
-                response = requests.post(url, json=payload, headers=headers, timeout=60, proxies={"http": None, "https": None})
+                with external_call("video_gen", "create"):
+                    response = requests.post(url, json=payload, headers=headers, timeout=60, proxies={"http": None, "https": None})
                 
                 if response.status_code == 200:
                     data = response.json()
+                    _track_ingest(request, data)
                     results.append({
                         "status": "success",
                         "image_url": img_url,
@@ -144,9 +160,11 @@ async def generate_video(request: VideoGenRequest):
                         "aspect_ratio": request.aspect_ratio,
                         "size": request.size,
                       }
-                      response = requests.post(url, json=payload, headers=headers, timeout=60, proxies={"http": None, "https": None})
+                      with external_call("video_gen", "create"):
+                          response = requests.post(url, json=payload, headers=headers, timeout=60, proxies={"http": None, "https": None})
                       if response.status_code != 200:
                           raise HTTPException(status_code=response.status_code, detail=response.text)
+                      _track_ingest(request, response.json())
                       return {
                           "status": "success",
                           "data": response.json()
@@ -167,8 +185,26 @@ async def generate_video(request: VideoGenRequest):
 
 
 
+class StatusBatchRequest(BaseModel):
+    ids: List[str]
+
+@router.post("/status/batch")
+def get_task_status_batch(request: StatusBatchRequest):
+    """
+    Query many video generation task statuses at once.
+    Served from the shared status cache; only stale ids hit the upstream API.
+    """
+    if not settings.VIDEO_GEN_API_KEY:
+        raise HTTPException(status_code=500, detail="Video generation API key not configured")
+
+    ids = [i.strip() for i in request.ids if i and i.strip()]
+    return {
+        "status": "success",
+        "results": get_status_cache().get_many(ids)
+    }
+
 @router.get("/status/{task_id}")
-async def get_task_status(task_id: str):
+def get_task_status(task_id: str):
     """
     Query video generation task status.
     """
@@ -176,53 +212,43 @@ async def get_task_status(task_id: str):
         raise HTTPException(status_code=500, detail="Video generation API key not configured")
 
     try:
-        url = f"https://{settings.VIDEO_GEN_HOST}/v1/video/query?id={task_id}"
-        
-        api_key = settings.VIDEO_GEN_API_KEY.strip()
-        try:
-            api_key.encode('ascii')
-        except UnicodeEncodeError:
-            api_key = ''.join([i for i in api_key if ord(i) < 128])
-
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Explicitly disable proxies
-        response = requests.get(url, headers=headers, timeout=30, proxies={"http": None, "https": None})
-        
-        # print(f"Status Query Response ({task_id}): {response.text}", flush=True)
-
-        if response.status_code != 200:
-            print(f"Status API Error ({response.status_code})")
-            raise HTTPException(status_code=response.status_code, detail=f"External API Error: {response.text}")
-            
+        data = get_status_cache().get(task_id)
         return {
             "status": "success",
-            "data": response.json()
+            "data": data
         }
 
+    except UpstreamStatusError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"Status query error occurred: {e}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-def generate_thumbnail(video_path: str, output_path: str):
-    try:
-        with VideoFileClip(video_path) as clip:
-            # Capture frame at 1s or middle if shorter
-            time_point = min(1.0, clip.duration / 2) if clip.duration else 0
-            clip.save_frame(output_path, t=time_point)
-        return True
-    except Exception as e:
-        print(f"Failed to generate thumbnail for {video_path}: {e}")
-        return False
+class IngestRequest(BaseModel):
+    generation_id: str
+    user_id: str
+    prompt: str = ""
+
+@router.post("/ingest")
+def ingest_generated_video(request: IngestRequest):
+    """
+    Queue a video generation job for ingest into the user's library.
+    The download starts as soon as the job is (or already was) finished.
+    """
+    job = get_ingest_manager().track(request.generation_id, request.user_id, request.prompt)
+    return {"status": "success", "generation_id": request.generation_id, "ingest": job}
+
+@router.get("/ingest/{generation_id}")
+def get_ingest_status(generation_id: str):
+    job = get_ingest_manager().get(generation_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return {"status": "success", "generation_id": generation_id, "ingest": job}
 
 @router.post("/upload")
-async def upload_video(
+def upload_video(
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
@@ -235,31 +261,25 @@ async def upload_video(
         unique_filename = f"{file_id}{file_ext}"
         file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
 
-        # Save file locally
+        # Save file locally, stopping as soon as the user's quota or the disk floor is hit
+        storage = get_storage_manager()
+        storage.ensure_capacity()
+        remaining = storage.remaining_quota(user_id, get_user_plan(user_id))
+        written = 0
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
-
-        # Generate Thumbnail
-        thumbnail_filename = f"{file_id}.jpg"
-        thumbnail_path = os.path.join(settings.UPLOAD_DIR, thumbnail_filename)
-        generate_thumbnail(file_path, thumbnail_path)
-
-        # Create record in Supabase
-        supabase = get_supabase()
-        video_data = {
-            "id": file_id,
-            "user_id": user_id,
-            "filename": file.filename,
-            "original_path": file_path,
-            "format": file_ext.lstrip('.'),
-            "file_size": file_size,
-            # "duration": 0, # Duration will be extracted later by processing worker
-        }
+            while True:
+                chunk = file.file.read(1024 * 1024)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > remaining:
+                    raise QuotaExceededError("Storage quota exceeded")
+                buffer.write(chunk)
+        storage.add_usage(user_id, written)
+        BYTES_WRITTEN.inc(written, kind="upload")
         
-        data, count = supabase.table("videos").insert(video_data).execute()
+        # Probe, generate thumbnail and create record in Supabase
+        register_video(file_id, file_path, file.filename, user_id)
 
         return {
             "status": "success",
@@ -272,6 +292,10 @@ async def upload_video(
         # Clean up file if error occurs
         if 'file_path' in locals() and os.path.exists(file_path):
             os.remove(file_path)
+        if isinstance(e, QuotaExceededError):
+            raise HTTPException(status_code=413, detail=str(e))
+        if isinstance(e, InsufficientStorageError):
+            raise HTTPException(status_code=507, detail=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/sync")
@@ -280,43 +304,15 @@ def sync_library(user_id: str):
     Syncs the database with the local file system.
     1. Deletes records if file is missing.
     2. Generates thumbnails if missing.
+    Only files changed since the last sync are looked at (see LibraryIndex);
+    only `user_id`'s records are deleted.
     """
     try:
-        supabase = get_supabase()
-        
-        # 1. Fetch all videos for the user
-        response = supabase.table("videos").select("*").eq("user_id", user_id).execute()
-        videos = response.data
-        
-        deleted_count = 0
-        thumbnail_count = 0
-        
-        # 2. Check existence of each file
-        for video in videos:
-            local_filename = f"{video['id']}.{video['format']}"
-            local_path = os.path.join(settings.UPLOAD_DIR, local_filename)
-            
-            # Check if video exists
-            if not os.path.exists(local_path):
-                # Fallback to original path check
-                if os.path.exists(video['original_path']):
-                    local_path = video['original_path']
-                else:
-                    print(f"File missing for video {video['id']}, deleting record.")
-                    supabase.table("videos").delete().eq("id", video['id']).execute()
-                    deleted_count += 1
-                    continue
-            
-            # Check/Generate Thumbnail
-            thumbnail_path = os.path.join(settings.UPLOAD_DIR, f"{video['id']}.jpg")
-            if not os.path.exists(thumbnail_path):
-                print(f"Generating missing thumbnail for {video['id']}")
-                if generate_thumbnail(local_path, thumbnail_path):
-                    thumbnail_count += 1
-                
+        changes = get_library_index().sync(user_id)
         return {
             "status": "success", 
-            "message": f"Library synced. Removed {deleted_count} missing files. Generated {thumbnail_count} thumbnails."
+            "message": f"Library synced. Removed {changes['deleted_records']} missing files. Generated {changes['thumbnails']} thumbnails.",
+            "changes": changes
         }
         
     except Exception as e:
@@ -326,14 +322,13 @@ def sync_library(user_id: str):
 @router.delete("/{video_id}")
 def delete_video(video_id: str):
     try:
-        supabase = get_supabase()
+        repo = get_repository()
         
         # Fetch video details to get path
-        res = supabase.table("videos").select("*").eq("id", video_id).single().execute()
-        if not res.data:
+        video = repo.get("videos", video_id)
+        if not video:
             raise HTTPException(status_code=404, detail="Video not found")
         
-        video = res.data
         local_filename = f"{video['id']}.{video['format']}"
         local_path = os.path.join(settings.UPLOAD_DIR, local_filename)
         thumbnail_path = os.path.join(settings.UPLOAD_DIR, f"{video['id']}.jpg")
@@ -345,10 +340,13 @@ def delete_video(video_id: str):
             os.remove(thumbnail_path)
             
         # Delete from DB
-        supabase.table("videos").delete().eq("id", video_id).execute()
+        repo.delete("videos", {"id": video_id})
+        get_storage_manager().add_usage(video.get("user_id"), -(video.get("file_size") or 0))
         
         return {"status": "success", "message": "Video deleted"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Delete video error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
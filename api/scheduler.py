@@ -0,0 +1,257 @@
+import time
+import threading
+from collections import deque
+from functools import lru_cache
+from api.config import get_settings
+from api.repository import get_repository
+from api.memory import memory_budget
+
+settings = get_settings()
+
+PLAN_WEIGHTS = {"free": 1.0, "premium": 4.0, "enterprise": 8.0}
+PLAN_QUOTAS = {"free": 1, "premium": 2, "enterprise": 4}
+
+_plan_cache = {}
+_plan_lock = threading.Lock()
+PLAN_CACHE_TTL = 300
+
+
+def get_user_plan(user_id: str) -> str:
+    """users.plan for `user_id`, cached for a few minutes. Unknown users count as free."""
+    now = time.monotonic()
+    with _plan_lock:
+        cached = _plan_cache.get(user_id)
+        if cached and now - cached[0] < PLAN_CACHE_TTL:
+            return cached[1]
+
+    plan = "free"
+    try:
+        user = get_repository().get("users", user_id, "plan")
+        if user and user.get("plan") in PLAN_WEIGHTS:
+            plan = user["plan"]
+    except Exception as e:
+        print(f"Failed to look up plan for user {user_id}: {e}")
+
+    with _plan_lock:
+        _plan_cache[user_id] = (now, plan)
+    return plan
+
+
+class _Job:
+    __slots__ = ("task_id", "user_id", "plan", "fn", "on_done", "cost", "estimate", "memory",
+                 "enqueued_at", "started_at", "finish_tag")
+
+    def __init__(self, task_id, user_id, plan, fn, on_done, cost, estimate, memory=0):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.plan = plan
+        self.fn = fn
+        self.on_done = on_done
+        self.cost = cost
+        self.estimate = estimate
+        self.memory = memory
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finish_tag = 0.0
+
+
+class FairScheduler:
+    """
+    Runs edit tasks on a fixed number of worker slots.
+
+    - Weighted fair queuing: every job gets a virtual finish tag of
+      max(virtual time, user's last tag) + cost / plan weight, so a user's
+      share of the slots is proportional to their plan weight no matter how
+      many tasks they submit.
+    - Per-user quotas cap how many of a user's tasks run at once.
+    - Aging subtracts `aging_rate` x seconds waited from the tag, so no queued
+      task starves behind a steady stream of heavier-weighted users.
+    - With policy "sjf" the predicted render time replaces the fair-share tag
+      (shortest job first, same aging), which cuts the average queue latency.
+    - Memory admission: a job only starts while the estimated peak memory of
+      the running jobs plus its own fits `memory_budget` bytes (0: no limit).
+      The next job in order waits for memory rather than being overtaken, so
+      large renders don't starve; a job that alone exceeds the budget runs
+      once nothing else does.
+
+    Costs are in units of one minute of predicted render time.
+    """
+
+    def __init__(self, slots: int, aging_rate: float, policy: str = "fair", weights=None, quotas=None,
+                 memory_budget: int = 0):
+        self.slots = slots
+        self.aging_rate = aging_rate
+        self.policy = policy
+        self.weights = weights or PLAN_WEIGHTS
+        self.quotas = quotas or PLAN_QUOTAS
+        self.memory_budget = memory_budget
+        self._reserved = 0       # estimated peak bytes of the running jobs
+        self._cv = threading.Condition()
+        self._queue = []
+        self._running = {}       # user_id -> running job count
+        self._running_tasks = {} # task_id -> job
+        self._user_tags = {}     # user_id -> last finish tag
+        self._vtime = 0.0
+        self._waits = {plan: deque(maxlen=200) for plan in self.weights}
+        self._workers = []
+        for i in range(slots):
+            worker = threading.Thread(target=self._work, name=f"edit-slot-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, task_id: str, user_id: str, fn, plan: str = None, estimate: float = 60.0, on_done=None,
+               memory: int = 0):
+        """
+        Queues `fn()` for `task_id`; `estimate` is the predicted run time in seconds,
+        `memory` the predicted peak bytes. `on_done()` runs after fn, even if it failed.
+        """
+        plan = plan or get_user_plan(user_id)
+        job = _Job(task_id, user_id, plan, fn, on_done, max(estimate / 60.0, 0.01), estimate, memory)
+        with self._cv:
+            start_tag = max(self._vtime, self._user_tags.get(user_id, 0.0))
+            job.finish_tag = start_tag + job.cost / self.weights.get(plan, 1.0)
+            self._user_tags[user_id] = job.finish_tag
+            self._queue.append(job)
+            self._cv.notify()
+        return job
+
+    def _priority(self, job: _Job, now: float) -> float:
+        base = job.cost if self.policy == "sjf" else job.finish_tag
+        return base - self.aging_rate * (now - job.enqueued_at)
+
+    def _ordered(self, now: float):
+        return sorted(self._queue, key=lambda j: self._priority(j, now))
+
+    def _pick(self):
+        now = time.monotonic()
+        for job in self._ordered(now):
+            if self._running.get(job.user_id, 0) < self.quotas.get(job.plan, 1):
+                if (self.memory_budget and self._running_tasks
+                        and self._reserved + job.memory > self.memory_budget):
+                    return None
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cv:
+                job = self._pick()
+                while job is None:
+                    self._cv.wait()
+                    job = self._pick()
+                self._queue.remove(job)
+                self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+                self._running_tasks[job.task_id] = job
+                self._reserved += job.memory
+                job.started_at = time.monotonic()
+                self._vtime = max(self._vtime, job.finish_tag - job.cost / self.weights.get(job.plan, 1.0))
+                self._waits.setdefault(job.plan, deque(maxlen=200)).append(time.monotonic() - job.enqueued_at)
+
+            try:
+                job.fn()
+            except Exception as e:
+                print(f"Scheduled task {job.task_id} raised: {e}")
+            finally:
+                with self._cv:
+                    self._running[job.user_id] -= 1
+                    if not self._running[job.user_id]:
+                        del self._running[job.user_id]
+                    self._running_tasks.pop(job.task_id, None)
+                    self._reserved -= job.memory
+                    # A freed user quota or memory may make a queued job eligible
+                    self._cv.notify_all()
+                if job.on_done:
+                    try:
+                        job.on_done()
+                    except Exception as e:
+                        print(f"on_done for task {job.task_id} raised: {e}")
+
+    def queue_info(self, task_id: str):
+        """
+        Queue position, time waited and ETA (seconds until the task should be
+        done) for a queued or running task, None otherwise. The ETA assumes the
+        work ahead of it spreads evenly over all slots.
+        """
+        with self._cv:
+            now = time.monotonic()
+            running = self._running_tasks.get(task_id)
+            if running is not None:
+                return {"queue_position": 0, "queue_wait_seconds": round(running.started_at - running.enqueued_at, 1),
+                        "eta_seconds": round(max(0.0, running.estimate - (now - running.started_at)), 1)}
+
+            # Work still left on the slots
+            ahead = sum(max(0.0, j.estimate - (now - j.started_at)) for j in self._running_tasks.values())
+            for position, job in enumerate(self._ordered(now), start=1):
+                if job.task_id == task_id:
+                    return {"queue_position": position, "queue_wait_seconds": round(now - job.enqueued_at, 1),
+                            "eta_seconds": round(ahead / self.slots + job.estimate, 1)}
+                ahead += job.estimate
+        return None
+
+    def cancel(self, task_id: str):
+        """
+        Drops a queued task; returns ("queued" | "running" | None, predicted seconds).
+        A dropped task's on_done still runs. Running tasks are left to the
+        caller (see cancellation.CancelToken).
+        """
+        with self._cv:
+            running = self._running_tasks.get(task_id)
+            if running is not None:
+                return "running", running.estimate
+            job = next((j for j in self._queue if j.task_id == task_id), None)
+            if job is None:
+                return None, None
+            self._queue.remove(job)
+        if job.on_done:
+            try:
+                job.on_done()
+            except Exception as e:
+                print(f"on_done for task {job.task_id} raised: {e}")
+        return "queued", job.estimate
+
+    def reserve(self, task_id: str, memory: int):
+        """Replaces a running job's memory estimate, e.g. once its plan is known."""
+        with self._cv:
+            job = self._running_tasks.get(task_id)
+            if job is not None:
+                self._reserved += memory - job.memory
+                job.memory = memory
+                self._cv.notify_all()
+
+    def update_estimate(self, task_id: str, estimate: float):
+        """Replaces a running job's predicted run time, e.g. once its plan is known."""
+        with self._cv:
+            job = self._running_tasks.get(task_id)
+            if job is not None:
+                job.estimate = estimate
+
+    def depth(self):
+        """(queued, running) task counts."""
+        with self._cv:
+            return len(self._queue), len(self._running_tasks)
+
+    def snapshot(self):
+        with self._cv:
+            def p95(values):
+                ordered = sorted(values)
+                return round(ordered[int(0.95 * (len(ordered) - 1))], 2) if ordered else None
+
+            queued_by_plan = {}
+            for job in self._queue:
+                queued_by_plan[job.plan] = queued_by_plan.get(job.plan, 0) + 1
+            return {
+                "policy": self.policy,
+                "slots": self.slots,
+                "running": len(self._running_tasks),
+                "queued": len(self._queue),
+                "queued_by_plan": queued_by_plan,
+                "wait_p95_seconds_by_plan": {plan: p95(w) for plan, w in self._waits.items()},
+                "memory_budget_mb": self.memory_budget // (1024 * 1024),
+                "memory_reserved_mb": self._reserved // (1024 * 1024),
+            }
+
+
+@lru_cache()
+def get_scheduler() -> FairScheduler:
+    return FairScheduler(settings.WORKER_SLOTS, settings.SCHEDULER_AGING_RATE, settings.SCHEDULER_POLICY,
+                         memory_budget=memory_budget())
@@ -0,0 +1,338 @@
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from api.config import get_settings
+from api.repository import get_repository
+
+settings = get_settings()
+
+MB = 1024 * 1024
+
+
+class QuotaExceededError(Exception):
+    """The user's plan storage quota would be exceeded."""
+
+
+class InsufficientStorageError(Exception):
+    """The node is below its free disk space floor."""
+
+
+def dir_usage(path: str):
+    """(bytes, files) under `path`."""
+    total, count = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+                count += 1
+            except OSError:
+                pass
+    return total, count
+
+
+def output_task_id(name: str):
+    """Task id of a final output (edited_<task id>.mp4, edited_<task id>_<rendition>.mp4), else None."""
+    if not name.startswith("edited_"):
+        return None
+    return name[len("edited_"):].split(".")[0].split("_")[0] or None
+
+
+def _remove(path: str) -> int:
+    """Deletes a file or directory tree; returns the bytes freed."""
+    try:
+        if os.path.isdir(path):
+            size = dir_usage(path)[0]
+            shutil.rmtree(path, ignore_errors=True)
+            return size
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return 0
+
+
+class StorageManager:
+    """
+    Owns the disk lifecycle of the API node.
+
+    - Scratch: every task renders with its own directory under SCRATCH_DIR
+      (moviepy temp audio, rendition audio, ...), removed when the task ends.
+      SCRATCH_DIR can point at a tmpfs such as /dev/shm.
+    - Quotas: uploads and new edits are refused once a user's videos and
+      results exceed their plan's quota.
+    - Eviction (janitor thread, every STORAGE_SWEEP_INTERVAL seconds):
+      scratch dirs, render checkpoints and previews past their TTL, then
+      least recently served HLS packages while free space is below
+      DISK_MIN_FREE_MB. New work is refused while that floor can't be met.
+      Final outputs are only evicted when opted in: past OUTPUT_TTL since
+      last served, and least recently served first after the HLS packages
+      with OUTPUT_EVICT_ON_PRESSURE. Their results rows go with them.
+    """
+
+    def __init__(self):
+        self.scratch_dir = settings.SCRATCH_DIR
+        os.makedirs(os.path.join(self.scratch_dir, "tasks"), exist_ok=True)
+        self.quotas = {
+            "free": settings.STORAGE_QUOTA_FREE_MB * MB,
+            "premium": settings.STORAGE_QUOTA_PREMIUM_MB * MB,
+            "enterprise": settings.STORAGE_QUOTA_ENTERPRISE_MB * MB,
+        }
+        self._lock = threading.Lock()
+        self._active = set()      # task ids with a live scratch dir
+        self._accessed = {}       # HLS task id -> last time it was served
+        self._served = {}         # task id -> last time one of its final outputs was served
+        self._user_usage = {}     # user_id -> (checked at, bytes)
+        self._evicted = {"scratch": 0, "checkpoints": 0, "previews": 0, "hls": 0, "outputs": 0}
+        self._freed_bytes = 0
+        self._last_sweep = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- scratch -------------------------------------------------------
+
+    def create_scratch(self, task_id: str) -> str:
+        """Private scratch directory for one task run; pair with remove_scratch."""
+        path = os.path.join(self.scratch_dir, "tasks", task_id)
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._active.add(task_id)
+        return path
+
+    def remove_scratch(self, task_id: str):
+        with self._lock:
+            self._active.discard(task_id)
+        shutil.rmtree(os.path.join(self.scratch_dir, "tasks", task_id), ignore_errors=True)
+
+    @contextmanager
+    def task_scratch(self, task_id: str):
+        try:
+            yield self.create_scratch(task_id)
+        finally:
+            self.remove_scratch(task_id)
+
+    # --- capacity and quotas -------------------------------------------
+
+    def free_bytes(self, path: str = None) -> int:
+        return shutil.disk_usage(path or settings.OUTPUT_DIR).free
+
+    def ensure_capacity(self, needed_bytes: int = 0):
+        """Raises InsufficientStorageError unless `needed_bytes` fit above the free space floor."""
+        floor = settings.DISK_MIN_FREE_MB * MB
+        for path in {settings.UPLOAD_DIR, settings.OUTPUT_DIR, self.scratch_dir}:
+            if self.free_bytes(path) - needed_bytes < floor:
+                # Try to make room before refusing
+                self.sweep()
+                if self.free_bytes(path) - needed_bytes < floor:
+                    raise InsufficientStorageError(f"Not enough free disk space on {path}")
+
+    def quota(self, plan: str) -> int:
+        return self.quotas.get(plan, self.quotas["free"])
+
+    def user_usage(self, user_id: str, max_age: float = 60.0) -> int:
+        """
+        Bytes of the user's uploaded videos and final results, cached for `max_age` seconds.
+        Previews are not charged: they are short-lived (PREVIEW_TTL) and never passed to add_usage.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._user_usage.get(user_id)
+            if cached and now - cached[0] < max_age:
+                return cached[1]
+
+        try:
+            repo = get_repository()
+            videos = repo.find("videos", {"user_id": user_id}, "file_size")
+            results = repo.find("results", {"tasks.user_id": user_id}, "file_size, quality", embed={"tasks": "user_id"})
+        except Exception as e:
+            # Don't block users on a failed lookup; the next check retries
+            print(f"Failed to compute storage usage of user {user_id}: {e}")
+            return cached[1] if cached else 0
+        used = sum(v.get("file_size") or 0 for v in videos)
+        used += sum(r.get("file_size") or 0 for r in results if r.get("quality") != "preview")
+        with self._lock:
+            self._user_usage[user_id] = (now, used)
+        return used
+
+    def add_usage(self, user_id: str, size: int):
+        """Counts bytes just written (or, negative, deleted) for a user without waiting for the cache to expire."""
+        with self._lock:
+            cached = self._user_usage.get(user_id)
+            if cached:
+                self._user_usage[user_id] = (cached[0], max(0, cached[1] + size))
+
+    def remaining_quota(self, user_id: str, plan: str) -> int:
+        return max(0, self.quota(plan) - self.user_usage(user_id))
+
+    def check_quota(self, user_id: str, plan: str, incoming_bytes: int = 0):
+        remaining = self.remaining_quota(user_id, plan)
+        if remaining <= 0 or incoming_bytes > remaining:
+            raise QuotaExceededError(f"Storage quota of the {plan} plan ({self.quota(plan) // MB} MB) exceeded")
+
+    # --- eviction ------------------------------------------------------
+
+    def touch_hls(self, task_id: str):
+        with self._lock:
+            self._accessed[task_id] = time.time()
+
+    def touch_output(self, name: str):
+        task_id = output_task_id(name)
+        if task_id:
+            with self._lock:
+                self._served[task_id] = time.time()
+
+    def _expired(self, path: str, ttl: float, now: float) -> bool:
+        try:
+            return ttl > 0 and now - os.path.getmtime(path) > ttl
+        except OSError:
+            return False
+
+    def _evict(self, kind: str, path: str):
+        freed = _remove(path)
+        with self._lock:
+            self._evicted[kind] += 1
+            self._freed_bytes += freed
+        print(f"Evicted {kind} {path} ({freed // 1024} KB)")
+
+    def sweep(self):
+        """One eviction pass (see class docstring). Returns bytes freed."""
+        now = time.time()
+        freed_before = self._freed_bytes
+
+        tasks_dir = os.path.join(self.scratch_dir, "tasks")
+        with self._lock:
+            active = set(self._active)
+        for name in os.listdir(tasks_dir) if os.path.isdir(tasks_dir) else []:
+            path = os.path.join(tasks_dir, name)
+            if name not in active and self._expired(path, settings.SCRATCH_TTL, now):
+                self._evict("scratch", path)
+
+        checkpoints = settings.RENDER_CHECKPOINT_DIR
+        for name in os.listdir(checkpoints) if os.path.isdir(checkpoints) else []:
+            path = os.path.join(checkpoints, name)
+            if self._expired(path, settings.CHECKPOINT_TTL, now):
+                self._evict("checkpoints", path)
+
+        expired_previews = []
+        for name in os.listdir(settings.OUTPUT_DIR):
+            path = os.path.join(settings.OUTPUT_DIR, name)
+            if name.startswith("preview_") and self._expired(path, settings.PREVIEW_TTL, now):
+                self._evict("previews", path)
+                expired_previews.append(name)
+        if expired_previews:
+            try:
+                get_repository().delete_many("results", expired_previews, column="output_path")
+            except Exception as e:
+                print(f"Failed to delete expired preview rows: {e}")
+
+        # HLS packages can be rebuilt from the MP4; drop the least recently served first
+        floor = settings.DISK_MIN_FREE_MB * MB
+        if self.free_bytes() < floor:
+            hls_dir = os.path.join(settings.OUTPUT_DIR, "hls")
+            packages = []
+            for name in os.listdir(hls_dir) if os.path.isdir(hls_dir) else []:
+                path = os.path.join(hls_dir, name)
+                with self._lock:
+                    last = self._accessed.get(name)
+                packages.append((last or os.path.getmtime(path), name, path))
+            for _, name, path in sorted(packages):
+                if self.free_bytes() >= floor:
+                    break
+                self._evict("hls", path)
+                with self._lock:
+                    self._accessed.pop(name, None)
+
+        if settings.OUTPUT_TTL > 0 or settings.OUTPUT_EVICT_ON_PRESSURE:
+            self._sweep_outputs(now, floor)
+
+        self._last_sweep = now
+        return self._freed_bytes - freed_before
+
+    def _sweep_outputs(self, now: float, floor: int):
+        # Every final output of a task (renditions too) goes at once, with its HLS package
+        groups = {}
+        for name in os.listdir(settings.OUTPUT_DIR):
+            task_id = output_task_id(name)
+            if task_id:
+                groups.setdefault(task_id, []).append(name)
+        ordered = []
+        for task_id, names in groups.items():
+            with self._lock:
+                served = self._served.get(task_id)
+            try:
+                last = max([served or 0] + [os.path.getmtime(os.path.join(settings.OUTPUT_DIR, n)) for n in names])
+            except OSError:
+                continue
+            ordered.append((last, task_id, names))
+        ordered.sort()
+
+        evicted = []
+        for last, task_id, names in ordered:
+            stale = settings.OUTPUT_TTL > 0 and now - last > settings.OUTPUT_TTL
+            pressed = settings.OUTPUT_EVICT_ON_PRESSURE and self.free_bytes() < floor
+            if not stale and not pressed:
+                continue
+            for name in names:
+                self._evict("outputs", os.path.join(settings.OUTPUT_DIR, name))
+            shutil.rmtree(os.path.join(settings.OUTPUT_DIR, "hls", task_id), ignore_errors=True)
+            with self._lock:
+                self._served.pop(task_id, None)
+                self._accessed.pop(task_id, None)
+            evicted.extend(names)
+        if evicted:
+            try:
+                get_repository().delete_many("results", evicted, column="output_path")
+            except Exception as e:
+                print(f"Failed to delete evicted output rows: {e}")
+            # Owners aren't known here; usage is recomputed on the next quota check
+            with self._lock:
+                self._user_usage.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(settings.STORAGE_SWEEP_INTERVAL):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Storage sweep failed: {e}")
+
+        self._thread = threading.Thread(target=run, name="storage-janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def evictions(self):
+        """(evicted count per kind, bytes freed) without walking the directories like snapshot()."""
+        with self._lock:
+            return dict(self._evicted), self._freed_bytes
+
+    def snapshot(self):
+        dirs = {}
+        for name, path in (("uploads", settings.UPLOAD_DIR), ("outputs", settings.OUTPUT_DIR),
+                           ("scratch", self.scratch_dir), ("checkpoints", settings.RENDER_CHECKPOINT_DIR)):
+            size, files = dir_usage(path) if os.path.isdir(path) else (0, 0)
+            usage = shutil.disk_usage(path if os.path.isdir(path) else settings.OUTPUT_DIR)
+            dirs[name] = {"path": path, "bytes": size, "files": files,
+                          "disk_free_bytes": usage.free, "disk_total_bytes": usage.total}
+        with self._lock:
+            return {
+                "dirs": dirs,
+                "min_free_bytes": settings.DISK_MIN_FREE_MB * MB,
+                "quotas_bytes": dict(self.quotas),
+                "active_scratch": len(self._active),
+                "evicted": dict(self._evicted),
+                "freed_bytes": self._freed_bytes,
+                "last_sweep": self._last_sweep,
+            }
+
+
+@lru_cache()
+def get_storage_manager() -> StorageManager:
+    return StorageManager()
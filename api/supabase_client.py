@@ -1,12 +1,23 @@
+import threading
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
 from api.config import get_settings
-from functools import lru_cache
+from api.metrics import instrument_httpx
 
 settings = get_settings()
 
-@lru_cache()
+_local = threading.local()
+
 def get_supabase() -> Client:
-    # Increase timeout to 60 seconds to handle slow proxy/network
-    options = ClientOptions(postgrest_client_timeout=60)
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY, options=options)
+    """
+    This thread's client, created on first use. Every request made from the
+    thread reuses its pooled connections; threads don't share one, as the
+    postgrest session (headers, connection pool) isn't safe to share.
+    """
+    client = getattr(_local, "client", None)
+    if client is None:
+        # Increase timeout to 60 seconds to handle slow proxy/network
+        options = ClientOptions(postgrest_client_timeout=60)
+        client = _local.client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY, options=options)
+        instrument_httpx(client.postgrest.session, "supabase")
+    return client
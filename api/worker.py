@@ -4,15 +4,34 @@ import threading
 import uuid
 import json
 import re
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
-import moviepy.video.fx.all as vfx
+import copy
 from api.config import get_settings
-from api.supabase_client import get_supabase
-from openai import OpenAI
-import google.generativeai as genai
+from api.repository import get_repository, now_iso
+from api.model_health import (
+    get_model_registry, call_with_fallback, remaining,
+    ModelsUnavailableError, DeadlineExceededError
+)
+from api.llm_clients import get_llm_manager
+from api.scheduler import get_scheduler
+from api.cost_model import get_cost_model, build_features, features_from_video
+from api.renditions import render_ladder, rendition_names
+from api.encoder_profiles import choose_profile, ffmpeg_params
+from api.packaging import package_hls
+from api.checkpoint import RenderCheckpoint, render_segmented, source_fingerprint
+from api.cancellation import get_cancellations, CancelLogger, TaskCancelled
+from api.storage import get_storage_manager
+from api.metrics import span, external_call, begin_trace, end_trace, TASKS, BYTES_READ, BYTES_WRITTEN
+from api.profiler import get_profilers
+from api.plan_optimizer import optimize_plan, plan_cost
+from api.memory import (
+    get_memory_model, get_memory_watchdog, memory_features, memory_features_from_video, prior_peak, MB
+)
 
 settings = get_settings()
 
+# Failures that say nothing about the plan or the source: the render checkpoint is kept
+RETRYABLE_ERRORS = (OSError, MemoryError, DeadlineExceededError, ModelsUnavailableError)
+
 def analyze_instruction(prompt: str, video_duration: float):
     """
     Use DeepSeek (via OpenAI SDK) to analyze user instruction and return edit parameters.
@@ -22,11 +41,6 @@ def analyze_instruction(prompt: str, video_duration: float):
         return None
 
     try:
-        client = OpenAI(
-            api_key=settings.DEEPSEEK_API_KEY,
-            base_url=settings.DEEPSEEK_BASE_URL
-        )
-
         system_prompt = f"""
 You are a professional video editing assistant.
 The current video duration is {video_duration} seconds.
@@ -74,8 +88,10 @@ User: "Smartly cut the video to keep interesting parts"
 Output: {{ "operations": [ {{ "type": "auto_scene_cut", "action": "detect_and_cut", "method": "ai" }} ] }}
 """
 
-        response = client.chat.completions.create(
-            model="deepseek-chat", 
+        # Pooled client shared across tasks; identical concurrent prompts share one call
+        response = get_llm_manager().chat_completion(
+            "deepseek",
+            "deepseek-chat",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
@@ -92,26 +108,32 @@ Output: {{ "operations": [ {{ "type": "auto_scene_cut", "action": "detect_and_cu
         print(f"LLM Analysis failed: {e}")
         return None
 
-def analyze_video_with_gemini(video_path: str, instruction: str = "Identify the most interesting scenes"):
+def analyze_video_with_gemini(video_path: str, instruction: str = "Identify the most interesting scenes", deadline: float = None):
     """
     Uploads video to Gemini and asks for scene timestamps.
     Returns a list of tuples (start, end).
+    `deadline` is a time.monotonic() timestamp; no call is allowed to outlive it.
     """
     if not settings.GOOGLE_API_KEY:
         print("Google API Key not found.")
         return None
     
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        genai = get_llm_manager().ensure_genai()
         
         print(f"Uploading file to Gemini: {video_path}")
-        video_file = genai.upload_file(path=video_path)
+        with external_call("gemini", "upload"):
+            video_file = genai.upload_file(path=video_path)
         
         # Wait for processing
-        while video_file.state.name == "PROCESSING":
-            print("Waiting for Gemini to process video...")
-            time.sleep(2)
-            video_file = genai.get_file(video_file.name)
+        with span("gemini_processing"):
+            while video_file.state.name == "PROCESSING":
+                if remaining(deadline) <= 2:
+                    print("Task deadline reached while Gemini was processing the video.")
+                    return None
+                print("Waiting for Gemini to process video...")
+                time.sleep(2)
+                video_file = genai.get_file(video_file.name)
             
         if video_file.state.name == "FAILED":
             print("Gemini video processing failed.")
@@ -133,32 +155,34 @@ def analyze_video_with_gemini(video_path: str, instruction: str = "Identify the
         }}
         """
         
-        models_to_try = ["gemini-1.5-flash-latest", "gemini-1.5-flash", "gemini-pro"]
-        response = None
-        
-        for model_name in models_to_try:
-            print(f"Trying model: {model_name}")
-            # Simple retry logic for network flakes
-            for attempt in range(3):
+        def generate(model_name, timeout):
+            try:
+                model = genai.GenerativeModel(model_name=model_name)
+                return get_llm_manager().call(
+                    "gemini", model_name,
+                    lambda: model.generate_content([video_file, prompt], request_options={"timeout": timeout})
+                )
+            except Exception as e:
+                # Log this specific model failure too
                 try:
-                    model = genai.GenerativeModel(model_name=model_name)
-                    response = model.generate_content([video_file, prompt], request_options={"timeout": 600})
-                    print(f"Success with {model_name}")
-                    break # Break retry loop
-                except Exception as e:
-                    print(f"Model {model_name} failed (attempt {attempt+1}/3): {e}")
-                    # Log this specific model failure too
-                    try:
-                        with open("api_error.log", "a") as f:
-                            f.write(f"[{uuid.uuid4()}] Model {model_name} attempt {attempt+1} failed: {str(e)}\n")
-                    except:
-                        pass
-                    time.sleep(2) # Wait before retry
-            else:
-                # If retry loop finished without break, continue to next model
-                continue
-            # If break, we found a working model
-            break
+                    with open("api_error.log", "a") as f:
+                        f.write(f"[{uuid.uuid4()}] Model {model_name} failed: {str(e)}\n")
+                except:
+                    pass
+                raise
+
+        # Models with an open circuit are skipped, the rest are tried fastest first
+        models_to_try = [m.strip() for m in settings.GEMINI_MODELS.split(",") if m.strip()]
+        response = None
+        try:
+            _, response = call_with_fallback(
+                get_model_registry(), models_to_try, generate,
+                deadline=deadline, hedge_factor=settings.GEMINI_HEDGE_FACTOR
+            )
+        except (ModelsUnavailableError, DeadlineExceededError) as e:
+            print(f"Gemini unavailable: {e}")
+        except Exception as e:
+            print(f"Gemini generation failed: {e}")
                 
         if not response:
             print("All Gemini models failed.")
@@ -197,19 +221,292 @@ def analyze_video_with_gemini(video_path: str, instruction: str = "Identify the
             pass
         return None
 
-def process_video_task(task_id: str):
+BGM_PATH = os.path.join("api", "assets", "music", "bgm.mp3")
+
+def plan_operations(prompt: str, duration: float):
+    """
+    Asks DeepSeek for the edit plan. Returns a (possibly empty) list of operations.
+    """
+    analysis_result = analyze_instruction(prompt, duration)
+    
+    operations = []
+    if analysis_result and "operations" in analysis_result:
+        operations = analysis_result["operations"]
+    elif analysis_result and "action" in analysis_result: # Backward compatibility
+         operations = [{"type": "subclip", "start": analysis_result.get("start", 0), "end": analysis_result.get("end", duration)}]
+    return operations
+
+def load_bgm_samples(fps: int = 44100):
+    """
+    Decodes the background music once. Returns (samples, fps) or None.
+    Unlike a shared AudioFileClip, the decoded array is safe to read from several render threads.
+    """
+    if not os.path.exists(BGM_PATH):
+        return None
+    try:
+        import numpy as np
+        from moviepy.editor import AudioFileClip
+        bgm_clip = AudioFileClip(BGM_PATH, fps=fps)
+        # Same as to_soundarray(), which breaks on newer numpy (vstack of a generator)
+        samples = np.vstack(list(bgm_clip.iter_chunks(fps=fps, chunksize=50000)))
+        bgm_clip.close()
+        return samples, fps
+    except Exception as e:
+        print(f"Failed to decode background music: {e}")
+        return None
+
+_encoder_warm = False
+
+def warm_up_encoder():
+    """
+    Runs one tiny libx264 encode so the ffmpeg binary, codec libraries and
+    page cache are hot before the first real render. Only does work once per process.
+    """
+    global _encoder_warm
+    if _encoder_warm:
+        return
+    try:
+        import subprocess
+        from moviepy.config import get_setting
+        subprocess.run(
+            [get_setting("FFMPEG_BINARY"), "-loglevel", "error", "-f", "lavfi",
+             "-i", "color=c=black:s=64x64:d=0.2", "-c:v", "libx264", "-f", "null", "-"],
+            check=True, timeout=30
+        )
+    except Exception as e:
+        print(f"Encoder warm-up failed: {e}")
+    _encoder_warm = True
+
+def prewarm():
+    """
+    Loads what the API process no longer imports up front, so the first task
+    doesn't pay for it: moviepy with its fx modules, the ffmpeg binary and
+    libx264 (warm_up_encoder), the DeepSeek client and google.generativeai.
+    Started on a background thread at startup (WORKER_PREWARM).
+    """
+    started = time.monotonic()
+    try:
+        import moviepy.editor  # noqa: F401
+        import moviepy.video.fx.all  # noqa: F401
+        import moviepy.audio.fx.all  # noqa: F401
+        warm_up_encoder()
+        if settings.DEEPSEEK_API_KEY:
+            get_llm_manager().openai_client("deepseek")
+        if settings.GOOGLE_API_KEY:
+            get_llm_manager().ensure_genai()
+    except Exception as e:
+        print(f"Worker pre-warm failed: {e}")
+    print(f"Worker pre-warm finished in {time.monotonic() - started:.2f}s")
+
+def apply_operations(clip, operations, input_path: str, prompt: str = "", deadline: float = None, bgm=None):
+    """
+    Applies the edit plan to `clip`.
+    Returns (final_clip, output_format, is_audio_only).
+    `bgm` is an optional pre-decoded (samples, fps) background track, see load_bgm_samples.
+    """
+    # moviepy is only imported once there is something to edit (see prewarm)
+    from moviepy.editor import AudioFileClip, CompositeAudioClip
+    from moviepy.audio.AudioClip import AudioArrayClip
+    import moviepy.video.fx.all as vfx
+    import moviepy.audio.fx.all as afx
+
+    final_clip = clip
+    output_format = "mp4"
+    is_audio_only = False
+
+    # Apply operations in sequence
+    for op in operations:
+        op_type = op.get("type")
+        
+        if op_type == "subclip":
+            start = float(op.get("start", 0))
+            end = float(op.get("end", final_clip.duration))
+            start = max(0, min(start, final_clip.duration))
+            end = max(0, min(end, final_clip.duration))
+            if start < end:
+                print(f"Applying subclip: {start} -> {end}")
+                final_clip = final_clip.subclip(start, end)
+        
+        elif op_type == "speed":
+            factor = float(op.get("factor", 1.0))
+            if factor > 0 and factor != 1.0:
+                print(f"Applying speed: {factor}x")
+                final_clip = final_clip.fx(vfx.speedx, factor)
+        
+        elif op_type == "audio":
+            action = op.get("action", "keep")
+            volume = float(op.get("volume", 1.0))
+            
+            if action == "extract":
+                is_audio_only = True
+                output_format = "mp3"
+            elif action == "remove":
+                print("Removing audio")
+                final_clip = final_clip.without_audio()
+            elif volume != 1.0:
+                print(f"Adjusting volume: {volume}")
+                if final_clip.audio:
+                    final_clip.audio = final_clip.audio.volumex(volume)
+
+        elif op_type == "bg_music":
+            bgm_volume = float(op.get("volume", 0.3))
+            # Seconds of music skipped: set when a trim was moved before this operation (see plan_optimizer)
+            bgm_offset = float(op.get("offset", 0))
+            bgm_path = BGM_PATH
+            
+            if bgm is None and not os.path.exists(bgm_path):
+                 print(f"Background music file not found at {bgm_path}")
+            else:
+                print(f"Adding background music from {bgm_path}")
+                try:
+                    if bgm is not None:
+                        # Pre-decoded track shared between the renders of a batch
+                        bgm_clip = AudioArrayClip(bgm[0], fps=bgm[1])
+                    else:
+                        bgm_clip = AudioFileClip(bgm_path)
+                    # Loop bgm to match video duration
+                    bgm_end = bgm_offset + final_clip.duration
+                    if bgm_clip.duration < bgm_end:
+                        bgm_clip = bgm_clip.fx(afx.audio_loop, duration=bgm_end)
+                    else:
+                        bgm_clip = bgm_clip.subclip(0, bgm_end)
+                    if bgm_offset:
+                        bgm_clip = bgm_clip.subclip(bgm_offset, bgm_end)
+                    
+                    bgm_clip = bgm_clip.volumex(bgm_volume)
+                    
+                    # Mix audio
+                    if final_clip.audio:
+                        final_audio = CompositeAudioClip([final_clip.audio, bgm_clip])
+                    else:
+                        final_audio = bgm_clip
+                    
+                    final_clip = final_clip.set_audio(final_audio)
+                except Exception as e:
+                    print(f"Failed to add background music: {e}")
+
+        elif op_type == "auto_scene_cut":
+            print("Performing Smart Scene Cut...")
+            
+            # Check method
+            method = op.get("method", "ai")
+            if not settings.GOOGLE_API_KEY:
+                print("Google API Key missing, falling back to classic scenedetect")
+                method = "classic"
+            
+            # Scenes detected by an earlier pass (the preview) of the same plan
+            scenes = [tuple(sc) for sc in op.get("scenes") or []]
+            if scenes:
+                method = "reuse"
+            
+            if method == "ai":
+                print("Using Gemini for scene detection...")
+                # Use the original prompt or a default one
+                instruction = prompt or "Identify the most interesting scenes"
+                # If prompt is just "Smart Scene Cut", refine it
+                if "smart scene cut" in instruction.lower() or "智能分镜" in instruction:
+                    instruction = "Identify the start and end timestamps of distinct, high-quality scenes, excluding blurry or static shots."
+                
+                with span("scene_detect"):
+                    scenes = analyze_video_with_gemini(input_path, instruction, deadline=deadline)
+                
+                if not scenes:
+                    print("Gemini returned no scenes.")
+                    # Do NOT fallback silently if AI was requested
+                    raise Exception("AI Scene Detection failed. Please check your Google API Key or Quota.")
+            
+            if method == "classic":
+                try:
+                    from scenedetect import detect, ContentDetector
+                    print("Using PySceneDetect...")
+                    with span("scene_detect"):
+                        scene_list = detect(input_path, ContentDetector(threshold=27.0))
+                    # Convert to simple tuples
+                    scenes = [(s[0].get_seconds(), s[1].get_seconds()) for s in scene_list]
+                except ImportError:
+                    print("scenedetect not installed")
+                except Exception as e:
+                    print(f"Scene detection failed: {e}")
+
+            # Keep them in this task's plan so its final render skips detection
+            # (process_video_task works on a private copy of a batch's plan)
+            op["scenes"] = [list(sc) for sc in scenes]
+
+            if scenes:
+                print(f"Found {len(scenes)} scenes to keep.")
+                # Scenes with a fade in/out for smoothness, as a cut list (see cutlist.py)
+                from api.cutlist import CutListClip, snap_cuts
+                cuts = snap_cuts(scenes, final_clip.duration, final_clip.fps or 24)
+                if cuts:
+                    final_clip = CutListClip(final_clip, cuts)
+            else:
+                print("No scenes detected or kept.")
+
+    return final_clip, output_format, is_audio_only
+
+def write_preview(final_clip, output_path: str, logger="bar", temp_audiofile: str = None):
+    """
+    Fast low-resolution render (ultrafast preset, reduced fps, scaled by
+    ffmpeg) so the user can check the edit before the full-quality encode.
+    """
+    final_clip.write_videofile(
+        output_path, codec="libx264", audio_codec="aac", temp_audiofile=temp_audiofile,
+        fps=min(final_clip.fps or settings.PREVIEW_FPS, settings.PREVIEW_FPS),
+        preset="ultrafast", audio_bitrate="64k",
+        # Never taller than the source (no upscaling of small sources)
+        ffmpeg_params=["-vf", f"scale=-2:min({settings.PREVIEW_HEIGHT}\\,ih)", "-crf", "32"],
+        logger=logger
+    )
+
+def remove_task_outputs(task_id: str):
+    """
+    Deletes the final outputs, preview (file and `results` row), profile,
+    HLS package and render checkpoint of a task.
+    """
+    import glob
+    import shutil
+    paths = (glob.glob(os.path.join(settings.OUTPUT_DIR, f"edited_{task_id}*"))
+             + glob.glob(os.path.join(settings.OUTPUT_DIR, f"preview_{task_id}*"))
+             + [get_profilers().task_profile_path(task_id)])
+    for path in [p for p in paths if os.path.exists(p)]:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Failed to remove {path}: {e}")
+    try:
+        get_repository().delete("results", {"task_id": task_id, "quality": "preview"})
+    except Exception as e:
+        print(f"Failed to remove preview result of task {task_id}: {e}")
+    shutil.rmtree(os.path.join(settings.OUTPUT_DIR, "hls", task_id), ignore_errors=True)
+    RenderCheckpoint(settings.RENDER_CHECKPOINT_DIR, task_id).clear()
+
+def process_video_task(task_id: str, operations=None, shared=None, skip_preview: bool = False):
     """
     Background worker to process video editing tasks.
+    `operations` skips planning (batch jobs plan once); `shared` holds resources reused across a batch.
+    Unless `skip_preview`, a low-res preview is published first (see write_preview).
+    The task stops at the next stage boundary or written frame once cancelled (see cancel_task).
     """
-    supabase = get_supabase()
+    repo = get_repository()
+    task_started = time.monotonic()
+    token = get_cancellations().token(task_id)
+    logger = CancelLogger(token)
+    trace = begin_trace(task_id)
+    # Lets POST /task/{id}/profile attach a sampling profiler to this thread mid-render
+    get_profilers().register(task_id)
+    # Temp files of this run (moviepy audio, rendition audio) live here, never in the cwd
+    scratch = get_storage_manager().create_scratch(task_id)
     
     try:
         # 1. Fetch task details
-        task_res = supabase.table("tasks").select("*, videos(*)").eq("id", task_id).single().execute()
-        task = task_res.data
+        with span("fetch"):
+            task = repo.get("tasks", task_id, embed={"videos": "*"})
         if not task:
             print(f"Task {task_id} not found")
             return
+        if task["status"] == "cancelled":
+            token.cancel()
+        token.check()
 
         video = task["videos"]
         input_path = video["original_path"]
@@ -217,176 +514,202 @@ def process_video_task(task_id: str):
         if not os.path.exists(input_path):
             error_msg = f"Input file not found: {input_path}"
             print(error_msg)
-            supabase.table("tasks").update({
+            repo.update("tasks", {
                 "status": "failed", 
                 "error_message": error_msg
-            }).eq("id", task_id).execute()
+            }, {"id": task_id})
             return
 
-        # Update status to processing
-        supabase.table("tasks").update({"status": "processing", "progress": 10}).eq("id", task_id).execute()
+        # Every external call made for this task must finish within its time budget
+        parameters = task.get("parameters") or {}
+        deadline = time.monotonic() + float(parameters.get("deadline_seconds") or settings.TASK_DEADLINE_SECONDS)
+        if parameters.get("profile") and settings.PROFILER_ENABLED:
+            get_profilers().start_task(task_id)
+
+        # A checkpoint left by an interrupted render pins the plan and encoder it was started with
+        checkpoint = RenderCheckpoint(settings.RENDER_CHECKPOINT_DIR, task_id)
+        saved_plan = checkpoint.load_plan()
+        if saved_plan and saved_plan.get("source") != source_fingerprint(input_path):
+            checkpoint.clear()
+            saved_plan = None
+        if saved_plan:
+            print(f"Resuming task {task_id} from checkpoint")
+            operations = saved_plan["operations"]
+            skip_preview = True
+
+        # Update status to processing (never over a cancellation that raced us)
+        repo.update("tasks", {"status": "processing", "progress": 10}, {"id": task_id, "status": ("neq", "cancelled")})
         
-        clip = VideoFileClip(input_path)
+        with span("open"):
+            from moviepy.editor import VideoFileClip
+            clip = VideoFileClip(input_path)
         duration = clip.duration
+        rendition_count = len(rendition_names(parameters.get("renditions")))
+        # Peak memory is tracked from here; the estimate is refined once the plan is known
+        memory_inputs = memory_features(duration, clip.w, clip.h, operations, rendition_count)
+        get_memory_watchdog().begin(task_id, get_memory_model().estimate(memory_inputs))
+        BYTES_READ.inc(os.path.getsize(input_path), kind="source")
 
-        # 2. LLM Analysis (DeepSeek for planning)
-        print(f"Analyzing video {video['id']} with prompt: {task['prompt']}")
-        analysis_result = analyze_instruction(task['prompt'], duration)
-        
-        operations = []
-        if analysis_result and "operations" in analysis_result:
-            operations = analysis_result["operations"]
-        elif analysis_result and "action" in analysis_result: # Backward compatibility
-             operations = [{"type": "subclip", "start": analysis_result.get("start", 0), "end": analysis_result.get("end", duration)}]
+        # 2. LLM Analysis (DeepSeek for planning); batch members arrive with a shared plan
+        if operations is None:
+            print(f"Analyzing video {video['id']} with prompt: {task['prompt']}")
+            with span("plan"):
+                operations = plan_operations(task['prompt'], duration)
+        else:
+            # Batch members share one plan; this task records its own detected scenes on it
+            operations = copy.deepcopy(operations)
+        token.check()
+        # Same output from less work: fused trims and speed changes, no-ops dropped (see plan_optimizer).
+        # Stored plans (checkpoint, confirmed preview) were optimized by the run that stored them.
+        if not skip_preview:
+            optimized = optimize_plan(operations, duration)
+            print(f"Task {task_id} plan: {len(operations)} -> {len(optimized)} operations, "
+                  f"~{plan_cost(operations, duration):.0f} -> ~{plan_cost(optimized, duration):.0f} media seconds")
+            operations = optimized
+        # The enqueue-time estimates assumed an average plan; predict from the real one
+        get_scheduler().update_estimate(
+            task_id, get_cost_model().expect(task_id, build_features(duration, clip.w, clip.h, operations)))
+        memory_inputs = memory_features(duration, clip.w, clip.h, operations, rendition_count)
+        memory_estimate = get_memory_model().estimate(memory_inputs)
+        get_scheduler().reserve(task_id, memory_estimate)
+        get_memory_watchdog().update_estimate(task_id, memory_estimate)
         
-        supabase.table("tasks").update({"progress": 30}).eq("id", task_id).execute()
+        repo.update("tasks", {"progress": 30}, {"id": task_id})
         
-        # 3. Perform Video Editing
-        final_clip = clip
-        output_format = "mp4"
-        is_audio_only = False
-
-        # Apply operations in sequence
-        for op in operations:
-            op_type = op.get("type")
-            
-            if op_type == "subclip":
-                start = float(op.get("start", 0))
-                end = float(op.get("end", final_clip.duration))
-                start = max(0, min(start, final_clip.duration))
-                end = max(0, min(end, final_clip.duration))
-                if start < end:
-                    print(f"Applying subclip: {start} -> {end}")
-                    final_clip = final_clip.subclip(start, end)
-            
-            elif op_type == "speed":
-                factor = float(op.get("factor", 1.0))
-                if factor > 0 and factor != 1.0:
-                    print(f"Applying speed: {factor}x")
-                    final_clip = final_clip.fx(vfx.speedx, factor)
-            
-            elif op_type == "audio":
-                action = op.get("action", "keep")
-                volume = float(op.get("volume", 1.0))
-                
-                if action == "extract":
-                    is_audio_only = True
-                    output_format = "mp3"
-                elif action == "remove":
-                    print("Removing audio")
-                    final_clip = final_clip.without_audio()
-                elif volume != 1.0:
-                    print(f"Adjusting volume: {volume}")
-                    if final_clip.audio:
-                        final_clip.audio = final_clip.audio.volumex(volume)
+        # 3. Perform Video Editing (builds the clip graph; scene detection runs here)
+        with span("edit"):
+            final_clip, output_format, is_audio_only = apply_operations(
+                clip, operations, input_path, task.get("prompt", ""), deadline=deadline,
+                bgm=(shared or {}).get("bgm")
+            )
+        token.check()
 
-            elif op_type == "bg_music":
-                bgm_volume = float(op.get("volume", 0.3))
-                bgm_path = os.path.join("api", "assets", "music", "bgm.mp3")
-                
-                if not os.path.exists(bgm_path):
-                     print(f"Background music file not found at {bgm_path}")
-                else:
-                    print(f"Adding background music from {bgm_path}")
-                    try:
-                        bgm_clip = AudioFileClip(bgm_path)
-                        # Loop bgm to match video duration
-                        if bgm_clip.duration < final_clip.duration:
-                            bgm_clip = bgm_clip.fx(vfx.audio_loop, duration=final_clip.duration)
-                        else:
-                            bgm_clip = bgm_clip.subclip(0, final_clip.duration)
-                        
-                        bgm_clip = bgm_clip.volumex(bgm_volume)
-                        
-                        # Mix audio
-                        if final_clip.audio:
-                            final_audio = CompositeAudioClip([final_clip.audio, bgm_clip])
-                        else:
-                            final_audio = bgm_clip
-                        
-                        final_clip = final_clip.set_audio(final_audio)
-                    except Exception as e:
-                        print(f"Failed to add background music: {e}")
-
-            elif op_type == "auto_scene_cut":
-                print("Performing Smart Scene Cut...")
-                
-                # Check method
-                method = op.get("method", "ai")
-                if not settings.GOOGLE_API_KEY:
-                    print("Google API Key missing, falling back to classic scenedetect")
-                    method = "classic"
-                
-                scenes = []
-                
-                if method == "ai":
-                    print("Using Gemini for scene detection...")
-                    # Use the original prompt or a default one
-                    instruction = task.get("prompt", "Identify the most interesting scenes")
-                    # If prompt is just "Smart Scene Cut", refine it
-                    if "smart scene cut" in instruction.lower() or "智能分镜" in instruction:
-                        instruction = "Identify the start and end timestamps of distinct, high-quality scenes, excluding blurry or static shots."
-                    
-                    scenes = analyze_video_with_gemini(input_path, instruction)
-                    
-                    if not scenes:
-                        print("Gemini returned no scenes.")
-                        # Do NOT fallback silently if AI was requested
-                        raise Exception("AI Scene Detection failed. Please check your Google API Key or Quota.")
-                
-                if method == "classic":
-                    try:
-                        from scenedetect import detect, ContentDetector
-                        print("Using PySceneDetect...")
-                        scene_list = detect(input_path, ContentDetector(threshold=27.0))
-                        # Convert to simple tuples
-                        scenes = [(s[0].get_seconds(), s[1].get_seconds()) for s in scene_list]
-                    except ImportError:
-                        print("scenedetect not installed")
-                    except Exception as e:
-                        print(f"Scene detection failed: {e}")
-
-                if scenes:
-                    print(f"Found {len(scenes)} scenes to keep.")
-                    clips = []
-                    for start_t, end_t in scenes:
-                        # Ensure within bounds
-                        start_t = max(0, min(start_t, final_clip.duration))
-                        end_t = max(0, min(end_t, final_clip.duration))
-                        
-                        if end_t - start_t < 0.5: # Skip very short clips
-                            continue
-                            
-                        s_clip = final_clip.subclip(start_t, end_t)
-                        # Add fade in/out for smoothness
-                        s_clip = s_clip.fx(vfx.fadein, 0.5).fx(vfx.fadeout, 0.5)
-                        clips.append(s_clip)
-                    
-                    if clips:
-                        from moviepy.editor import concatenate_videoclips
-                        final_clip = concatenate_videoclips(clips, method="compose")
-                else:
-                    print("No scenes detected or kept.")
+        # Phase 1: publish a quick preview before spending CPU on the full render
+        if parameters.get("preview", settings.PREVIEW_ENABLED) and not is_audio_only and not skip_preview:
+            preview_filename = f"preview_{task_id}.mp4"
+            preview_path = os.path.join(settings.OUTPUT_DIR, preview_filename)
+            with span("preview"):
+                write_preview(final_clip, preview_path, logger=logger,
+                              temp_audiofile=os.path.join(scratch, "preview_audio.m4a"))
+            BYTES_WRITTEN.inc(os.path.getsize(preview_path), kind="preview")
+            repo.insert("results", {
+                "id": str(uuid.uuid4()),
+                "task_id": task_id,
+                "output_path": preview_filename,
+                "duration": int(final_clip.duration or 0),
+                "file_size": os.path.getsize(preview_path),
+                "format": "mp4",
+                "quality": "preview"
+            })
+            print(f"Preview for task {task_id} ready")
+
+            if parameters.get("final_render") == "on_confirm":
+                # Keep the plan (incl. detected scenes) so the final render matches the preview
+                repo.update("tasks", {
+                    "status": "awaiting_confirmation",
+                    "progress": 50,
+                    "parameters": {**parameters, "plan": operations}
+                }, {"id": task_id})
+                final_clip.close()
+                clip.close()
+                get_cost_model().discard(task_id)
+                return
 
+            repo.update("tasks", {"progress": 50}, {"id": task_id})
+
+        # Phase 2: full-quality render
         # Generate output path
         output_filename = f"edited_{task_id}.{output_format}"
         output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
         
-        supabase.table("tasks").update({"progress": 70}).eq("id", task_id).execute()
+        repo.update("tasks", {"progress": 70}, {"id": task_id})
         
+        # Encoder settings from the request, the source and how busy the slots are right now
+        if saved_plan:
+            encoder = saved_plan["encoder"]
+        else:
+            queued, running = get_scheduler().depth()
+            encoder = choose_profile(
+                parameters.get("encoder_profile", settings.ENCODER_PROFILE), clip.w, clip.h, duration,
+                queued=queued, running=running, slots=settings.WORKER_SLOTS,
+                backlog_per_slot=settings.ENCODER_BACKLOG_PER_SLOT
+            )
+        print(f"Task {task_id} encoder profile: {encoder['profile']} ({encoder['reason']})")
+
+        # Long single-file renders are checkpointed segment by segment
+        segmented = (settings.RENDER_CHECKPOINTS and not is_audio_only and not parameters.get("renditions")
+                     and (final_clip.duration or 0) >= settings.RENDER_CHECKPOINT_MIN_SECONDS)
+        if segmented and not saved_plan:
+            # Detected scenes were stored into the operations, so a resumed render rebuilds the same clip
+            checkpoint.save_plan({
+                "source": source_fingerprint(input_path),
+                "operations": operations,
+                "encoder": encoder,
+                "segment_seconds": settings.RENDER_SEGMENT_SECONDS
+            })
+
+        # Scene cuts of the untouched source are encoded by ffmpeg scene by scene, without moviepy
+        cut_list = None
+        if settings.CUT_LIST_RENDER and not is_audio_only and not parameters.get("renditions"):
+            from api.cutlist import cut_list_of, render_cut_list
+            cut_list = cut_list_of(final_clip, clip)
+
+        def on_segment(done, total):
+            repo.update("tasks", {"progress": 70 + int(20 * done / total)}, {"id": task_id})
+
         # Write output file
-        if is_audio_only:
-            if final_clip.audio:
-                final_clip.audio.write_audiofile(output_path)
+        renditions = []
+        with span("encode"):
+            if is_audio_only:
+                if final_clip.audio:
+                    final_clip.audio.write_audiofile(output_path, logger=logger)
+                else:
+                    raise Exception("Video has no audio track to extract")
+            elif parameters.get("renditions"):
+                # One decode/filter pass feeding one encoder per rendition;
+                # the tallest rendition is written to output_path
+                renditions = render_ladder(final_clip, settings.OUTPUT_DIR, f"edited_{task_id}", parameters["renditions"],
+                                           tmp_dir=scratch, encoder=encoder, cancel=token)
+            elif cut_list is not None:
+                # Long renders keep their encoded runs of scenes in the checkpoint
+                render_cut_list(final_clip, cut_list, output_path, encoder, tmp_dir=scratch,
+                                checkpoint=checkpoint if segmented else None,
+                                segment_seconds=(saved_plan or {}).get("segment_seconds", settings.RENDER_SEGMENT_SECONDS),
+                                on_segment=on_segment, cancel=token, logger=logger)
+            elif segmented:
+                segment_seconds = (saved_plan or {}).get("segment_seconds", settings.RENDER_SEGMENT_SECONDS)
+                total, resumed = render_segmented(final_clip, output_path, checkpoint, encoder, segment_seconds, on_segment,
+                                                   logger=logger)
+                if resumed:
+                    print(f"Task {task_id}: reused {resumed}/{total} checkpointed segments")
             else:
-                raise Exception("Video has no audio track to extract")
-        else:
-            final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac")
+                final_clip.write_videofile(
+                    output_path, codec="libx264", audio_codec="aac",
+                    temp_audiofile=os.path.join(scratch, "final_audio.m4a"),
+                    preset=encoder["preset"], threads=encoder["threads"],
+                    ffmpeg_params=ffmpeg_params(encoder, final_clip.fps), logger=logger
+                )
         
+        # Optional adaptive streaming package (remux only, no second encode)
+        hls_playlist = None
+        token.check()
+        if not is_audio_only and parameters.get("hls", settings.HLS_ENABLED):
+            repo.update("tasks", {"progress": 90}, {"id": task_id})
+            if renditions:
+                variants = [{"name": r["name"], "path": r["path"], "height": r["height"],
+                             "width": int(final_clip.w * r["height"] / final_clip.h) // 2 * 2} for r in renditions]
+            else:
+                variants = [{"name": "source", "path": output_path, "width": final_clip.w, "height": final_clip.h}]
+            hls_dir = os.path.join(settings.OUTPUT_DIR, "hls", task_id)
+            with span("package"):
+                package_hls(variants, hls_dir, final_clip.duration, settings.HLS_SEGMENT_SECONDS)
+            hls_playlist = f"hls/{task_id}/master.m3u8"
+
         final_clip.close()
         clip.close()
         
-        # 4. Save Result
+        # 4. Save Result (a task cancelled by now gets no results rows)
+        token.check()
         result_id = str(uuid.uuid4())
         
         final_duration = 0
@@ -396,23 +719,86 @@ def process_video_task(task_id: str):
         else:
              final_duration = int(final_clip.duration or 0)
 
+        # Feed the ETA model with what this render actually cost
+        render_seconds = time.monotonic() - task_started
+        features = build_features(duration, clip.w, clip.h, operations, output_duration=final_duration)
+        eta_error = get_cost_model().observe(task_id, features, render_seconds)
+        profile = get_profilers().finish(task_id)
+        # Measured peak (above the process at task start); renders that ran alone calibrate the estimate
+        memory = get_memory_watchdog().end(task_id)
+        if memory:
+            memory["prior_mb"] = round(prior_peak(memory_inputs) / MB, 1)
+            if memory["exclusive"]:
+                get_memory_model().observe(memory_inputs, memory["peak_mb"] * MB)
+
         result_data = {
             "id": result_id,
             "task_id": task_id,
             "output_path": output_filename,
             "duration": final_duration,
             "file_size": os.path.getsize(output_path),
-            "format": output_format
+            "format": output_format,
+            "quality": "final",
+            "quality_metrics": {
+                "render_seconds": round(render_seconds, 2),
+                "input": {"duration": duration, "width": clip.w, "height": clip.h},
+                "operations": [op.get("type") for op in operations],
+                "eta": eta_error,
+                "encoder": None if is_audio_only else encoder,
+                "hls": hls_playlist,
+                "stages": trace.stages(),
+                "profile": profile,
+                "memory": memory
+            }
         }
         
-        supabase.table("results").insert(result_data).execute()
+        if renditions:
+            result_data["quality_metrics"]["rendition"] = renditions[0]["name"]
+            result_data["quality_metrics"]["height"] = renditions[0]["height"]
+            result_data["quality_metrics"]["encoder"] = {**encoder, "crf": renditions[0]["crf"]}
+            rows = [result_data]
+            for rendition in renditions[1:]:
+                rows.append({
+                    "id": str(uuid.uuid4()),
+                    "task_id": task_id,
+                    "output_path": rendition["filename"],
+                    "duration": final_duration,
+                    "file_size": os.path.getsize(rendition["path"]),
+                    "format": "mp4",
+                    "quality": "final",
+                    "quality_metrics": {"rendition": rendition["name"], "height": rendition["height"],
+                                        "encoder": {**encoder, "crf": rendition["crf"]}}
+                })
+            repo.insert("results", rows)
+        else:
+            rows = [result_data]
+            repo.insert("results", result_data)
+        get_storage_manager().add_usage(task["user_id"], sum(row["file_size"] for row in rows))
+        for row in rows:
+            BYTES_WRITTEN.inc(row["file_size"], kind="final")
         
         # 5. Mark Task as Completed
-        supabase.table("tasks").update({"status": "completed", "progress": 100, "completed_at": "now()"}).eq("id", task_id).execute()
+        repo.update("tasks", {"status": "completed", "progress": 100, "completed_at": now_iso()},
+                    {"id": task_id, "status": ("neq", "cancelled")})
+        checkpoint.clear()
+        TASKS.inc(outcome="completed")
         print(f"Task {task_id} completed successfully")
 
     except Exception as e:
-        error_msg = f"Error processing task {task_id}: {str(e)}"
+        get_cost_model().discard(task_id)
+        if token.cancelled and not token.reason:
+            # TaskCancelled, or a killed ffmpeg failing the write: not an error
+            print(f"Task {task_id} cancelled")
+            remove_task_outputs(task_id)
+            TASKS.inc(outcome="cancelled")
+            return
+
+        # Stopped by the memory watchdog: a failure, whatever exception the stop surfaced as
+        error = token.reason or str(e)
+        if token.reason:
+            remove_task_outputs(task_id)
+        TASKS.inc(outcome="failed")
+        error_msg = f"Error processing task {task_id}: {error}"
         print(error_msg)
         import traceback
         traceback.print_exc()
@@ -421,13 +807,81 @@ def process_video_task(task_id: str):
         with open("api_error.log", "a") as f:
             f.write(f"[{uuid.uuid4()}] {error_msg}\n")
             traceback.print_exc(file=f)
+        # A re-run of the task resumes after transient failures (I/O, memory, deadline,
+        # models down); the sweeper drops the checkpoint after CHECKPOINT_TTL otherwise
+        if not isinstance(e, RETRYABLE_ERRORS):
+            RenderCheckpoint(settings.RENDER_CHECKPOINT_DIR, task_id).clear()
             
-        supabase.table("tasks").update({
+        repo.update("tasks", {
             "status": "failed", 
-            "error_message": str(e)
-        }).eq("id", task_id).execute()
+            "error_message": error
+        }, {"id": task_id, "status": ("neq", "cancelled")})
+    finally:
+        get_cancellations().release(task_id)
+        get_storage_manager().remove_scratch(task_id)
+        get_memory_watchdog().end(task_id)
+        # Failed renders keep their profile (that's usually when it's wanted); cancelled ones don't
+        get_profilers().unregister(task_id, save=not token.cancelled or bool(token.reason))
+        end_trace()
+
+def enqueue_task(task_id: str, user_id: str, operations=None, shared=None, on_done=None, video: dict = None,
+                 skip_preview: bool = False):
+    """
+    Queues a task on the scheduler; it runs once a slot and the user's plan
+    quota allow. `video` (duration/metadata of the `videos` row) feeds the
+    render time prediction used for ETAs and shortest-job-first ordering,
+    and the peak memory estimate the scheduler admits tasks by.
+    """
+    model = get_cost_model()
+    features = features_from_video(video, operations)
+    if operations is None:
+        # Planned once it runs: the plan-dependent features are unknown, not zero
+        features = model.unplanned_features(features)
+    estimate = model.expect(task_id, features)
+    get_scheduler().submit(
+        task_id, user_id,
+        lambda: process_video_task(task_id, operations, shared, skip_preview),
+        estimate=estimate,
+        on_done=on_done,
+        memory=get_memory_model().estimate(memory_features_from_video(video, operations))
+    )
+
+def cancel_task(task_id: str):
+    """
+    Cancels a queued or running task: queued tasks leave the scheduler
+    without running, running ones stop at their next check and have their
+    ffmpeg processes killed. Returns "queued", "running" or None (not known
+    to this process; a later run sees the cancelled status and stops).
+    """
+    state, estimate = get_scheduler().cancel(task_id)
+    if state == "queued":
+        get_cost_model().discard(task_id)
+        get_cancellations().cancel(task_id, queued_estimate=estimate)
+    elif state == "running":
+        get_cancellations().cancel(task_id, running_estimate=estimate)
+    return state
+
+def resume_interrupted_tasks():
+    """
+    Re-queues tasks a previous process left pending or processing (the
+    scheduler queue lives in memory). Tasks with a render checkpoint pick
+    up from their last completed segment; confirmed tasks (a plan stored
+    with their preview) render that plan without planning or previewing
+    again. Assumes one worker process.
+    """
+    try:
+        tasks = get_repository().find("tasks", {"status": ("in", ["pending", "processing"])}, "id, user_id, status, parameters",
+                                      embed={"videos": "duration, metadata"})
+    except Exception as e:
+        print(f"Failed to look up interrupted tasks: {e}")
+        return 0
 
-def start_processing_thread(task_id: str):
-    thread = threading.Thread(target=process_video_task, args=(task_id,))
-    thread.daemon = True
-    thread.start()
+    for task in tasks:
+        checkpoint = RenderCheckpoint(settings.RENDER_CHECKPOINT_DIR, task["id"]).load_plan()
+        parameters = task.get("parameters") or {}
+        confirmed = "plan" in parameters
+        print(f"Re-queueing interrupted task {task['id']} ({task['status']}{', checkpointed' if checkpoint else ''}"
+              f"{', confirmed' if confirmed else ''})")
+        enqueue_task(task["id"], task["user_id"], operations=parameters["plan"] if confirmed else None,
+                     video=task.get("videos"), skip_preview=confirmed)
+    return len(tasks)
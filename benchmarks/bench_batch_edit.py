@@ -0,0 +1,121 @@
+"""
+Batch edit vs. per-video loop.
+
+Renders the same edit on N synthetic clips twice:
+  loop  - one thread per video, each planning, decoding BGM and encoding on its own
+          (what N calls to /api/video/edit do)
+  batch - plan once, decode BGM once, warm the encoder once, bounded render pool
+          (what /api/video/edit/batch does)
+
+DeepSeek is replaced by a stub with --plan-latency seconds of delay.
+
+Run from the repo root:  python benchmarks/bench_batch_edit.py --videos 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moviepy.editor import ColorClip, VideoFileClip
+from moviepy.audio.AudioClip import AudioArrayClip
+from api import worker
+
+OPERATIONS = [
+    {"type": "subclip", "start": 0, "end": 4},
+    {"type": "audio", "action": "keep", "volume": 0.8},
+    {"type": "bg_music", "action": "add", "volume": 0.3},
+]
+
+
+def make_clip(path: str, duration: float, size=(320, 240), fps: int = 24):
+    t = np.linspace(0, duration, int(44100 * duration), endpoint=False)
+    tone = (0.1 * np.sin(2 * np.pi * 330 * t)).reshape(-1, 1)
+    audio = AudioArrayClip(np.hstack([tone, tone]), fps=44100)
+    clip = ColorClip(size, color=(40, 90, 160), duration=duration).set_audio(audio)
+    clip.write_videofile(path, fps=fps, codec="libx264", audio_codec="aac", verbose=False, logger=None)
+
+
+def make_bgm(path: str, duration: float = 3.0):
+    t = np.linspace(0, duration, int(44100 * duration), endpoint=False)
+    tone = (0.1 * np.sin(2 * np.pi * 440 * t)).reshape(-1, 1)
+    AudioArrayClip(np.hstack([tone, tone]), fps=44100).write_audiofile(path, verbose=False, logger=None)
+
+
+def render(input_path: str, output_path: str, operations, bgm=None):
+    clip = VideoFileClip(input_path)
+    final_clip, _, _ = worker.apply_operations(clip, operations, input_path, bgm=bgm)
+    final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac", verbose=False, logger=None)
+    final_clip.close()
+    clip.close()
+
+
+def run_loop(inputs, out_dir):
+    def one(i, path):
+        operations = worker.plan_operations("same prompt", 6.0)
+        render(path, os.path.join(out_dir, f"loop_{i}.mp4"), operations)
+
+    threads = [threading.Thread(target=one, args=(i, p)) for i, p in enumerate(inputs)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_batch(inputs, out_dir, concurrency: int):
+    operations = worker.plan_operations("same prompt", 6.0)
+    bgm = worker.load_bgm_samples()
+    worker.warm_up_encoder()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, path in enumerate(inputs):
+            executor.submit(render, path, os.path.join(out_dir, f"batch_{i}.mp4"), operations, bgm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=6.0)
+    parser.add_argument("--plan-latency", type=float, default=1.5, help="Simulated DeepSeek latency per plan")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    def fake_analyze(prompt, duration):
+        time.sleep(args.plan_latency)
+        return {"operations": OPERATIONS}
+
+    worker.analyze_instruction = fake_analyze
+
+    with tempfile.TemporaryDirectory() as tmp:
+        worker.BGM_PATH = os.path.join(tmp, "bgm.mp3")
+        make_bgm(worker.BGM_PATH)
+        source = os.path.join(tmp, "source.mp4")
+        make_clip(source, args.duration)
+        inputs = [source] * args.videos
+
+        results = {"videos": args.videos, "duration": args.duration, "plan_latency": args.plan_latency,
+                   "concurrency": args.concurrency}
+        for name, fn in (("loop", lambda: run_loop(inputs, tmp)),
+                         ("batch", lambda: run_batch(inputs, tmp, args.concurrency))):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            results[name] = {"wall_seconds": round(elapsed, 3), "videos_per_minute": round(60 * args.videos / elapsed, 2)}
+            print(f"{name:>5}: {elapsed:.2f}s ({results[name]['videos_per_minute']} videos/min)")
+
+    results["speedup"] = round(results["loop"]["wall_seconds"] / results["batch"]["wall_seconds"], 2)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
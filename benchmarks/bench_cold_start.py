@@ -0,0 +1,112 @@
+"""
+Cold start of the API process: time to import api.main, checked against a budget.
+
+Each run is a fresh interpreter importing api.main (what uvicorn does on
+every restart and scale-out). Reported: median import seconds over --repeat
+runs, the slowest imports under api.main (from -X importtime), and the time
+api.worker.prewarm() then spends loading what was left out of the import.
+
+Fails (exit status 1) when the median exceeds --budget seconds or when a
+module that must stay lazy (moviepy.editor, numpy, openai,
+google.generativeai, requests) is imported by api.main.
+
+Run from the repo root:
+  python benchmarks/bench_cold_start.py
+  python benchmarks/bench_cold_start.py --budget 1.0 --repeat 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the render path and prewarm(), never by importing the API
+LAZY_MODULES = ("moviepy.editor", "moviepy.video.fx.all", "numpy", "openai", "google.generativeai", "requests")
+
+CHILD = """
+import sys, time, json
+started = time.perf_counter()
+import api.main
+imported = time.perf_counter() - started
+lazy = [m for m in %r if m in sys.modules]
+prewarm = None
+if %r:
+    from api import worker
+    started = time.perf_counter()
+    worker.prewarm()
+    prewarm = time.perf_counter() - started
+print("RESULT " + json.dumps({"import_seconds": imported, "eager_lazy_modules": lazy, "prewarm_seconds": prewarm}))
+"""
+
+
+def run_child(prewarm: bool, importtime: bool = False):
+    env = dict(os.environ, RESUME_TASKS_ON_STARTUP="false")
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD % (LAZY_MODULES, prewarm)]
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+    if proc.returncode != 0 or not lines:
+        print(proc.stdout[-2000:], proc.stderr[-2000:], sep="\n")
+        raise SystemExit("Import of api.main failed")
+    return json.loads(lines[-1][len("RESULT "):]), proc.stderr
+
+
+def top_imports(importtime_log: str, count: int):
+    """Slowest imports at most two levels below the importing script, by cumulative time."""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append((int(cumulative), name.strip()))
+    return [{"module": name, "seconds": round(us / 1e6, 3)} for us, name in sorted(rows, reverse=True)[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.5, help="Allowed median import seconds")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [run_child(prewarm=False)[0] for _ in range(args.repeat)]
+    _, log = run_child(prewarm=False, importtime=True)
+    warm, _ = run_child(prewarm=True)
+    median = statistics.median(r["import_seconds"] for r in runs)
+    eager = sorted({m for r in runs for m in r["eager_lazy_modules"]})
+
+    report = {
+        "import_seconds": round(median, 3),
+        "import_seconds_all": [round(r["import_seconds"], 3) for r in runs],
+        "budget_seconds": args.budget,
+        "eager_lazy_modules": eager,
+        "prewarm_seconds": round(warm["prewarm_seconds"], 3),
+        "top_imports": top_imports(log, args.top),
+    }
+    print(f"import api.main: {median:.3f}s median of {args.repeat} (budget {args.budget:.3f}s)")
+    print(f"prewarm after import: {report['prewarm_seconds']:.3f}s")
+    for row in report["top_imports"]:
+        print(f"  {row['seconds']:7.3f}s  {row['module']}")
+
+    status = 0
+    if median > args.budget:
+        print(f"OVER BUDGET: {median:.3f}s > {args.budget:.3f}s")
+        status = 1
+    if eager:
+        print(f"EAGER IMPORTS: {', '.join(eager)} should only load when a task needs them")
+        status = 1
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
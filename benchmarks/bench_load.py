@@ -0,0 +1,399 @@
+"""
+Load test of the whole API (api.main:app) against local stand-ins for every
+external service:
+
+  Supabase   - FakeSupabase tables behind a PostgREST-compatible HTTP server
+               (benchmarks/fakes.py), so the real supabase client is exercised
+  DeepSeek   - OpenAI-compatible /chat/completions returning a small edit plan
+  Gemini     - stubbed inside the API process (the SDK has no endpoint
+               override); returns fixed scenes after --llm-latency
+  video gen  - mock_video_gen.py, in-process
+
+The API runs in its own process (uvicorn, like production) with temporary
+upload/output dirs. --users closed-loop clients then send a weighted mix of
+requests for --duration seconds:
+
+  upload   POST /api/video/upload (a small synthetic clip)
+  edit     POST /api/video/edit (renders run in the API process, as in production)
+  task     GET  /api/video/task/{id}
+  tasks    GET  /api/video/tasks?user_id=
+  generate POST /api/video/generate
+  status   GET  /api/video/status/{generation id}
+
+Reported: throughput and latency percentiles per endpoint, errors, the API's
+event-loop lag (how late a 50 ms timer fires inside the server), and how
+many calls reached each mock.
+
+Run from the repo root:  python benchmarks/bench_load.py --users 16 --duration 30
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MIX = "task=35,status=25,tasks=15,edit=10,generate=10,upload=5"
+PLANS = [
+    [{"type": "subclip", "start": 0, "end": 1}],
+    [{"type": "audio", "action": "remove"}],
+    [{"type": "audio", "action": "extract"}],
+    [{"type": "speed", "factor": 2.0}],
+    [{"type": "auto_scene_cut", "action": "detect_and_cut", "method": "ai"}],
+]
+
+
+def free_port() -> int:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1) + 0.5))]
+
+
+# --- mocks ------------------------------------------------------------------
+
+class DeepSeekHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    calls = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        time.sleep(self.latency)
+        with DeepSeekHandler.lock:
+            DeepSeekHandler.calls += 1
+        content = json.dumps({"operations": random.choice(PLANS)})
+        body = json.dumps({
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": "deepseek-chat",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- API process ------------------------------------------------------------
+
+def run_server(args):
+    """Child process: the API with Gemini stubbed and an event-loop lag probe."""
+    import asyncio
+    from collections import deque
+    from api.config import get_settings
+    settings = get_settings()
+    settings.UPLOAD_DIR = os.path.join(args.work_dir, "uploads")
+    settings.OUTPUT_DIR = os.path.join(args.work_dir, "outputs")
+    for path in (settings.UPLOAD_DIR, settings.OUTPUT_DIR):
+        os.makedirs(path, exist_ok=True)
+
+    from api import worker
+    from api.main import app
+    import uvicorn
+
+    def fake_gemini(video_path, instruction="", deadline=None):
+        time.sleep(args.llm_latency)
+        return [(0.0, 0.8), (1.0, 2.0)]
+
+    worker.analyze_video_with_gemini = fake_gemini
+
+    lags = deque(maxlen=100000)
+
+    async def probe(interval=0.05):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(loop.time() - started - interval)
+
+    @app.on_event("startup")
+    async def start_probe():
+        asyncio.get_running_loop().create_task(probe())
+
+    @app.post("/__loadtest/lag")
+    def lag(reset: bool = False):
+        values = list(lags)
+        if reset:
+            lags.clear()
+        return {"samples": len(values),
+                "p50_ms": round(1000 * (percentile(values, 0.5) or 0), 1),
+                "p99_ms": round(1000 * (percentile(values, 0.99) or 0), 1),
+                "max_ms": round(1000 * max(values, default=0), 1)}
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start_api(args, work_dir, postgrest_url, deepseek_url, video_gen_url):
+    port = free_port()
+    env = dict(os.environ,
+               SUPABASE_URL=postgrest_url,
+               DEEPSEEK_API_KEY="mock", DEEPSEEK_BASE_URL=deepseek_url,
+               GOOGLE_API_KEY="mock",
+               VIDEO_GEN_API_KEY="mock", VIDEO_GEN_BASE_URL=video_gen_url,
+               VIDEO_GEN_AUTO_INGEST="false",
+               VIDEO_GEN_STATUS_STORE=os.path.join(work_dir, "gen_status.json"),
+               INGEST_STORE=os.path.join(work_dir, "ingest_jobs.json"),
+               TASK_TIMINGS_LOG=os.path.join(work_dir, "task_timings.jsonl"),
+               SCRATCH_DIR=os.path.join(work_dir, "scratch"),
+               RENDER_CHECKPOINT_DIR=os.path.join(work_dir, "checkpoints"),
+               RESUME_TASKS_ON_STARTUP="false",
+               DISK_MIN_FREE_MB="0")
+    log = open(os.path.join(work_dir, "api.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--work-dir", work_dir,
+         "--llm-latency", str(args.llm_latency)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"API exited during startup, see {log.name}")
+        try:
+            if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("API did not start within 60s")
+
+
+# --- load -------------------------------------------------------------------
+
+class Load:
+    """Shared state of the clients: ids to poll and the recorded samples."""
+
+    def __init__(self, base: str, users, clip_path: str):
+        self.base = base
+        self.users = users
+        self.clip_path = clip_path
+        self.lock = threading.Lock()
+        self.videos = {u: [] for u in users}
+        self.tasks = []
+        self.generations = []
+        self.samples = {}   # endpoint -> [(seconds, status)]
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((seconds, status))
+
+    def upload(self, client, user):
+        with open(self.clip_path, "rb") as f:
+            r = client.post(f"{self.base}/api/video/upload", data={"user_id": user},
+                            files={"file": ("clip.mp4", f, "video/mp4")})
+        if r.status_code == 200:
+            with self.lock:
+                self.videos[user].append(r.json()["video_id"])
+        return r
+
+    def edit(self, client, user):
+        with self.lock:
+            videos = list(self.videos[user])
+        if not videos:
+            return self.upload(client, user)
+        r = client.post(f"{self.base}/api/video/edit",
+                        json={"video_id": random.choice(videos), "user_id": user, "prompt": "load test edit"})
+        if r.status_code == 200:
+            with self.lock:
+                self.tasks.append(r.json()["task_id"])
+        return r
+
+    def task(self, client, user):
+        with self.lock:
+            task_id = random.choice(self.tasks) if self.tasks else None
+        if task_id is None:
+            return self.edit(client, user)
+        return client.get(f"{self.base}/api/video/task/{task_id}")
+
+    def list_tasks(self, client, user):
+        return client.get(f"{self.base}/api/video/tasks", params={"user_id": user})
+
+    def generate(self, client, user):
+        r = client.post(f"{self.base}/api/video/generate",
+                        json={"prompt": "a calm lake at dawn", "image_url": "http://127.0.0.1/still.png"})
+        if r.status_code == 200:
+            data = (r.json() or {}).get("data") or {}
+            if data.get("id"):
+                with self.lock:
+                    self.generations.append(data["id"])
+        return r
+
+    def status(self, client, user):
+        with self.lock:
+            generation = random.choice(self.generations) if self.generations else None
+        if generation is None:
+            return self.generate(client, user)
+        return client.get(f"{self.base}/api/video/status/{generation}")
+
+
+def run_load(load: Load, mix, users: int, duration: float, think: float):
+    actions = {"upload": load.upload, "edit": load.edit, "task": load.task, "tasks": load.list_tasks,
+               "generate": load.generate, "status": load.status}
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    stop_at = time.perf_counter() + duration
+
+    def client(i):
+        rng = random.Random(i)
+        user = load.users[i % len(load.users)]
+        with httpx.Client(timeout=120) as http:
+            while time.perf_counter() < stop_at:
+                endpoint = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = actions[endpoint](http, user).status_code
+                except httpx.HTTPError:
+                    status = 0
+                load.record(endpoint, time.perf_counter() - started, status)
+                if think:
+                    time.sleep(rng.expovariate(1 / think))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def summarize(samples, wall: float):
+    report = {}
+    for endpoint, values in sorted(samples.items()):
+        latencies = [s for s, _ in values]
+        errors = sum(1 for _, status in values if status == 0 or status >= 500)
+        report[endpoint] = {
+            "requests": len(values),
+            "errors": errors,
+            "rps": round(len(values) / wall, 2),
+            "p50_ms": round(1000 * percentile(latencies, 0.5), 1),
+            "p95_ms": round(1000 * percentile(latencies, 0.95), 1),
+            "p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+            "max_ms": round(1000 * max(latencies), 1),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16, help="Concurrent closed-loop clients")
+    parser.add_argument("--accounts", type=int, default=4, help="Distinct user ids the clients act as")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,... over upload, edit, task, tasks, generate, status")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between a client's requests")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Simulated PostgREST latency per query")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Simulated DeepSeek/Gemini latency")
+    parser.add_argument("--gen-latency", type=float, default=0.2, help="Simulated video generation API latency")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args)
+        return
+
+    mix = {}
+    for part in args.mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("upload", "edit", "task", "tasks", "generate", "status"):
+            parser.error(f"Unknown endpoint {name}")
+        mix[name] = float(weight or 1)
+
+    import mock_video_gen
+    from fakes import FakeSupabase, serve_postgrest
+    from bench_batch_edit import make_clip
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        users = [f"load-user-{i}" for i in range(args.accounts)]
+        fake = FakeSupabase(latency=args.db_latency)
+        for i, user in enumerate(users):
+            fake.tables.setdefault("users", []).append({"id": user, "plan": ("free", "premium", "enterprise")[i % 3]})
+        postgrest = serve_postgrest(fake)
+
+        DeepSeekHandler.latency = args.llm_latency
+        deepseek = serve(DeepSeekHandler)
+        mock_video_gen.CONFIG.update(job_seconds=10.0, latency=args.gen_latency)
+        video_gen = serve(mock_video_gen.Handler)
+
+        clip_path = os.path.join(work_dir, "clip.mp4")
+        make_clip(clip_path, 2.0, (320, 240))
+
+        proc, base = start_api(args, work_dir, f"http://127.0.0.1:{postgrest.server_port}",
+                               f"http://127.0.0.1:{deepseek.server_port}", f"http://127.0.0.1:{video_gen.server_port}")
+        try:
+            load = Load(base, users, clip_path)
+            # Every account starts with one video, one edit and one generation to poll
+            with httpx.Client(timeout=120) as http:
+                for user in users:
+                    load.upload(http, user)
+                    load.edit(http, user)
+                    load.generate(http, user)
+                http.post(f"{base}/__loadtest/lag", params={"reset": True})
+            load.samples.clear()
+
+            started = time.perf_counter()
+            run_load(load, mix, args.users, args.duration, args.think)
+            wall = time.perf_counter() - started
+            lag = httpx.post(f"{base}/__loadtest/lag", timeout=30).json()
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+        endpoints = summarize(load.samples, wall)
+        tasks = fake.tables.get("tasks", [])
+        results = {
+            "users": args.users,
+            "duration": round(wall, 1),
+            "mix": mix,
+            "total_rps": round(sum(e["requests"] for e in endpoints.values()) / wall, 2),
+            "endpoints": endpoints,
+            "event_loop_lag": lag,
+            "edit_tasks": {status: sum(1 for t in tasks if t.get("status") == status)
+                           for status in sorted({t.get("status") for t in tasks})},
+            "mocks": {"postgrest_queries": fake.queries, "deepseek_calls": DeepSeekHandler.calls,
+                      "video_gen": dict(mock_video_gen.STATS)},
+        }
+
+    for endpoint, r in endpoints.items():
+        print(f"{endpoint:>8}: {r['requests']:5d} req {r['rps']:7.2f}/s  p50 {r['p50_ms']:8.1f}  p95 {r['p95_ms']:8.1f}  "
+              f"p99 {r['p99_ms']:8.1f} ms  errors {r['errors']}")
+    print(f"event loop lag: p50 {lag['p50_ms']} ms  p99 {lag['p99_ms']} ms  max {lag['max_ms']} ms")
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Media serving under concurrent seeks: StaticFiles vs. the media route.
+
+  static - the former setup: StaticFiles mount behind an @app.middleware("http")
+           CORS function. Range is ignored, so a seek streams the file from
+           byte 0 until the wanted window has arrived.
+  media  - api.media.serve_file behind CORSHeadersMiddleware: 206 partial
+           content read in the thread pool, small files from the in-memory LRU.
+
+Each of --clients threads performs --seeks random seeks reading --window
+bytes from a --size-mb file, then fetches a thumbnail --thumb-requests times.
+
+Run from the repo root:  python benchmarks/bench_media.py --clients 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import http.client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.staticfiles import StaticFiles
+from api.media import SmallFileCache, resolve, serve_file
+from api.middleware import CORSHeadersMiddleware
+
+
+def static_app(directory: str):
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def add_cors_header(request: Request, call_next):
+        response = await call_next(request)
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Allow-Methods"] = "*"
+        response.headers["Access-Control-Allow-Headers"] = "*"
+        response.headers["Cross-Origin-Resource-Policy"] = "cross-origin"
+        return response
+
+    app.mount("/media", StaticFiles(directory=directory), name="media")
+    return app
+
+
+def media_app(directory: str):
+    app = FastAPI()
+    app.add_middleware(CORSHeadersMiddleware)
+    cache = SmallFileCache(32 * 1024 * 1024, 512 * 1024)
+
+    @app.get("/media/{file_path:path}")
+    async def serve(file_path: str, request: Request):
+        resolved = resolve(directory, file_path)
+        if resolved is None:
+            raise HTTPException(status_code=404)
+        return serve_file(resolved[0], resolved[1], request.headers, request.method, cache)
+
+    return app
+
+
+def start_server(app):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, port
+
+
+def seek(port: int, size: int, window: int, rng: random.Random):
+    """Reads `window` bytes at a random offset; returns (seconds, bytes transferred)."""
+    offset = rng.randrange(0, size - window)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    started = time.perf_counter()
+    conn.request("GET", "/media/video.mp4", headers={"Range": f"bytes={offset}-{offset + window - 1}"})
+    response = conn.getresponse()
+    if response.status == 206:
+        transferred = len(response.read())
+    else:
+        # No Range support: the player has to read through to the offset
+        transferred = 0
+        while transferred < offset + window:
+            chunk = response.read(min(1024 * 1024, offset + window - transferred))
+            if not chunk:
+                break
+            transferred += len(chunk)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed, transferred
+
+
+def run(port: int, args, size: int):
+    latencies, transferred = [], [0]
+    lock = threading.Lock()
+
+    def client(i):
+        rng = random.Random(i)
+        for _ in range(args.seeks):
+            elapsed, count = seek(port, size, args.window, rng)
+            with lock:
+                latencies.append(elapsed)
+                transferred[0] += count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seek_seconds = time.perf_counter() - started
+
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    started = time.perf_counter()
+    for _ in range(args.thumb_requests):
+        conn.request("GET", "/media/thumb.jpg")
+        conn.getresponse().read()
+    thumb_seconds = time.perf_counter() - started
+    conn.close()
+
+    latencies.sort()
+    return {
+        "seeks_per_second": round(len(latencies) / seek_seconds, 1),
+        "seek_p50_ms": round(1000 * latencies[len(latencies) // 2], 1),
+        "seek_p95_ms": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1),
+        "mb_transferred": round(transferred[0] / 1e6, 1),
+        "thumb_requests_per_second": round(args.thumb_requests / thumb_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seeks", type=int, default=10, help="Seeks per client")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--window", type=int, default=1024 * 1024, help="Bytes read per seek")
+    parser.add_argument("--thumb-requests", type=int, default=500)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        size = args.size_mb * 1024 * 1024
+        with open(os.path.join(tmp, "video.mp4"), "wb") as f:
+            f.write(os.urandom(size))
+        with open(os.path.join(tmp, "thumb.jpg"), "wb") as f:
+            f.write(os.urandom(30 * 1024))
+
+        results = {"clients": args.clients, "seeks_per_client": args.seeks, "size_mb": args.size_mb}
+        for name, factory in (("static", static_app), ("media", media_app)):
+            server, port = start_server(factory(tmp))
+            try:
+                results[name] = run(port, args, size)
+            finally:
+                server.should_exit = True
+            print(f"{name:>6}: {results[name]}")
+
+    results["seek_throughput_gain"] = round(results["media"]["seeks_per_second"] / results["static"]["seeks_per_second"], 1)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
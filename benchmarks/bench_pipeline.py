@@ -0,0 +1,259 @@
+"""
+Offline benchmark of the whole edit pipeline (api.worker.process_video_task).
+
+Synthetic sources (ffmpeg test pattern with a tone) are generated per
+resolution and duration, rows go to the local SQLite repository
+(DB_BACKEND=sqlite) instead of Supabase, and DeepSeek/Gemini by stubs returning a fixed plan / fixed scenes after
+--llm-latency seconds, so nothing leaves the machine and runs are repeatable.
+
+Every case (operation x resolution x duration) runs in a fresh interpreter so
+peak RSS and warm caches don't leak between cases. Reported per case: wall
+seconds (median of --repeat runs), frames rendered per second, realtime
+factor, peak RSS of the worker process (ffmpeg children excluded: their
+ru_maxrss is inflated by the fork) and the per-stage split from quality_metrics.
+
+Results are compared with --baseline (if it exists): a case regresses when its
+wall time or peak RSS exceeds the baseline by more than --tolerance /
+--rss-tolerance. The
+exit status is 1 on any regression. --update-baseline rewrites the baseline.
+
+Run from the repo root:
+  python benchmarks/bench_pipeline.py
+  python benchmarks/bench_pipeline.py --ops speed,scene_cut --resolutions 1080p --durations 30
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "pipeline.json")
+
+RESOLUTIONS = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080)}
+FPS = 24
+
+
+def operations_for(name: str, duration: float):
+    """Edit plan the DeepSeek stub returns for operation type `name`."""
+    return {
+        "passthrough": [],
+        "subclip": [{"type": "subclip", "start": duration * 0.25, "end": duration * 0.75}],
+        "speed": [{"type": "speed", "factor": 1.5}],
+        "volume": [{"type": "audio", "action": "keep", "volume": 0.5}],
+        "mute": [{"type": "audio", "action": "remove"}],
+        "extract_audio": [{"type": "audio", "action": "extract"}],
+        "bg_music": [{"type": "bg_music", "action": "add", "volume": 0.3}],
+        "scene_cut": [{"type": "auto_scene_cut", "method": "ai"}],
+        "scene_cut_many": [{"type": "auto_scene_cut", "method": "ai"}],
+    }[name]
+
+
+OPERATIONS = ["passthrough", "subclip", "speed", "volume", "mute", "extract_audio", "bg_music", "scene_cut",
+              "scene_cut_many"]
+
+
+def make_source(path: str, size, duration: float):
+    """Moving test pattern plus a tone; unlike a flat ColorClip it gives the encoder real work."""
+    from moviepy.config import get_setting
+    w, h = size
+    subprocess.run([
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={w}x{h}:rate={FPS}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=330:sample_rate=44100:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-ac", "2", "-shortest", path
+    ], check=True)
+
+
+def run_case(args):
+    """Child process: one render of one case; prints a RESULT line with its measurements."""
+    os.environ["TASK_TIMINGS_LOG"] = os.path.join(args.work_dir, "task_timings.jsonl")
+    from api.config import get_settings
+    settings = get_settings()
+    settings.UPLOAD_DIR = os.path.join(args.work_dir, "uploads")
+    settings.OUTPUT_DIR = os.path.join(args.work_dir, "outputs")
+    settings.SCRATCH_DIR = os.path.join(args.work_dir, "scratch")
+    settings.RENDER_CHECKPOINT_DIR = os.path.join(args.work_dir, "checkpoints")
+    settings.TASK_TIMINGS_LOG = os.environ["TASK_TIMINGS_LOG"]
+    settings.GOOGLE_API_KEY = "offline"
+    settings.DB_BACKEND = "sqlite"
+    settings.SQLITE_PATH = os.path.join(args.work_dir, "bench.db")
+    for path in (settings.UPLOAD_DIR, settings.OUTPUT_DIR):
+        os.makedirs(path, exist_ok=True)
+
+    from api import worker
+    from api.repository import get_repository
+    from bench_batch_edit import make_bgm
+
+    op_name, resolution, duration = args.run_case.split(":")
+    duration = float(duration)
+    operations = operations_for(op_name, duration)
+
+    def fake_analyze(prompt, video_duration):
+        time.sleep(args.llm_latency)
+        return {"operations": operations}
+
+    def fake_gemini(video_path, instruction="", deadline=None):
+        time.sleep(args.llm_latency)
+        if op_name == "scene_cut_many":
+            # A 1.5s scene out of every 2s: dozens of cuts on longer sources
+            return [(start, start + 1.5) for start in range(0, int(duration) - 1, 2)]
+        third = duration / 3
+        return [(0.0, third * 0.8), (third, third * 1.8), (third * 2, duration)]
+
+    worker.analyze_instruction = fake_analyze
+    worker.analyze_video_with_gemini = fake_gemini
+    worker.BGM_PATH = os.path.join(args.media_dir, "bgm.mp3")
+    if not os.path.exists(worker.BGM_PATH):
+        make_bgm(worker.BGM_PATH)
+
+    repo = get_repository()
+    source = os.path.join(args.media_dir, f"source_{resolution}_{duration:g}.mp4")
+    repo.insert("videos", {"id": "video", "user_id": "bench", "original_path": source, "duration": duration})
+
+    walls, row = [], None
+    for _ in range(args.repeat):
+        task_id = str(uuid.uuid4())
+        repo.insert("tasks", {"id": task_id, "user_id": "bench", "video_id": "video", "prompt": op_name,
+                              "parameters": {"preview": args.preview}, "status": "pending"})
+        started = time.perf_counter()
+        worker.process_video_task(task_id)
+        walls.append(time.perf_counter() - started)
+        task = repo.get("tasks", task_id)
+        if task["status"] != "completed":
+            raise SystemExit(f"{args.run_case}: task {task['status']}: {task.get('error_message')}")
+        row = repo.find("results", {"task_id": task_id, "quality": "final"})[0]
+
+    wall = statistics.median(walls)
+    metrics = row["quality_metrics"]
+    frames = row["duration"] * FPS if row["format"] == "mp4" else None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    print("RESULT " + json.dumps({
+        "wall_seconds": round(wall, 3),
+        "wall_seconds_all": [round(w, 3) for w in walls],
+        "fps": round(frames / wall, 1) if frames else None,
+        "realtime_factor": round(row["duration"] / wall, 2) if row["duration"] else None,
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(own.ru_maxrss / 1024, 1),
+        "output_bytes": row["file_size"],
+        "stages": metrics.get("stages"),
+        "encoder": (metrics.get("encoder") or {}).get("profile"),
+    }))
+
+
+def compare(results: dict, baseline: dict, tolerance: float, rss_tolerance: float):
+    """[(case, metric, baseline value, current value)] for every regression beyond tolerance."""
+    regressions = []
+    for case, current in results.items():
+        previous = baseline.get("cases", {}).get(case)
+        if not previous:
+            continue
+        for metric, allowed in (("wall_seconds", tolerance), ("peak_rss_mb", rss_tolerance)):
+            if previous.get(metric) and current[metric] > previous[metric] * (1 + allowed):
+                regressions.append((case, metric, previous[metric], current[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help=f"Comma-separated, from {','.join(OPERATIONS)}")
+    parser.add_argument("--resolutions", default="360p,720p", help=f"Comma-separated, from {','.join(RESOLUTIONS)}")
+    parser.add_argument("--durations", default="10", help="Comma-separated source durations in seconds")
+    parser.add_argument("--repeat", type=int, default=1, help="Renders per case; the median wall time is reported")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated DeepSeek/Gemini latency")
+    parser.add_argument("--preview", action="store_true", help="Also render the low-res preview")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed wall time increase over the baseline")
+    parser.add_argument("--rss-tolerance", type=float, default=0.15, help="Allowed peak RSS increase over the baseline")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--media-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args)
+        return
+
+    ops = [o for o in args.ops.split(",") if o]
+    resolutions = [r for r in args.resolutions.split(",") if r]
+    durations = [float(d) for d in args.durations.split(",") if d]
+    for name in ops:
+        if name not in OPERATIONS:
+            parser.error(f"Unknown operation {name}")
+    for name in resolutions:
+        if name not in RESOLUTIONS:
+            parser.error(f"Unknown resolution {name}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as media_dir:
+        for resolution in resolutions:
+            for duration in durations:
+                make_source(os.path.join(media_dir, f"source_{resolution}_{duration:g}.mp4"), RESOLUTIONS[resolution], duration)
+
+        for resolution in resolutions:
+            for duration in durations:
+                for op in ops:
+                    case = f"{op}:{resolution}:{duration:g}"
+                    with tempfile.TemporaryDirectory() as work_dir:
+                        proc = subprocess.run(
+                            [sys.executable, os.path.abspath(__file__), "--run-case", case, "--media-dir", media_dir,
+                             "--work-dir", work_dir, "--repeat", str(args.repeat), "--llm-latency", str(args.llm_latency)]
+                            + (["--preview"] if args.preview else []),
+                            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+                        )
+                    lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+                    if proc.returncode != 0 or not lines:
+                        print(proc.stdout[-2000:], proc.stderr[-2000:], sep="\n")
+                        raise SystemExit(f"Case {case} failed")
+                    results[case] = json.loads(lines[-1][len("RESULT "):])
+                    r = results[case]
+                    print(f"{case:>28}: {r['wall_seconds']:7.2f}s  fps {r['fps'] or '-':>6}  "
+                          f"rss {r['peak_rss_mb']:6.1f} MB")
+
+    report = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "repeat": args.repeat,
+        "llm_latency": args.llm_latency,
+        "preview": args.preview,
+        "cases": results,
+    }
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine", {}).get("cpus") != report["machine"]["cpus"]:
+            print(f"Note: baseline was recorded on {baseline.get('machine')}, timings may not be comparable")
+        regressions = compare(results, baseline, args.tolerance, args.rss_tolerance)
+        report["regressions"] = [{"case": c, "metric": m, "baseline": b, "current": v} for c, m, b, v in regressions]
+        for case, metric, before, after in regressions:
+            print(f"REGRESSION {case} {metric}: {before} -> {after}")
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions against {args.baseline}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Rendition ladder in one pass vs. one render per rendition.
+
+  separate - N moviepy renders of the same edit, each decoding the source and
+             running the edit again, scaled by ffmpeg to its target height
+  ladder   - api.renditions.render_ladder: one decode/edit pass, one ffmpeg
+             process splitting into N encoders
+
+Reports wall time and CPU seconds (this process + ffmpeg children).
+
+Run from the repo root:  python benchmarks/bench_renditions.py --duration 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moviepy.editor import VideoFileClip
+import moviepy.video.fx.all as vfx
+from api.renditions import render_ladder, parse_ladder
+from bench_batch_edit import make_clip
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def edited(path):
+    clip = VideoFileClip(path)
+    return clip, clip.subclip(0.5, clip.duration - 0.5).fx(vfx.speedx, 1.25)
+
+
+def run_separate(source, out_dir, ladder):
+    for name, height, crf in ladder:
+        clip, final_clip = edited(source)
+        final_clip.write_videofile(
+            os.path.join(out_dir, f"separate_{name}.mp4"), codec="libx264", audio_codec="aac",
+            preset="medium", ffmpeg_params=["-vf", f"scale=-2:{height}", "-crf", str(crf)],
+            verbose=False, logger=None
+        )
+        clip.close()
+
+
+def run_ladder(source, out_dir, spec):
+    clip, final_clip = edited(source)
+    render_ladder(final_clip, out_dir, "ladder", spec)
+    clip.close()
+
+
+def measure(fn):
+    wall, cpu = time.perf_counter(), cpu_seconds()
+    fn()
+    return {"wall_seconds": round(time.perf_counter() - wall, 3), "cpu_seconds": round(cpu_seconds() - cpu, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--renditions", default="1080p,720p,mobile")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    spec = args.renditions.split(",")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        make_clip(source, args.duration, size=(args.width, args.height), fps=30)
+        ladder = parse_ladder(spec, args.height)
+
+        results = {"duration": args.duration, "source": f"{args.width}x{args.height}",
+                   "renditions": [name for name, _, _ in ladder]}
+        results["separate"] = measure(lambda: run_separate(source, tmp, ladder))
+        results["ladder"] = measure(lambda: run_ladder(source, tmp, spec))
+
+    results["cpu_saving"] = round(1 - results["ladder"]["cpu_seconds"] / results["separate"]["cpu_seconds"], 3)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
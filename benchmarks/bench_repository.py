@@ -0,0 +1,134 @@
+"""
+Write throughput of the repository layer (api/repository.py) against
+row-at-a-time PostgREST calls, the way the API used to write.
+
+Every backend inserts, updates and deletes --rows task rows:
+  postgrest_per_row - one supabase-py request per row (the old call pattern)
+  postgrest_bulk    - SupabaseRepository: one request per chunk of rows
+  sqlite_per_row    - SQLiteRepository, one call per row
+  sqlite_bulk       - SQLiteRepository, one transaction per call
+PostgREST is FakeSupabase behind a local HTTP server (benchmarks/fakes.py)
+answering after --db-latency seconds, standing in for the network round
+trip to the hosted project. Reported: seconds and rows/s per operation.
+
+Run from the repo root:
+  python benchmarks/bench_repository.py
+  python benchmarks/bench_repository.py --rows 1000 --db-latency 0.02
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BACKENDS = ["postgrest_per_row", "postgrest_bulk", "sqlite_per_row", "sqlite_bulk"]
+
+
+def make_rows(count: int):
+    return [{"id": str(uuid.uuid4()), "user_id": f"user-{i % 10}", "video_id": "video", "prompt": "bench",
+             "parameters": {}, "status": "pending", "progress": 0.0} for i in range(count)]
+
+
+def run_per_row_client(client, rows):
+    ids = [row["id"] for row in rows]
+    timings = {}
+    started = time.perf_counter()
+    for row in rows:
+        client.table("tasks").insert(row).execute()
+    timings["insert"] = time.perf_counter() - started
+    started = time.perf_counter()
+    for task_id in ids:
+        client.table("tasks").update({"status": "completed", "progress": 100}).eq("id", task_id).execute()
+    timings["update"] = time.perf_counter() - started
+    started = time.perf_counter()
+    for task_id in ids:
+        client.table("tasks").delete().eq("id", task_id).execute()
+    timings["delete"] = time.perf_counter() - started
+    return timings
+
+
+def run_per_row(repo, rows):
+    timings = {}
+    started = time.perf_counter()
+    for row in rows:
+        repo.insert("tasks", row)
+    timings["insert"] = time.perf_counter() - started
+    started = time.perf_counter()
+    for row in rows:
+        repo.update("tasks", {"status": "completed", "progress": 100}, {"id": row["id"]})
+    timings["update"] = time.perf_counter() - started
+    started = time.perf_counter()
+    for row in rows:
+        repo.delete("tasks", {"id": row["id"]})
+    timings["delete"] = time.perf_counter() - started
+    return timings
+
+
+def run_bulk(repo, rows):
+    ids = [row["id"] for row in rows]
+    timings = {}
+    started = time.perf_counter()
+    repo.insert("tasks", rows)
+    timings["insert"] = time.perf_counter() - started
+    started = time.perf_counter()
+    repo.update_many("tasks", {task_id: {"status": "completed", "progress": 100} for task_id in ids})
+    timings["update"] = time.perf_counter() - started
+    started = time.perf_counter()
+    repo.delete_many("tasks", ids)
+    timings["delete"] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Seconds the PostgREST mock waits per request")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Comma-separated, from {','.join(BACKENDS)}")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    backends = [b for b in args.backends.split(",") if b]
+    for name in backends:
+        if name not in BACKENDS:
+            parser.error(f"Unknown backend {name}")
+
+    from supabase import create_client
+    from api.config import get_settings
+    from api.repository import SupabaseRepository, SQLiteRepository
+    from fakes import FakeSupabase, serve_postgrest
+
+    fake = FakeSupabase(latency=args.db_latency)
+    server = serve_postgrest(fake)
+    client = create_client(f"http://127.0.0.1:{server.server_port}", get_settings().SUPABASE_SERVICE_ROLE_KEY)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in backends:
+            rows = make_rows(args.rows)
+            if name == "postgrest_per_row":
+                timings = run_per_row_client(client, rows)
+            elif name == "postgrest_bulk":
+                timings = run_bulk(SupabaseRepository(client), rows)
+            else:
+                repo = SQLiteRepository(os.path.join(work_dir, f"{name}.db"))
+                timings = (run_bulk if name.endswith("bulk") else run_per_row)(repo, rows)
+            if fake.tables.get("tasks"):
+                raise SystemExit(f"{name}: rows left behind after delete")
+            results[name] = {op: {"seconds": round(seconds, 4), "rows_per_second": round(args.rows / seconds, 1)}
+                             for op, seconds in timings.items()}
+            print(f"{name:>18}: " + "  ".join(f"{op} {r['rows_per_second']:>9.1f} rows/s" for op, r in results[name].items()))
+    server.shutdown()
+
+    report = {"rows": args.rows, "db_latency": args.db_latency, "backends": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
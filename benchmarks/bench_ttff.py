@@ -0,0 +1,119 @@
+"""
+Time to first frame: progressive MP4 vs. HLS package.
+
+Encodes a long synthetic result the way the worker writes it (moov atom at
+the end of the file), packages it with api.packaging.package_hls and serves
+both from a local HTTP server throttled to --mbps.
+
+  progressive - the player needs the moov atom before it can decode
+                anything; without Range support (the /outputs StaticFiles
+                mount) that means downloading the whole file
+  hls         - master playlist + media playlist + init segment + first segment
+
+Run from the repo root:  python benchmarks/bench_ttff.py --duration 120 --mbps 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moviepy.config import get_setting
+from api.packaging import package_hls
+
+
+def make_result(path: str, duration: float, height: int):
+    width = height * 16 // 9 // 2 * 2
+    subprocess.run([
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=s={width}x{height}:r=30:d={duration}",
+        "-f", "lavfi", "-i", f"sine=f=440:d={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-g", "60", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", path,
+    ], check=True)
+    return width
+
+
+def throttled_handler(bytes_per_second: float):
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def copyfile(self, source, outputfile):
+            chunk = 64 * 1024
+            while True:
+                data = source.read(chunk)
+                if not data:
+                    break
+                outputfile.write(data)
+                time.sleep(len(data) / bytes_per_second)
+    return Handler
+
+
+def fetch(url: str) -> bytes:
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def ttff_progressive(base: str):
+    started = time.perf_counter()
+    size = len(fetch(f"{base}/result.mp4"))
+    return {"seconds": round(time.perf_counter() - started, 3), "bytes": size}
+
+
+def ttff_hls(base: str):
+    started = time.perf_counter()
+    master = fetch(f"{base}/hls/master.m3u8").decode()
+    variant = next(line for line in master.splitlines() if line and not line.startswith("#"))
+    playlist = fetch(f"{base}/hls/{variant}").decode()
+    init = next(line.split('URI="')[1].split('"')[0] for line in playlist.splitlines() if line.startswith("#EXT-X-MAP"))
+    first = next(line for line in playlist.splitlines() if line and not line.startswith("#"))
+    size = len(fetch(f"{base}/hls/{init}")) + len(fetch(f"{base}/hls/{first}"))
+    return {"seconds": round(time.perf_counter() - started, 3), "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=120.0)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--mbps", type=float, default=20.0, help="Simulated client bandwidth")
+    parser.add_argument("--segment-seconds", type=float, default=4.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = os.path.join(tmp, "result.mp4")
+        width = make_result(result, args.duration, args.height)
+        started = time.perf_counter()
+        package_hls([{"name": "source", "path": result, "width": width, "height": args.height}],
+                    os.path.join(tmp, "hls"), args.duration, args.segment_seconds)
+        packaging_seconds = time.perf_counter() - started
+
+        handler = partial(throttled_handler(args.mbps * 1e6 / 8), directory=tmp)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            results = {"duration": args.duration, "height": args.height, "mbps": args.mbps,
+                       "packaging_seconds": round(packaging_seconds, 3),
+                       "progressive": ttff_progressive(base), "hls": ttff_hls(base)}
+        finally:
+            server.shutdown()
+
+    results["speedup"] = round(results["progressive"]["seconds"] / max(results["hls"]["seconds"], 1e-3), 1)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+In-memory stand-ins for the external services, so benchmarks run offline.
+
+  FakeSupabase - the subset of the supabase-py query builder the API uses
+                 (select/insert/update/delete, eq/neq/in_/order/limit,
+                 single, execute) over plain dict tables.
+  serve_postgrest(fake) - the same tables behind a local PostgREST-compatible
+                 HTTP server, for runs that go through the real supabase client.
+"""
+import copy
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+    # `data, count = query.execute()` is used by the routers
+    def __iter__(self):
+        return iter((("data", self.data), ("count", self.count)))
+
+
+class _Query:
+    def __init__(self, db, table: str):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.filters = []
+        self.single_row = False
+        self.order_by = None
+        self.limit_to = None
+
+    def select(self, *columns, **kwargs):
+        self.action = "select"
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.action, self.payload = "upsert", payload
+        return self
+
+    def update(self, payload, **kwargs):
+        self.action, self.payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self.action = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count, **kwargs):
+        self.limit_to = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def execute(self):
+        return self.db.execute(self)
+
+
+class FakeSupabase:
+    """
+    Rows live in `tables[name]` as plain dicts.
+    Selecting from tasks embeds the referenced `videos` row, as the real
+    `select("*, videos(*)")` does. `latency` seconds are slept per query.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.tables = {}
+        self.latency = latency
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    from_ = table
+
+    def execute(self, query: _Query) -> _Response:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.queries += 1
+            rows = self.tables.setdefault(query.table, [])
+            matched = [row for row in rows if all(f(row) for f in query.filters)]
+
+            if query.action in ("insert", "upsert"):
+                payload = query.payload if isinstance(query.payload, list) else [query.payload]
+                for item in payload:
+                    existing = next((row for row in rows if "id" in item and row.get("id") == item["id"]), None)
+                    if existing is not None and query.action == "upsert":
+                        existing.update(copy.deepcopy(item))
+                    else:
+                        rows.append(copy.deepcopy(item))
+                return _Response(copy.deepcopy(payload))
+            if query.action == "update":
+                for row in matched:
+                    row.update(copy.deepcopy(query.payload))
+                return _Response(copy.deepcopy(matched))
+            if query.action == "delete":
+                self.tables[query.table] = [row for row in rows if row not in matched]
+                return _Response(copy.deepcopy(matched))
+
+            result = [self._embed(query.table, row) for row in matched]
+            if query.order_by:
+                column, desc = query.order_by
+                result.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if query.limit_to is not None:
+                result = result[:query.limit_to]
+            if query.single_row:
+                return _Response(result[0] if result else None)
+            return _Response(result, len(result))
+
+    def _embed(self, table: str, row: dict) -> dict:
+        row = copy.deepcopy(row)
+        if table == "tasks" and row.get("video_id"):
+            row["videos"] = next((copy.deepcopy(v) for v in self.tables.get("videos", []) if v.get("id") == row["video_id"]), None)
+        return row
+
+
+# --- PostgREST over HTTP ----------------------------------------------------
+
+def _split_top_level(text: str):
+    """Splits "a,b(c,d),e" on commas outside parentheses."""
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        depth += (ch == "(") - (ch == ")")
+        current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _pg_text(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _matches(value, expression: str) -> bool:
+    op, _, operand = expression.partition(".")
+    text = _pg_text(value)
+    if op == "eq":
+        return text == operand
+    if op == "neq":
+        return text != operand
+    if op == "is":
+        return text == operand
+    if op == "in":
+        return text in [v.strip().strip('"') for v in operand.strip("()").split(",")]
+    if op in ("gt", "gte", "lt", "lte"):
+        try:
+            left, right = float(value), float(operand)
+        except (TypeError, ValueError):
+            left, right = text, operand
+        return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+    return True
+
+
+class PostgrestHandler(BaseHTTPRequestHandler):
+    """
+    /rest/v1/<table> over a FakeSupabase's tables: enough of PostgREST for
+    the API's queries (eq/neq/in/is/gt/lt filters, order, limit, single
+    objects, return=representation, one level of embedding such as
+    videos(*) or tasks!inner(user_id) resolved through <table>_id columns).
+    """
+    fake = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per request
+    disable_nagle_algorithm = True
+
+    def _send(self, code: int, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _parse(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.startswith("/rest/v1/"):
+            return None, None, None
+        table = parsed.path[len("/rest/v1/"):].strip("/")
+        params = parse_qsl(parsed.query, keep_blank_values=True)
+        return table, params, dict(params)
+
+    def _embeds(self, select: str):
+        embeds = []
+        for token in _split_top_level(select or "*"):
+            if "(" in token:
+                name = token.split("(", 1)[0]
+                inner = "!inner" in name
+                embeds.append((name.replace("!inner", ""), inner))
+        return embeds
+
+    def _rows(self, table, params, options):
+        fake = self.fake
+        embeds = self._embeds(options.get("select"))
+        rows = []
+        for row in fake.tables.get(table, []):
+            row = copy.deepcopy(row)
+            keep = True
+            for name, inner in embeds:
+                key = f"{name[:-1]}_id"
+                linked = next((r for r in fake.tables.get(name, []) if r.get("id") == row.get(key)), None)
+                row[name] = copy.deepcopy(linked)
+                if inner and linked is None:
+                    keep = False
+            for column, expression in params:
+                if column in ("select", "order", "limit", "offset", "on_conflict"):
+                    continue
+                if "." in column:
+                    name, _, sub = column.partition(".")
+                    if not row.get(name) or not _matches(row[name].get(sub), expression):
+                        keep = False
+                elif not _matches(row.get(column), expression):
+                    keep = False
+            if keep:
+                rows.append(row)
+        return rows
+
+    def _reply(self, rows, status=200):
+        if "vnd.pgrst.object" in (self.headers.get("Accept") or ""):
+            if len(rows) != 1:
+                return self._send(406, {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                                        "details": f"Results contain {len(rows)} rows", "hint": None})
+            return self._send(status, rows[0])
+        return self._send(status, rows, {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{len(rows)}"})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        return json.loads(data) if data else None
+
+    def _run(self, method):
+        table, params, options = self._parse()
+        if table is None:
+            return self._send(404, {"message": "not found"})
+        fake = self.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        # Read the body even when unused (the client sends "{}" with GETs) to keep the connection in sync
+        body = self._body()
+        with fake._lock:
+            fake.queries += 1
+            stored = fake.tables.setdefault(table, [])
+            if method == "GET":
+                rows = self._rows(table, params, options)
+                if "order" in options:
+                    column, _, direction = options["order"].partition(".")
+                    rows.sort(key=lambda r: (r.get(column) is None, _pg_text(r.get(column))), reverse=direction.startswith("desc"))
+                if "limit" in options:
+                    rows = rows[int(options.get("offset", 0)):int(options.get("offset", 0)) + int(options["limit"])]
+                return self._reply(rows)
+            if method == "POST":
+                items = body if isinstance(body, list) else [body]
+                upsert = "merge-duplicates" in (self.headers.get("Prefer") or "")
+                for item in items:
+                    item.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                    existing = next((r for r in stored if "id" in item and r.get("id") == item["id"]), None)
+                    if existing is not None:
+                        if not upsert:
+                            return self._send(409, {"code": "23505", "message": "duplicate key value violates unique constraint"})
+                        existing.update(item)
+                    else:
+                        stored.append(copy.deepcopy(item))
+                return self._reply(items, 201)
+            matched_ids = {m.get("id") for m in self._rows(table, params, options)}
+            ids = {id(r) for r in stored if r.get("id") in matched_ids}
+            matched = [r for r in stored if id(r) in ids]
+            if method == "PATCH":
+                for row in matched:
+                    row.update(body or {})
+            else:
+                fake.tables[table] = [r for r in stored if id(r) not in ids]
+            return self._reply(copy.deepcopy(matched))
+
+    def do_GET(self):
+        self._run("GET")
+
+    def do_POST(self):
+        self._run("POST")
+
+    def do_PATCH(self):
+        self._run("PATCH")
+
+    def do_DELETE(self):
+        self._run("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_postgrest(fake: FakeSupabase, host: str = "127.0.0.1", port: int = 0):
+    """Serves `fake` as a PostgREST endpoint in a daemon thread; returns the server (server_port has the port)."""
+    handler = type("Handler", (PostgrestHandler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,133 @@
+"""
+Local stand-in for the 1189.xin video generation API.
+
+Run:   python mock_video_gen.py --port 9100
+Then:  VIDEO_GEN_BASE_URL=http://127.0.0.1:9100 VIDEO_GEN_API_KEY=mock uvicorn api.main:app
+
+Jobs go pending -> processing -> success after --job-seconds. The mock counts
+every /v1/video/query call (GET /stats) so status caching can be checked.
+With --video-file, finished jobs point at /files/<name>, served with Range
+support so ingest downloads can be exercised locally.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+JOBS = {}
+STATS = {"create": 0, "query": 0}
+LOCK = threading.Lock()
+CONFIG = {"job_seconds": 10.0, "latency": 0.0, "video_url": "", "video_file": ""}
+
+
+def job_status(job):
+    elapsed = time.time() - job["created_at"]
+    if elapsed >= CONFIG["job_seconds"]:
+        return {"id": job["id"], "status": "success", "progress": 100,
+                "video_url": CONFIG["video_url"] or f"http://127.0.0.1/{job['id']}.mp4"}
+    if elapsed >= CONFIG["job_seconds"] / 3:
+        return {"id": job["id"], "status": "processing",
+                "progress": int(100 * elapsed / CONFIG["job_seconds"])}
+    return {"id": job["id"], "status": "pending", "progress": 0}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _send(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/v1/video/create":
+            return self._send(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(CONFIG["latency"])
+        job = {"id": f"mock:{uuid.uuid4()}", "created_at": time.time(), "payload": payload}
+        with LOCK:
+            JOBS[job["id"]] = job
+            STATS["create"] += 1
+        self._send(200, {"id": job["id"], "status": "pending"})
+
+    def _send_file(self):
+        path = CONFIG["video_file"]
+        if not path or not os.path.exists(path):
+            return self._send(404, {"error": "not found"})
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = f.read(min(65536, remaining))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path.startswith("/files/"):
+            return self._send_file()
+        if parsed.path == "/stats":
+            with LOCK:
+                return self._send(200, dict(STATS, jobs=len(JOBS)))
+        if parsed.path != "/v1/video/query":
+            return self._send(404, {"error": "not found"})
+        task_id = parse_qs(parsed.query).get("id", [""])[0]
+        time.sleep(CONFIG["latency"])
+        with LOCK:
+            STATS["query"] += 1
+            job = JOBS.get(task_id)
+            if job is None:
+                # Unknown ids behave like jobs created at first sight
+                job = {"id": task_id, "created_at": time.time(), "payload": {}}
+                JOBS[task_id] = job
+        self._send(200, job_status(job))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock 1189.xin video generation API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--job-seconds", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Artificial delay per request (seconds)")
+    parser.add_argument("--video-url", default="", help="URL reported for finished jobs")
+    parser.add_argument("--video-file", default="", help="Local file served as the result of every job")
+    args = parser.parse_args()
+
+    video_url = args.video_url
+    if args.video_file and not video_url:
+        video_url = f"http://{args.host}:{args.port}/files/{os.path.basename(args.video_file)}"
+    CONFIG.update(job_seconds=args.job_seconds, latency=args.latency, video_url=video_url,
+                  video_file=args.video_file)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Mock video generation API on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+-- Batch edit jobs: one prompt applied to many videos
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS batch_id UUID;
+
+CREATE INDEX IF NOT EXISTS idx_tasks_batch_id ON tasks(batch_id);
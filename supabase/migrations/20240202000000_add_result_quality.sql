@@ -0,0 +1,9 @@
+-- Two-phase rendering: a task can have a low-res preview and a final result
+ALTER TABLE results ADD COLUMN IF NOT EXISTS quality VARCHAR(16) DEFAULT 'final' CHECK (quality IN ('preview', 'final'));
+
+CREATE INDEX IF NOT EXISTS idx_results_task_quality ON results(task_id, quality);
+
+-- Tasks whose final render waits for the user to confirm the preview
+ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_status_check;
+ALTER TABLE tasks ADD CONSTRAINT tasks_status_check
+    CHECK (status IN ('pending', 'processing', 'awaiting_confirmation', 'completed', 'failed'));
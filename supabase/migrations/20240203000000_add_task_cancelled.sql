@@ -0,0 +1,4 @@
+-- Cancellation is a task state of its own
+ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_status_check;
+ALTER TABLE tasks ADD CONSTRAINT tasks_status_check
+    CHECK (status IN ('pending', 'processing', 'awaiting_confirmation', 'completed', 'failed', 'cancelled'));
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import subprocess
+
+# Batch members share one plan: each must still detect the scenes of its own source.
+# Runs offline (SQLite repository, Gemini stubbed): python test_batch_scenes.py
+
+
+def make_source(path, duration):
+    from moviepy.config import get_setting
+    subprocess.run([
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=320x180:rate=24:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=330:sample_rate=44100:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", path
+    ], check=True)
+
+
+def test_batch_scenes():
+    work_dir = tempfile.mkdtemp()
+    from api.config import get_settings
+    settings = get_settings()
+    settings.UPLOAD_DIR = os.path.join(work_dir, "uploads")
+    settings.OUTPUT_DIR = os.path.join(work_dir, "outputs")
+    settings.SCRATCH_DIR = os.path.join(work_dir, "scratch")
+    settings.RENDER_CHECKPOINT_DIR = os.path.join(work_dir, "checkpoints")
+    settings.GOOGLE_API_KEY = "offline"
+    settings.DB_BACKEND = "sqlite"
+    settings.SQLITE_PATH = os.path.join(work_dir, "test.db")
+    for path in (settings.UPLOAD_DIR, settings.OUTPUT_DIR):
+        os.makedirs(path, exist_ok=True)
+
+    from api import worker
+    from api.repository import get_repository
+
+    # Different scenes per source, so a reused detection shows up in the output length
+    scenes = {}
+    detected = []
+
+    def fake_gemini(video_path, instruction="", deadline=None):
+        detected.append(video_path)
+        return scenes[video_path]
+
+    worker.analyze_video_with_gemini = fake_gemini
+
+    repo = get_repository()
+    for name, duration, kept in (("a", 4, [(0.0, 1.0)]), ("b", 6, [(0.0, 1.0), (3.0, 5.0)])):
+        source = os.path.join(work_dir, f"{name}.mp4")
+        make_source(source, duration)
+        scenes[source] = kept
+        repo.insert("videos", {"id": name, "user_id": "test", "original_path": source, "duration": duration})
+        repo.insert("tasks", {"id": f"task_{name}", "user_id": "test", "video_id": name, "batch_id": "batch",
+                              "prompt": "Smart Scene Cut", "parameters": {}, "status": "pending"})
+
+    # What run_batch hands to every member
+    operations = [{"type": "auto_scene_cut", "method": "ai"}]
+    for name in ("a", "b"):
+        worker.process_video_task(f"task_{name}", operations)
+
+    assert "scenes" not in operations[0], f"Shared plan was modified: {operations}"
+    assert sorted(detected) == sorted(scenes), f"Expected one detection per source, got {detected}"
+    for name, expected in (("a", 1.0), ("b", 3.0)):
+        task = repo.get("tasks", f"task_{name}")
+        assert task["status"] == "completed", f"task_{name}: {task['status']} {task.get('error_message')}"
+        row = repo.find("results", {"task_id": f"task_{name}", "quality": "final"})[0]
+        assert abs(row["duration"] - expected) < 0.2, f"task_{name}: {row['duration']}s, expected ~{expected}s"
+    print("Batch members detected their own scenes")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    test_batch_scenes()